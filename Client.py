@@ -1,6 +1,11 @@
 from Host import Host
 from SimComponents import Packet
-from Verbose import Verbose
+from Trace import Trace
+
+# The trace categories, and the Verbose level they are on at
+Trace.categories({
+    'PACKET_CREATED': 0,
+})
 
 class Client(Host):
     """ A Client in the emulation."""
@@ -30,8 +35,8 @@ class Client(Host):
         packet.type = "ClientRequest"
         packet.pkt_no = self.pkt_no
         
-        if Verbose.level >= 0:
-            print("{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) ClientRequest in {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time)))
+        if Trace.PACKET_CREATED:
+            Trace.emit("PACKET_CREATED", "{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) ClientRequest in {} after {:.3f}", self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time))
 
         self.pkt_no += 1
 
@@ -2,7 +2,234 @@ from SimComponents import EventGenerator, Event
 import numpy as np
 import random as random
 import itertools
-from Verbose import Verbose
+import math
+from Trace import Trace
+from Replay import ReplayTrace
+
+# The trace categories, and the Verbose level they are on at
+Trace.categories({
+    'GENERATOR': 1,
+})
+
+
+class RandomStream(object):
+    """Random values drawn from a np.random.RandomState in blocks.
+
+       The RandomState is asked for a block of raw 32 bit words in one
+       vectorised call, and each value is made from the next words in
+       the block, in the same way as the RandomState would make it.
+       So exponential() and choice() give the same values, in the same
+       order, as calling gen.exponential() and gen.choice() one at a
+       time, even when the calls are mixed together on one RandomState.
+
+       The RandomState should not be used directly once it is in a
+       RandomStream, as the stream draws ahead of what it has used.
+    """
+    def __init__(self, gen, block_size=4096):
+        self.gen = gen
+        self.block_size = block_size
+
+        # the words drawn so far, and the position of the next one
+        self.words = []
+        self.pos = 0
+
+    # get a new block of words
+    def refill(self):
+        self.words = self.gen.randint(0, 2**32, size=self.block_size, dtype=np.uint32).tolist()
+        self.pos = 0
+
+    # the next raw 32 bit word
+    def next_word(self):
+        if self.pos == len(self.words):
+            self.refill()
+
+        word = self.words[self.pos]
+        self.pos += 1
+        return word
+
+    # the next 'count' words as an array
+    def take(self, count):
+        """The next 'count' raw words as a NumPy uint32 array,
+        for values which are made in a vectorised way"""
+        taken = self.words[self.pos:self.pos + count]
+        self.pos += len(taken)
+
+        if len(taken) < count:
+            rest = self.gen.randint(0, 2**32, size=count - len(taken), dtype=np.uint32)
+            return np.concatenate((np.array(taken, dtype=np.uint32), rest))
+        else:
+            return np.array(taken, dtype=np.uint32)
+
+    # a double in [0, 1) from 2 words, as in RandomState.random_sample()
+    def random_sample(self):
+        a = self.next_word() >> 5
+        b = self.next_word() >> 6
+        return (a * 67108864.0 + b) / 9007199254740992.0
+
+    # as RandomState.exponential(scale)
+    def exponential(self, scale=1.0):
+        return scale * -math.log(1.0 - self.random_sample())
+
+    # a fn which picks from 'population', as RandomState.choice(population)
+    def chooser(self, population):
+        """Returns a no argument fn which picks an item from 'population'
+        with equal probability.  The population is converted to an array
+        once, and the picks are made by masked rejection on the words,
+        as RandomState.choice() does"""
+        items = np.array(population)
+        size = len(items)
+
+        if size == 0:
+            raise ValueError("population must be non-empty")
+
+        # the smallest mask of all 1s which covers size-1
+        mask = (1 << (size - 1).bit_length()) - 1
+
+        def choose():
+            if size == 1:
+                # no words are used for a single item
+                return items[0]
+
+            while True:
+                value = self.next_word() & mask
+                if value < size:
+                    return items[value]
+
+        return choose
+
+
+class RandomBlock(object):
+    """A buffer of values from one vectorised draw, which is drawn
+       again when it runs out.
+       'draw' is a fn which takes a size and returns an array, such as
+       lambda size: gen.exponential(5, size=size).
+       For a RandomState which is only used by one RandomBlock, the
+       values are the same as drawing them one at a time.
+    """
+    def __init__(self, draw, block_size=4096):
+        self.draw = draw
+        self.block_size = block_size
+        self.values = []
+        self.pos = 0
+
+    # the next value
+    def next(self):
+        if self.pos == len(self.values):
+            self.values = self.draw(self.block_size).tolist()
+            self.pos = 0
+
+        value = self.values[self.pos]
+        self.pos += 1
+        return value
+
+
+class AliasTable(object):
+    """A Walker alias table for picking from 'population' with 'weights'.
+
+       The table is built once, in O(n), using Vose's method.
+       Each pick then takes one column, picked with equal probability,
+       and a coin toss between the column and its alias, so it costs
+       the same for any size of population.
+       The picks are made in vectorised blocks by sampler().
+    """
+    def __init__(self, population, weights):
+        self.items = np.array(population)
+        size = len(self.items)
+
+        if size == 0:
+            raise ValueError("population must be non-empty")
+
+        weights = np.asarray(weights, dtype=float)
+
+        if len(weights) != size:
+            raise ValueError("AliasTable has " + str(size) + " items and " + str(len(weights)) + " weights")
+
+        if np.any(weights < 0) or weights.sum() <= 0:
+            raise ValueError("AliasTable weights must be >= 0, and not all 0")
+
+        # scale the weights so the average is 1
+        scaled = (weights * size / weights.sum()).tolist()
+
+        prob = [1.0] * size
+        alias = list(range(size))
+
+        small = [ pos for pos, value in enumerate(scaled) if value < 1.0 ]
+        large = [ pos for pos, value in enumerate(scaled) if value >= 1.0 ]
+
+        # fill each small column from a large one
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+
+            prob[less] = scaled[less]
+            alias[less] = more
+
+            scaled[more] = (scaled[more] + scaled[less]) - 1.0
+
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # anything left over is full, apart from rounding
+        for pos in small + large:
+            prob[pos] = 1.0
+
+        self.prob = np.array(prob)
+        self.alias = np.array(alias)
+
+    # The no of items
+    def __len__(self):
+        return len(self.items)
+
+    # pick 'count' positions, using words from a RandomStream
+    def sample(self, stream, count):
+        """An array of 'count' positions in the population.
+        Each pick uses 2 words from 'stream': one for the column,
+        and one for the coin"""
+        words = stream.take(2 * count).astype(np.uint64)
+
+        # column in [0, n) by multiply and shift, coin in [0, 1)
+        columns = ((words[0::2] * len(self.items)) >> 32).astype(np.intp)
+        coins = words[1::2] * (1.0 / 4294967296.0)
+
+        return np.where(coins < self.prob[columns], columns, self.alias[columns])
+
+    # a fn which picks from the population
+    def sampler(self, stream, block_size=4096):
+        """Returns a no argument fn which picks an item, using
+        blocks of 'block_size' picks made from 'stream'"""
+        items = self.items
+        picks = RandomBlock(lambda size: self.sample(stream, size), block_size)
+
+        def choose():
+            return items[picks.next()]
+
+        return choose
+
+    # Zipf weights
+    @classmethod
+    def zipf_weights(cls, size, exponent=1.0):
+        """The weights 1/k^exponent for k = 1 .. 'size',
+        so the first item is the most popular"""
+        return 1.0 / np.power(np.arange(1, size + 1, dtype=float), exponent)
+
+    # the weights for a popularity profile
+    @classmethod
+    def profile_weights(cls, population, profile):
+        """The weights for 'population' from a popularity 'profile', which is one of:
+        a list of weights, one for each item;
+        a dict of item -> weight, where missing items have weight 0;
+        ('zipf', exponent), for Zipf popularity in the order of 'population';
+        or a fn which takes the population and returns the weights"""
+        if isinstance(profile, dict):
+            return [ profile.get(item, 0) for item in population ]
+        elif isinstance(profile, tuple) and len(profile) == 2 and profile[0] == 'zipf':
+            return cls.zipf_weights(len(population), profile[1])
+        elif callable(profile):
+            return profile(population)
+        else:
+            return profile
 
 
 class ServerEventGenerator(EventGenerator):
@@ -110,6 +337,69 @@ class MultiClientEventGenerator(EventGenerator):
             self.elsefn(ev)
 
 
+# Generate Events for Multiple Clients, from a ReplayTrace
+class ReplayEventGenerator(MultiClientEventGenerator):
+    """ An Event Generator which replays the requests in a ReplayTrace.
+        The time of each record, from 'start', is multiplied by 'time_scale'.
+        If 'start' is None, the time of the first record is used.
+        The source of each record is mapped to a Network host by 'source_map', which is:
+        None, to use the source as it is;
+        a dict of source -> host, where a missing source is used as it is;
+        a list of hosts, where each new source is given the next host in turn; or
+        a fn which takes the source and returns the host.
+    """
+    def __init__(self, env, trace, time_scale=1.0, source_map=None, start=None, initial_delay=0, finish=float("inf"), flow_id=0):
+        super().__init__(env, trace.filename, None, None, None, initial_delay, finish, flow_id)
+        self.trace = trace
+        self.time_scale = time_scale
+        self.start = start
+        self.source_map = source_map
+
+        # source -> host, for a list source_map
+        self.assigned = dict()
+
+    # the host for a source in the trace
+    def map_source(self, source):
+        if self.source_map is None:
+            return source
+        elif isinstance(self.source_map, dict):
+            return self.source_map.get(source, source)
+        elif callable(self.source_map):
+            return self.source_map(source)
+        else:
+            host = self.assigned.get(source, None)
+
+            if host == None:
+                host = self.source_map[len(self.assigned) % len(self.source_map)]
+                self.assigned[source] = host
+
+            return host
+
+    def run(self):
+        """The generator function used in simulations.
+        Waits until the time of each record, and then sends it.
+        """
+        yield self.env.timeout(self.initial_delay)
+
+        start = self.start
+
+        for time, source, service, size in self.trace:
+            if start == None:
+                start = time
+
+            at = self.initial_delay + (time - start) * self.time_scale
+
+            if at >= self.finish:
+                break
+
+            # wait for the record time, unless the trace is out of order
+            if at > self.env.now:
+                yield self.env.timeout(at - self.env.now)
+
+            self.event_count += 1
+            self.process_event(ClientEvent(self.env.now, size, self.event_count, src=self.map_source(source), dst=service, flow_id=self.flow_id))
+
+
 class ClientEvent(Event):
     """A ClientEvent is an Event that also holds an integer
     """
@@ -129,6 +419,18 @@ class Generator(object):
         self.generator = generator
         self.network = network
 
+    # a fn which picks from 'population'
+    @classmethod
+    def selector(cls, gen, population, profile=None):
+        """Returns a no argument fn which picks an item from 'population'
+        using the RandomStream 'gen'.
+        If 'profile' is None, each item is picked with equal probability,
+        otherwise the popularity 'profile' is used with an AliasTable.
+        See AliasTable.profile_weights() for the profiles"""
+        if profile is None:
+            return gen.chooser(population)
+        else:
+            return AliasTable(population, AliasTable.profile_weights(population, profile)).sampler(gen)
 
     #  A event generator for a server
     @classmethod
@@ -149,7 +451,8 @@ class Generator(object):
         # - one that gives the destinations.
 
         # We first define our random number generator so that we can reproduce results
-        gen = np.random.RandomState(seed=seed)
+        # the values are drawn in blocks by a RandomStream
+        gen = RandomStream(np.random.RandomState(seed=seed))
 
         # The interarrival times of a poisson process follow an exponential
         def arrival_dist():
@@ -162,8 +465,7 @@ class Generator(object):
 
 
         # Send to all destinations
-        def destinations_dist():
-            return gen.choice(possible_destinations)
+        destinations_dist = gen.chooser(possible_destinations)
 
         # Create the event generator oobject
         event_generator = ServerEventGenerator(env, id=id,
@@ -185,10 +487,13 @@ class Generator(object):
                          exponential_lambda=1,
                          packet_size=100,
                          background_load=False,
-                         seed=None):
+                         seed=None,
+                         service_profile=None):
         """ Generates events from node with 'idstr', and sends to the immediate neighbour.
             'exponential_lambda' is passed to the arrival distribution.
             'packet_size' is used for the size distribution.
+            'service_profile' is the popularity of the service names, e.g. ('zipf', 1.0),
+            or None to pick them with equal probability.
         """
 
         env = network.env
@@ -199,8 +504,10 @@ class Generator(object):
         # - one that gives the destinations.
 
         # We first define our random number generator so that we can reproduce results
-        gen = np.random.RandomState(seed=seed)
+        # the values are drawn in blocks by a RandomStream
+        gen = RandomStream(np.random.RandomState(seed=seed))
 
+        # gen2 mixes poisson() and normal() calls, so it is not drawn in blocks
         gen2 = np.random.RandomState(seed=int(idstr[1]))
 
         # genA is an iterator 0 and infinity
@@ -240,8 +547,7 @@ class Generator(object):
                 return 0
         
         # Select one service
-        def service_name():
-            return gen.choice(possible_service_names)
+        service_name = cls.selector(gen, possible_service_names, service_profile)
 
         event_generator = ServerMetricEventGenerator(env, id=idstr,
                                                      adist=arrival_dist, flowdist=no_of_flows_dist,
@@ -272,8 +578,8 @@ class Generator(object):
 
         env = network.env
 
-        if Verbose.level >= 1:
-            print("Generator client_event_generator arrival_lambda = {}".format(arrival_lambda))
+        if Trace.GENERATOR:
+            Trace.emit("GENERATOR", "Generator client_event_generator arrival_lambda = {}", arrival_lambda)
 
         # EventGenerator accepts three (zero arguments) functions as arguments,
         # - one that gives the inter arrival times,
@@ -281,7 +587,8 @@ class Generator(object):
         # - one that gives the destinations.
 
         # We first define our random number generator so that we can reproduce results
-        gen = np.random.RandomState(seed=seed)
+        # the values are drawn in blocks by a RandomStream
+        gen = RandomStream(np.random.RandomState(seed=seed))
 
         # The interarrival times of a poisson process follow an exponential
         def arrival_dist():
@@ -293,8 +600,7 @@ class Generator(object):
             return packet_size
 
         # Send to all destinations
-        def destinations_dist():
-            return gen.choice(possible_destinations)
+        destinations_dist = gen.chooser(possible_destinations)
 
         # Create the event generator oobject
         event_generator = ClientEventGenerator(env, id=id,
@@ -316,16 +622,18 @@ class Generator(object):
     @classmethod
     def multi_client_event_generator(cls, network, possible_sources, target_name,
                                      arrival_lambda=1, size_lambda=5, size_scale_factor=10,
-                                     seed=None):
+                                     seed=None, source_profile=None):
         """ Generates events from nodes from 'possible_sources'.
             'arrival_lambda' is passed to the arrival distribution.
             'size_lambda' is passed to the size distribution.
+            'source_profile' is the popularity of the sources, e.g. ('zipf', 1.0),
+            or None to pick them with equal probability.
         """
 
         env = network.env
 
-        if Verbose.level >= 1:
-            print("Generator multi_client_event_generator arrival_lambda = {} size_lambda = {} size_scale_factor = {}".format(arrival_lambda, size_lambda, size_scale_factor))
+        if Trace.GENERATOR:
+            Trace.emit("GENERATOR", "Generator multi_client_event_generator arrival_lambda = {} size_lambda = {} size_scale_factor = {}", arrival_lambda, size_lambda, size_scale_factor)
 
         # EventGenerator accepts three (zero arguments) functions as arguments,
         # - one that gives the inter arrival times,
@@ -333,9 +641,12 @@ class Generator(object):
         # - one that gives the sources
 
         # We first define our random number generator so that we can reproduce results
-        gen = np.random.RandomState(seed=seed)
+        # the values are drawn in blocks by a RandomStream
+        gen = RandomStream(np.random.RandomState(seed=seed))
 
+        # gen2 is only used for the sizes, so they can be drawn in blocks directly
         gen2 = np.random.RandomState(seed=None)
+        sizes = RandomBlock(lambda size: gen2.exponential(size_lambda, size=size))
 
         # The interarrival times of a poisson process follow an exponential
         def arrival_dist():
@@ -345,12 +656,11 @@ class Generator(object):
 
         # The size / length of the jobs in each request
         def size_dist():
-            next_size = gen2.exponential(size_lambda)
+            next_size = sizes.next()
             return int(next_size * size_scale_factor)
 
         # Send to sources
-        def sources_dist():
-            return gen.choice(possible_sources)
+        sources_dist = cls.selector(gen, possible_sources, source_profile)
 
         # Create the event generator oobject
         event_generator = MultiClientEventGenerator(env, target_name,
@@ -366,4 +676,31 @@ class Generator(object):
 
 
         return Generator(network, event_generator)
-    
+
+    # A event generator which replays a trace of client requests
+    @classmethod
+    def replay_event_generator(cls, network, filename, time_scale=1.0, source_map=None,
+                               start=None, initial_delay=0, finish=float("inf")):
+        """ Generates events from the records in the trace file 'filename',
+            which is a .npy or CSV file, as described in ReplayTrace.
+            'time_scale' multiplies the times in the trace, from 'start',
+            or from the first record if 'start' is None.
+            'source_map' maps the sources in the trace onto Network hosts,
+            as described in ReplayEventGenerator.
+        """
+
+        env = network.env
+
+        if Trace.GENERATOR:
+            Trace.emit("GENERATOR", "Generator replay_event_generator filename = {} time_scale = {}", filename, time_scale)
+
+        # Create the event generator oobject
+        event_generator = ReplayEventGenerator(env, ReplayTrace(filename),
+                                               time_scale=time_scale, source_map=source_map, start=start,
+                                               initial_delay=initial_delay, finish=finish)
+
+        # It puts each event in the receiving queue of the source client
+        event_generator.network = network
+
+
+        return Generator(network, event_generator)
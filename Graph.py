@@ -1,12 +1,30 @@
-from Verbose import Verbose
+import heapq
+from array import array
+from Trace import Trace
+
+# The trace categories, and the Verbose level they are on at
+Trace.categories({
+    'GRAPH_ADD': 2,
+    'DIJKSTRA_NEIGHBOURS': 3,
+})
 
 # A Graph
 class Graph:
-    """A representation of a Graph"""
+    """A representation of a Graph.
+       The adjacency is held in compressed sparse row (CSR) form:
+       the neighbours of node i are targets[offsets[i]:offsets[i+1]]
+       with the edge weights at the same positions in weights.
+       Edges added since the CSR arrays were built are held in pending,
+       and are folded in the next time the adjacency is read.
+       The weights are an array of ints, or a list if any weight is not an int."""
     def __init__(self, num=0):
         self.V = num                    # the size of the graph
-        self.graph = [None] * self.V    # an array of AdjNode lists
         self.labels = []                # an array of names
+        self.label_index = {}           # a dict of name -> index
+        self.offsets = array('l', [0] * (num + 1))   # start of each node in targets
+        self.targets = array('l')       # the neighbour indexes
+        self.weights = array('q')       # the edge weights
+        self.pending = {}               # index -> list of (vertex, weight) not in the arrays yet
         self.meta_data = {}             # a dict of meta data
         self.node_meta_data = {}        # a dict of meta data for each node
 
@@ -32,13 +50,13 @@ class Graph:
         """ Add some neighbours from a dictionary with label : { (router, propogation_delay) ...}
         """
         # Create graph
-        graph = cls(len(neighbours))
+        graph = cls()
 
         # Skip through all the neighbours
         # and create a list of node names
         for node in neighbours.keys():
             # and create entries in labels
-            graph.labels.append(node)
+            graph.add_node(node)
             
         # print ("labels: {}\n".format(graph.labels))
         
@@ -46,7 +64,7 @@ class Graph:
         for node in neighbours.keys():
 
             # get index of node
-            index = graph.labels.index(node)
+            index = graph.index_of(node)
             # print ("index {} = {}\n".format( node, index))
             
             # get the next links  {'b', 'c'}
@@ -70,7 +88,7 @@ class Graph:
 
 
                 # get index of next
-                nextIndex = graph.labels.index(name)
+                nextIndex = graph.index_of(name)
                 # print ("nextIndex {} = {}\n".format(next, nextIndex))
 
                 # add the edge, if it doesn't exist
@@ -81,8 +99,6 @@ class Graph:
                     graph.add_edge(index, nextIndex, weight)
                     # print ("add_edge {} = {}\n".format(index, nextIndex))
 
-                # print ("graph: {} {}\n".format(len(graph.graph), graph.graph))
-
         return graph
 
     # Build a graph from a GML file
@@ -101,9 +117,9 @@ class Graph:
             # graph already has s
             pass
         else:
+            self.label_index[s] = len(self.labels)
             self.V += 1
             self.labels.append(s)
-            self.graph.append(None)
 
     # Contains node
     def contains_node(self, val):
@@ -112,53 +128,89 @@ class Graph:
             # it's an int -- check size
             return val < self.V
         else:
-            return val in self.labels
-
-        # if type(s) == int:
-        #     s = self.labels[s]
+            return val in self.label_index
 
+    # Index of a node
+    def index_of(self, val):
+        """The index of the node represented by val.
+           Can be an int or a name"""
+        if type(val) == int:
+            return val
+        else:
+            index = self.label_index.get(val, None)
 
-        # if s in self.labels:
-        #     return True
-        # else:
-        #     return False
+            if index == None:
+                raise ValueError(str(val) + " is not in graph")
+            else:
+                return index
         
     # Add edges
     def add_edge(self, s, d, weight=1):
-        if Verbose.level >= 2:
-            print("add_edge " + str(s) + " " + str(d))
+        if Trace.GRAPH_ADD:
+            Trace.emit("GRAPH_ADD", "add_edge {} {}", s, d)
 
         if not self.contains_node(s):
-            if Verbose.level >= 2:
-                print("add_node " + str(s))
+            if Trace.GRAPH_ADD:
+                Trace.emit("GRAPH_ADD", "add_node {}", s)
             self.add_node(s)
 
         if not self.contains_node(d):
-            if Verbose.level >= 2:
-                print("add_node " + str(d))
+            if Trace.GRAPH_ADD:
+                Trace.emit("GRAPH_ADD", "add_node {}", d)
             self.add_node(d)
 
         if not self.contains_edge(s, d):
-            node = AdjNode(d,weight)
-            if type(s) == int:
-                pass
-            else:
-                # label to number
-                s = self.labels.index(s)
-                
-            node.next = self.graph[s]
-            self.graph[s] = node
+            # label to number
+            s = self.index_of(s)
+            d = self.index_of(d)
 
-            node = AdjNode(s,weight)
-            # d can be int or value
-            if type(d) == int:
-                pass
-            else:
-                # label to number
-                d = self.labels.index(d)
-            node.next = self.graph[d]
-            self.graph[d] = node
-            
+            self.pending.setdefault(s, []).append((d, weight))
+            self.pending.setdefault(d, []).append((s, weight))
+
+    # Fold the pending edges into the CSR arrays
+    def compact(self):
+        """Rebuild the CSR arrays with the pending edges.
+           The newest edges of each node come first."""
+        old_V = len(self.offsets) - 1
+
+        if not self.pending and old_V == self.V:
+            return
+
+        # the weights stay as an array of ints, if they are all ints
+        all_ints = type(self.weights) == array and all(type(weight) == int for edges in self.pending.values() for vertex, weight in edges)
+
+        offsets = array('l', [0])
+        targets = array('l')
+        weights = array('q') if all_ints else []
+
+        for i in range(self.V):
+            # the pending edges, newest first
+            for vertex, weight in reversed(self.pending.get(i, [])):
+                targets.append(vertex)
+                weights.append(weight)
+
+            # then the edges already in the arrays
+            if i < old_V:
+                start = self.offsets[i]
+                end = self.offsets[i+1]
+
+                targets.extend(self.targets[start:end])
+                weights.extend(self.weights[start:end])
+
+            offsets.append(len(targets))
+
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.pending = {}
+
+    # The positions in targets and weights for a node
+    def segment(self, val):
+        self.compact()
+
+        index = self.index_of(val)
+
+        return range(self.offsets[index], self.offsets[index+1])
 
     # Contains a link
     def contains_link(self, s, d):
@@ -166,87 +218,58 @@ class Graph:
     
     # Contains an edge
     def contains_edge(self, s, d):
-        # s can be int or value
-        if type(s) == int:
-            pass
-        else:
-            # label to number
-            s = self.labels.index(s)
-        
-        # d can be int or value
-        if type(d) == int:
-            pass
-        else:
-            # label to number
-            d = self.labels.index(d)
-        
-        # get head of the adjacency
-        node = self.graph[s]
+        # s and d can be int or value
+        s = self.index_of(s)
+        d = self.index_of(d)
 
-        # Skip through all the nodes
-        while node != None:
-            if node.vertex == d:
+        # look in the pending edges
+        for vertex, weight in self.pending.get(s, []):
+            if vertex == d:
                 return True
-            else:
-                node = node.next
+
+        # and in the arrays, without rebuilding them
+        if s < len(self.offsets) - 1:
+            for pos in range(self.offsets[s], self.offsets[s+1]):
+                if self.targets[pos] == d:
+                    return True
+
         return False
         
     # Get an edge
     def edge(self, s, d):
         """Returns a 3-tuple (src, dst, weight)  or None"""
-        # s can be int or value
-        if type(s) == int:
-            pass
-        else:
-            s = self.labels.index(s)
-        
-        # d can be int or value
-        if type(d) == int:
-            pass
-        else:
-            d = self.labels.index(d)
-        
-        # get head of the adjacency
-        node = self.node(s)
-        head = node
-
-        # Skip through all the nodes
-        while node != None:
-            if node.vertex == d:
-                return (self.name_of(s), self.name_of(node.vertex), node.weight)
-            else:
-                node = node.next
+        # s and d can be int or value
+        s = self.index_of(s)
+        d = self.index_of(d)
+
+        # Skip through all the neighbours
+        for pos in self.segment(s):
+            if self.targets[pos] == d:
+                return (self.name_of(s), self.name_of(d), self.weights[pos])
+
         return None
 
     # get a list of edges
+    # each edge is listed once, from the end with the lower index
     def edges(self):
-        nodes = self.labels
+        self.compact()
 
         edges = []
 
-        for label in nodes:
-            # get head of the adjacency
-            node = self.node(label)
-
-
-            # Skip through all the nodes
-            if node != None:   # None means no edges
-                while True:
-                    weight = node.weight
-                    dst = self.name_of(node.vertex)
+        for index in range(self.V):
+            label = self.name_of(index)
+            loop_seen = False
 
-                    if  (label, dst, weight) in edges:
-                        pass
-                    elif (dst, label, weight) in edges:
-                        pass
-                    else:
-                        edges.append( (label, dst, weight) )
+            # Skip through all the neighbours
+            for pos in range(self.offsets[index], self.offsets[index+1]):
+                vertex = self.targets[pos]
 
-                    # end
-                    if (node.next == None):
-                        break
-                    else:
-                        node = node.next            
+                if vertex > index:
+                    edges.append( (label, self.name_of(vertex), self.weights[pos]) )
+                elif vertex == index and not loop_seen:
+                    # an edge to itself is in the adjacency twice
+                    edges.append( (label, label, self.weights[pos]) )
+                    loop_seen = True
 
         return edges
         
@@ -257,20 +280,22 @@ class Graph:
 
     # get a specific node
     def node(self, val):
-        """Get the node represented by val.
+        """Get the node represented by val, as a list of AdjNodes.
            Can be an int or a name"""
-        if type(val) == int:
-            node = self.graph[val]
-            return node
-        else:
-            index = self.labels.index(val)
-            node = self.graph[index]
-            return node
+        head = None
+
+        # build the list from the end
+        for pos in reversed(self.segment(val)):
+            node = AdjNode(self.targets[pos], self.weights[pos])
+            node.next = head
+            head = node
+
+        return head
 
     # Label for node
     def name_of(self, i):
         if type(i) == str:
-            i = self.labels.index(i)
+            i = self.index_of(i)
             
 
         if len(self.labels) > i:
@@ -282,35 +307,13 @@ class Graph:
 
     # adjacency at val
     def adjacency(self, val):
-        if type(val) == int:
-            node = self.graph[val]
-            if node == None:
-                return []
-            else:
-                return [(self.name_of(value[0]), value[1]) for value in node.as_list()]
-        else:
-            index = self.labels.index(val)
-            node = self.graph[index]
-            if node == None:
-                return []
-            else:
-                return [(self.name_of(value[0]), value[1]) for value in node.as_list()]
+        return [(self.name_of(self.targets[pos]), self.weights[pos]) for pos in self.segment(val)]
 
     # neighbours of s
     def neighbours(self, s):
         "Returns the neighbors of a node s."
         
-        connections = []
-
-        # get head of the adjacency
-        node = self.node(s)
-
-        # Skip through all the nodes
-        while node != None:
-            connections.append(self.name_of(node.vertex))
-            node = node.next
-
-        return connections
+        return [self.name_of(self.targets[pos]) for pos in self.segment(s)]
     
     # weigth of an edge
     def weight(self, node1, node2):
@@ -344,14 +347,13 @@ class Graph:
     def print_agraph(self):
         for i in range(self.V):
             print(str(self.name_of(i)) + ":", end="")
-            node = self.graph[i]
-            while node:
-                print("\t-> {}".format(self.name_of(node.vertex)), end="")
-                if node.weight > 1:
-                    print(" ({})".format(node.weight), end="")
-                if node.next != None:
+            segment = self.segment(i)
+            for pos in segment:
+                print("\t-> {}".format(self.name_of(self.targets[pos])), end="")
+                if self.weights[pos] > 1:
+                    print(" ({})".format(self.weights[pos]), end="")
+                if pos + 1 < segment.stop:
                     print("")
-                node = node.next
                 
             print(".")
 
@@ -363,8 +365,9 @@ class Graph:
         print("}")
 
 
-    # simple Dijkstra algorithm - adapted
+    # Dijkstra algorithm - adapted
     # from https://www.udacity.com/blog/2021/10/implementing-dijkstras-algorithm-in-python.html
+    # with a binary heap to find the node with the lowest score
     
     @classmethod
     def dijkstra_algorithm(cls, graph, start_node, use_weights=False):
@@ -373,8 +376,55 @@ class Graph:
         the 'previous_nodes' for other nodes. An example:
         {'source': 'a', 'shortest_path': {'a': 0, 'b': 1, 'c': 4,
         'd': 3, 'e': 3}, 'previous_nodes': {'b': 'a', 'c': 'a', 'd': 'b', 'e': 'b'}}"""
+
+        search = cls.dijkstra_search(graph, start_node, use_weights)
         
-        unvisited_nodes = list(graph.nodes())
+        return { 'source': start_node, 'shortest_path': search['shortest_path'], 'previous_nodes': search['previous_nodes'] }
+
+    # Dijkstra algorithm for every node in the graph
+    @classmethod
+    def all_pairs_shortest_paths(cls, graph, use_weights=False):
+        """Dijkstra algorithm from every node, in one pass.
+        Returns a dict of source -> dict with the 'shortest_path' to
+        other nodes, the 'first_hop' from source towards other nodes,
+        and the 'path_latency' to other nodes, which is the sum of the
+        edge weights along the shortest path. An example for 'a':
+        {'shortest_path': {'a': 0, 'b': 1, 'c': 2}, 'first_hop': {'b': 'b', 'c': 'b'},
+        'path_latency': {'b': 3, 'c': 5}}"""
+
+        nodes = list(graph.nodes())
+
+        # node name -> position, shared by all the searches
+        position = { node: pos for pos, node in enumerate(nodes) }
+
+        # node name -> list of (neighbour, weight)
+        adjacency = { node: graph.adjacency(node) for node in nodes }
+
+        all_pairs = {}
+
+        for node in nodes:
+            search = cls.dijkstra_search(graph, node, use_weights, position, adjacency)
+
+            all_pairs[node] = { 'shortest_path': search['shortest_path'], 'first_hop': search['first_hop'], 'path_latency': search['path_latency'] }
+
+        return all_pairs
+
+    # The Dijkstra search
+    # Nodes with the same score are visited in the order of graph.nodes()
+    # The first hop and the path latency are carried along
+    # with the score, so there is no need to walk back along the path
+    @classmethod
+    def dijkstra_search(cls, graph, start_node, use_weights=False, position=None, adjacency=None):
+        """Dijkstra search from 'start_node'.
+        Returns a dict with the 'shortest_path', 'previous_nodes',
+        'first_hop' and 'path_latency' for other nodes.
+        'position' and 'adjacency' can be passed in when doing
+        lots of searches over the same graph."""
+
+        nodes = list(graph.nodes())
+
+        if position == None:
+            position = { node: pos for pos, node in enumerate(nodes) }
 
         # We'll use this dict to save the cost of visiting each node and update it as we move along the graph   
         shortest_path = {}
@@ -382,36 +432,52 @@ class Graph:
         # We'll use this dict to save the shortest known path to a node found so far
         previous_nodes = {}
 
+        # the first hop from start_node towards a node
+        first_hop = {}
+
+        # the sum of the edge weights to a node
+        path_latency = {}
+
         # We'll use max_value to initialize the "infinity" value of the unvisited nodes   
         max_value = float('inf')
 
-        for node in unvisited_nodes:
+        for node in nodes:
             shortest_path[node] = max_value
             
         # However, we initialize the starting node's value with 0   
         shortest_path[start_node] = 0
+        path_latency[start_node] = 0
+
+        visited = set()
+
+        # a heap of (score, position, node)
+        heap = [ (0, position[start_node], start_node) ]
+
+        # The algorithm executes until we visit all the nodes we can reach
+        while heap:
+            # get the node with the lowest score
+            (score, pos, current_min_node) = heapq.heappop(heap)
+
+            if current_min_node in visited:
+                # an old entry
+                continue
 
-        # The algorithm executes until we visit all nodes
-        while unvisited_nodes:
-            # The code block below finds the node with the lowest score
-            current_min_node = None
-            for node in unvisited_nodes: # Iterate over the nodes
-                if current_min_node == None:
-                    current_min_node = node
-                elif shortest_path[node] < shortest_path[current_min_node]:
-                    current_min_node = node
+            visited.add(current_min_node)
 
             # The code block below retrieves the current node's neighbors and updates their distances
-            neighbors = graph.neighbours(current_min_node)
+            if adjacency == None:
+                neighbors = graph.adjacency(current_min_node)
+            else:
+                neighbors = adjacency[current_min_node]
 
-            if Verbose.level >= 3:
-                print("dijkstra_algorithm: neighbours " + current_min_node + " = " + str(len(neighbors)) + " " + str(neighbors))
+            if Trace.DIJKSTRA_NEIGHBOURS:
+                Trace.emit("DIJKSTRA_NEIGHBOURS", "dijkstra_algorithm: neighbours {} = {} {}", current_min_node, len(neighbors), str([ neighbor for neighbor, weight in neighbors ]))
 
-            for neighbor in neighbors:
+            for neighbor, weight in neighbors:
 
                 if use_weights:
                     # use the actual weight for the shortest_path
-                    next = graph.weight(current_min_node, neighbor)
+                    next = weight
                 else:
                     # use the hop count for the shortest_path
                     next = 1
@@ -423,11 +489,26 @@ class Graph:
                     # We also update the best path to the current node
                     previous_nodes[neighbor] = current_min_node
 
-            # After visiting its neighbors, we mark the node as "visited"
-            unvisited_nodes.remove(current_min_node)
+                    # and the first hop and latency
+                    if current_min_node == start_node:
+                        first_hop[neighbor] = neighbor
+                    else:
+                        first_hop[neighbor] = first_hop[current_min_node]
+
+                    path_latency[neighbor] = path_latency[current_min_node] + weight
+
+                    heapq.heappush(heap, (tentative_value, position[neighbor], neighbor))
+
+        # The nodes which cannot be reached are visited last
+        if Trace.DIJKSTRA_NEIGHBOURS:
+            for node in nodes:
+                if node not in visited:
+                    neighbors = graph.neighbours(node)
+                    Trace.emit("DIJKSTRA_NEIGHBOURS", "dijkstra_algorithm: neighbours {} = {} {}", node, len(neighbors), str(neighbors))
 
-        return { 'source': start_node, 'shortest_path': shortest_path, 'previous_nodes': previous_nodes }
+        del path_latency[start_node]
 
+        return { 'source': start_node, 'shortest_path': shortest_path, 'previous_nodes': previous_nodes, 'first_hop': first_hop, 'path_latency': path_latency }
 
 
 
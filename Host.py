@@ -1,7 +1,15 @@
 import simpy
 from SimComponents import SwitchPort, PacketSink
 from Link import LinkEnd
-from Verbose import Verbose
+from Trace import Trace
+
+# The trace categories, and the Verbose level they are on at
+Trace.categories({
+    'LINKEND_ADD': 1,
+    'PACKET_CONSUMED': 1,
+    'PACKET_DELIVER': 2,
+    'HOST_RECV': 1,
+})
 
 LINKRATE = 10000000
 
@@ -65,11 +73,11 @@ class Host(object):
         """Add a neighbour from this host to a router"""
         link = None
         
-        if Verbose.level >= 1:
-            print("LinkEnd Add " + self.id() + " -> " + "neighbour " + str(neighbour_obj) + " neighbour_obj " + str(neighbour_obj.id()) + " delay " + str(propdelay))
+        if Trace.LINKEND_ADD:
+            Trace.emit("LINKEND_ADD", "LinkEnd Add {} -> neighbour {} neighbour_obj {} delay {}", self.id(), str(neighbour_obj), neighbour_obj.id(), propdelay)
 
         self.neighbour = neighbour_obj.id()
-        self.outgoing_port = SwitchPort(self.env, rate=rate, limit_bytes=False)
+        self.outgoing_port = SwitchPort(self.env, rate=rate, limit_bytes=False, fast=True)
         
         # create a link object for modelling propagation delay. 
         link = LinkEnd(env=self.env,
@@ -112,15 +120,15 @@ class Host(object):
             # consume the packet
             self.sink.put(packet)
 
-            if Verbose.level >= 1:
-                print("{:.3f}: {:5s} PACKET_CONSUMED {}.{} consumed in {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.id, self.hostid, (self.env.now - packet.time)))
+            if Trace.PACKET_CONSUMED:
+                Trace.emit("PACKET_CONSUMED", "{:.3f}: {:5s} PACKET_CONSUMED {}.{} consumed in {} after {:.3f}", self.env.now, self.id(), packet.src, packet.id, self.hostid, (self.env.now - packet.time))
         else:
             # If the packet is not for us, forward to the neighbour
             # This is where the main servicecast algorithm will be implemented.
             self.outgoing_port.put(packet)
 
-            if Verbose.level >= 2:
-                print("{:.3f}: {:5s} PACKET_DELIVER {}.{} for {} forwarded from {} to {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.id, packet.dst, self.hostid, self.neighbour, (self.env.now - packet.time)))
+            if Trace.PACKET_DELIVER:
+                Trace.emit("PACKET_DELIVER", "{:.3f}: {:5s} PACKET_DELIVER {}.{} for {} forwarded from {} to {} after {:.3f}", self.env.now, self.id(), packet.src, packet.id, packet.dst, self.hostid, self.neighbour, (self.env.now - packet.time))
            
     # Is the destination address a service name:  e.g. §a
     def is_service(self, name):
@@ -176,8 +184,8 @@ class Host(object):
     def recv(self, packet, link_end):
         """A packet is received from a LinkEnd of a neighbouring Router.
         """
-        if Verbose.level >= 1:
-            print("{:.3f}: {:5s} HOST_RECV Packet {}.{} consumed from {} after {:.3f}".format(self.env.now,  self.hostid, packet.src, packet.pkt_no, link_end.src_node.id(), (self.env.now - packet.time)))
+        if Trace.HOST_RECV:
+            Trace.emit("HOST_RECV", "{:.3f}: {:5s} HOST_RECV Packet {}.{} consumed from {} after {:.3f}", self.env.now,  self.hostid, packet.src, packet.pkt_no, link_end.src_node.id(), (self.env.now - packet.time))
 
         # add a tuple of (link_end, packet) to the packet store
         self.packet_store.put((link_end, packet))
@@ -1,3 +1,7 @@
+from collections import deque
+from simpy.events import Event, URGENT
+
+
 class UnidirectionalLink(object):
     """A unidirectional link.
        Contains 1 LinkEnd.
@@ -34,25 +38,52 @@ class BidirectionalLink(object):
 
 
 
+class Handover(Event):
+    """An urgent event which calls back to a LinkEnd.
+       It is scheduled in the same way as the Initialize event
+       which starts a simpy process, so a packet put on a LinkEnd
+       is sent at the same point as when it had a process.
+    """
+    def __init__(self, env, callback):
+        self.env = env
+        self.callbacks = [callback]
+        self._value = None
+        self._ok = True
+        env.schedule(self, URGENT)
+
+
 class LinkEnd(object):
-    """A Link in the emulation"""
+    """A Link in the emulation.
+       A packet is delivered to the dst_node after the propagation_delay
+       using event callbacks, rather than a process for each packet.
+       As the delay is the same for every packet, they are delivered
+       in the order they were put.
+    """
     def __init__(self, env, propagation_delay, src_node, dst_node):
         self.env = env
         self.propagation_delay = propagation_delay
         self.src_node = src_node
         self.dst_node = dst_node
 
+        # packets which have been put, but not sent yet
+        self.waiting = deque()
+
     def put(self, packet):
         """ The call from the Router to do packet forwarding
         """
-        self.env.process(self._send(packet))
+        self.waiting.append(packet)
+        Handover(self.env, self._send)
 
-    def _send(self, packet):
+    def _send(self, event):
         """ A method to send a packet
         """
-        yield self.env.timeout(self.propagation_delay)
+        # the timeout carries the packet to _deliver()
+        timeout = self.env.timeout(self.propagation_delay, self.waiting.popleft())
+        timeout.callbacks.append(self._deliver)
+
+    def _deliver(self, event):
         # The destination receives the packet
-        self.dst_node.recv(packet, self)
+        self.dst_node.recv(event.value, self)
 
     def __str__(self):
         return "Link(" + str(self.src_node.id()) + " --> " + str(self.dst_node.id()) + " /" + str(self.propagation_delay) + ")"
@@ -4,18 +4,39 @@ from Link import BidirectionalLink
 from Host import Host
 from Server import Server
 from Client import Client
-from Verbose import Verbose
-from Utility import Utility
+from Trace import Trace
+from Oracle import ReplicaOracle
 from collections import OrderedDict
 from gml import read_gml, write_gml
 import sys
 
+# The trace categories, and the Verbose level they are on at
+Trace.categories({
+    'NET_ADD': 2,
+    'LATENCY_TABLE': 2,
+    'BEST_REPLICA_DETAIL': 3,
+    'DIJKSTRA_LATENCY': 4,
+    'PATH_LATENCY': 5,
+    'BEST_REPLICA_UTILITY': 0,
+    'REPLICA_CAPACITY_NETWORK': 0,
+})
+
 class Network:
     def __init__(self, env = None):
         """ Create a network
         """
         self.routers = OrderedDict()         # a dictionary of routers
         self.links = []           # a list of links
+        self.edge_index = {}      # (name, name) -> link, both ways round
+
+        # an index over the nodes and links
+        # kept up to date as nodes and links are added
+        self.node_names = []            # position -> name
+        self.node_positions = {}        # name -> position
+        self.incident = {}              # name -> list of links at the node
+        self.hosts = OrderedDict()      # the Hosts, name -> Host
+        self.servers = OrderedDict()    # the Servers, name -> Server
+        self.switches = OrderedDict()   # the Routers which are not Hosts, name -> Router
         self.env = env            # an Environment
         self.latency_table = {}
 
@@ -26,15 +47,41 @@ class Network:
         # replica_capacity initial total
         # need 1 for slots and capacity 
         self.replica_capacity_total = { 'load': 0, 'no_of_flows': 0, 'slots': 1, 'capacity' : 1 }
+
+        # running sums of replica capacity, kept up to date on each update
+        # replica name -> the values it added to the sums
+        self.replica_capacity_sums = { 'load': 0, 'no_of_flows': 0, 'slots': 0, 'capacity' : 0 }
+        self.replica_capacity_counted = dict()
  
         # aggregate of replica load utility
         # gives a total view over the network
         # replica name -> load value
         self.replica_load_utility = dict()
 
+        # running sum of replica load utility
+        self.load_utility_total = 0
+
         # the network diameter
         self.network_diameter_val = 0
 
+        # a global view of the Servers, for best_replica_utility
+        self.oracle = ReplicaOracle(self)
+
+        # a Results collector, if the measurements are being kept
+        self.results = None
+
+        # stats over the latency_table, kept up to date
+        # as the rows of the latency_table are set
+        # router name -> the max latency from the router
+        self.eccentricities = {}
+        # router name -> (total latency, no of paths) from the router
+        self.latency_row_totals = {}
+        # total latency and no of paths over all the routers
+        self.latency_total = 0
+        self.latency_count = 0
+        # is network_diameter_val up to date
+        self.network_diameter_valid = True
+
 
         
     @classmethod
@@ -56,7 +103,7 @@ class Network:
             # create a Router
             router = Router(name, network)
             # now add it to the routers
-            network.routers[name] = router
+            network.register_node(router)
 
         # now add the links
         for i in range(len(graph)):
@@ -82,7 +129,7 @@ class Network:
 
                 # create the BidirectionalLink
                 if status1 == "create" or status2 == "create":
-                    network.links.append(BidirectionalLink(link1, link2))
+                    network.add_link(BidirectionalLink(link1, link2))
 
         return network
             
@@ -115,7 +162,7 @@ class Network:
     def contains_node(self, r):
         if type(r) == int:
             # it's an int -- check size
-            return val < len(self.routers)
+            return r < len(self.routers)
 
         elif isinstance(r, str):
             # we just got a name
@@ -135,7 +182,33 @@ class Network:
         # create a Router
         router = Router(name, self)
         # now add it to the routers
-        self.routers[name] = router
+        self.register_node(router)
+
+    # add a Router or Host to the routers
+    # and to the index over the nodes
+    def register_node(self, node):
+        name = node.id()
+
+        if name in self.node_positions:
+            # replacing a node, so keep its position and links
+            self.hosts.pop(name, None)
+            self.servers.pop(name, None)
+            self.switches.pop(name, None)
+        else:
+            self.node_positions[name] = len(self.node_names)
+            self.node_names.append(name)
+            self.incident[name] = []
+
+        self.routers[name] = node
+
+        if isinstance(node, Host):
+            self.hosts[name] = node
+
+            if isinstance(node, Server):
+                self.servers[name] = node
+                self.oracle.invalidate()
+        else:
+            self.switches[name] = node
 
         
     # add a host to the network and link it to a specified router
@@ -204,16 +277,16 @@ class Network:
                     # just got a name
                     # make a Router
                     r1 = Router(n1, self)
-                    self.routers[n1] = r1
+                    self.register_node(r1)
 
-                    if Verbose.level >= 2:
-                        print("Net: " + type(r1).__name__ + " add " + n1)
+                    if Trace.NET_ADD:
+                        Trace.emit("NET_ADD", "Net: {} add {}", type(r1).__name__, n1)
                 else:
                     r1 = n1
-                    self.routers[n1.id()] = r1
+                    self.register_node(r1)
 
-                    if Verbose.level >= 2:
-                        print("Net: " + type(r1).__name__ + " add " + n1.id())
+                    if Trace.NET_ADD:
+                        Trace.emit("NET_ADD", "Net: {} add {}", type(r1).__name__, n1.id())
             else:
                 # existing node
                 if type(n1) == str:
@@ -239,16 +312,16 @@ class Network:
                     # just got a name
                     # make a Router
                     r2 = Router(n2, self)
-                    self.routers[n2] = r2
+                    self.register_node(r2)
 
-                    if Verbose.level >= 2:
-                        print("Net: " + type(r2).__name__ + " add " + n2)
+                    if Trace.NET_ADD:
+                        Trace.emit("NET_ADD", "Net: {} add {}", type(r2).__name__, n2)
                 else:
                     r2 = n2
-                    self.routers[n2.id()] = r2
+                    self.register_node(r2)
 
-                    if Verbose.level >= 2:
-                        print("Net: " + type(r2).__name__ + " add " + n2.id())
+                    if Trace.NET_ADD:
+                        Trace.emit("NET_ADD", "Net: {} add {}", type(r2).__name__, n2.id())
             else:
                 # existing node
                 if type(n2) == str:
@@ -267,11 +340,25 @@ class Network:
         # create the BidirectionalLink
         if status1 == "create" or status2 == "create":
             edge = BidirectionalLink(link1, link2)
-            self.links.append(edge)
+            self.add_link(edge)
             return edge
         else:
             return None
 
+    # add a BidirectionalLink to the links
+    # and index it both ways round
+    def add_link(self, link):
+        name1 = link.link1.src_node.id()
+        name2 = link.link2.src_node.id()
+
+        self.links.append(link)
+
+        self.edge_index[(name1, name2)] = link
+        self.edge_index[(name2, name1)] = link
+
+        self.incident[name1].append(link)
+        self.incident[name2].append(link)
+
     # contains link
     def contains_link(self, r1, r2):
         return self.contains_edge(r1, r2)
@@ -286,14 +373,18 @@ class Network:
             # we got a number
             r2 = self.name_of(r2)
             
-        # edges:  [('b', 'a', 1), ('c', 'a', 4), ('d', 'b', 3), ('e', 'b', 2), ('c', 'd', 1) ...]
-
-        found = [ e for e in  self.edges() if (e[0] == r1 and e[1] == r2) or  (e[0] == r2 and e[1] == r1) ]
+        # edge_index has both (r1, r2) and (r2, r1)
+        return (r1, r2) in self.edge_index
 
-        if len(found) > 0:
-            return True
-        else:
-            return False
+    # get the link between 2 nodes, or None
+    def link(self, r1, r2):
+        if isinstance(r1, int):
+            r1 = self.name_of(r1)
+            
+        if isinstance(r2, int):
+            r2 = self.name_of(r2)
+            
+        return self.edge_index.get((r1, r2), None)
 
     # get a specific node
     def node(self, r):
@@ -334,11 +425,11 @@ class Network:
 
     # contains a val
     def __contains__(self, val):
-        return contains_router(val)
+        return self.contains_router(val)
 
     # get router ids
     def nodes(self):
-        return [ r.id()  for r in self.routers.values() ]
+        return list(self.node_names)
 
     # get routers
     def network_nodes(self):
@@ -364,6 +455,18 @@ class Network:
             # it's a router
             return self.routers[r.id()].neighbours()
 
+    # adjacency of a router
+    # a list of (neighbour, weight)
+    def adjacency(self, r):
+        if isinstance(r, int):
+            router = self.routers[self.name_of(r)]
+        elif isinstance(r, str):
+            router = self.routers[r]
+        else:
+            router = self.routers[r.id()]
+
+        return [ (name, router.weight_edge(self.routers[name])) for name in router.neighbours() ]
+
     # degree at a router
     def degree(self, r):
         if isinstance(r, int):
@@ -376,7 +479,23 @@ class Network:
 
     # name of node a position N
     def name_of(self, n):
-        return list(self.routers.keys())[n]
+        return self.node_names[n]
+
+    # position of a node name
+    def position_of(self, name):
+        return self.node_positions[name]
+
+    # get the Hosts
+    def host_nodes(self):
+        return list(self.hosts.values())
+
+    # get the Servers
+    def server_nodes(self):
+        return list(self.servers.values())
+
+    # get the Routers which are not Hosts
+    def router_nodes(self):
+        return list(self.switches.values())
 
     # Links from a node - by name
     def links_from(self, val):
@@ -385,8 +504,7 @@ class Network:
         else:
             name = val
             
-        # filter over a list of BidirectionalLink
-        return list(filter(lambda l: name in l.links(), self.links))
+        return self.incident_links(name)
     
     # Links to a node - by name
     def links_to(self, val):
@@ -395,14 +513,27 @@ class Network:
         else:
             name = val
             
-        return list(filter(lambda l: name in l.links(), self.links))
+        return self.incident_links(name)
+
+    # the links at a node, in the order they were added
+    def incident_links(self, name):
+        return list(self.incident.get(name, []))
 
     # calculate the forwarding table for every node
     def calculate_forwarding_tables(self):
         """Calculate the forwarding tables for all nodes"""
-        for node in self.nodes():            
+
+        # calculate Dijkstra's algorithm for all the nodes in one go
+        # for each node this has the 'shortest_path' to other nodes,
+        # and the 'first_hop' and 'path_latency' for other nodes
+        all_pairs = Graph.all_pairs_shortest_paths(self)
+
+        for node in self.nodes():
+            dijkstra_r = all_pairs[node]
+            dijkstra_r['source'] = node
+
             # calculate the forwarding table for node
-            table = self.forwarding_table(node)
+            table = self.dijkstra_to_tables(dijkstra_r)
             # tell the node its unicast_forwarding_table
             self[node].set_unicast_forwarding_table(table)
 
@@ -423,90 +554,92 @@ class Network:
             router = r.id()
 
         # calculate Dijkstra's algorithm for the router
-        # this returns a dict of 3 values
+        # this returns a dict with
         # the 'source' node, the 'shortest_path' to other nodes,
-        # the 'previous_nodes' for other nodes. 
-        dijkstra_r = Graph.dijkstra_algorithm(self, router)
+        # the 'first_hop' and 'path_latency' for other nodes. 
+        dijkstra_r = Graph.dijkstra_search(self, router)
+
+        return self.dijkstra_to_tables(dijkstra_r)
 
-        # we combine shortest_path and previous_nodes to
+    # convert the dijkstra values for a router into
+    # its routing table, and add its latencies to the latency_table
+    def dijkstra_to_tables(self, dijkstra_r):
+        router = dijkstra_r['source']
+
+        # we use the shortest_path and first_hop to
         # create the routing table entries
         table = self.dijkstra_to_routing(dijkstra_r)
 
         # while in here we use the same dijkstra_r values to
-        # combine the shortest_path and previous_nodes to
-        # convert shortest_path and previous_nodes dicts into 
-        # a list of path latencies
+        # get the path latencies
         latency_table_r = self.dijkstra_to_latency(dijkstra_r)
-        self.latency_table.update(latency_table_r)
+        self.update_latency_table(latency_table_r)
 
-        if Verbose.level >= 2:
-            print("Net: latency_table: " + router + " = " + str(latency_table_r[router]))
+        if Trace.LATENCY_TABLE:
+            Trace.emit("LATENCY_TABLE", "Net: latency_table: {} = {}", router, str(latency_table_r[router]))
 
         return table
 
-    # convert shortest_path and previous_nodes dicts into 
+    # convert shortest_path and first_hop dicts into 
     # a list of  entries like (destination, next_hop, weight)
     def dijkstra_to_routing(self, dijkstra_tuple):
         router = dijkstra_tuple['source']
         shortest_path = dijkstra_tuple['shortest_path']
-        previous_nodes = dijkstra_tuple['previous_nodes']
 
-        return self.dijkstra_to_routing_fn(router, shortest_path, previous_nodes)
+        if 'first_hop' in dijkstra_tuple:
+            first_hop = dijkstra_tuple['first_hop']
+        else:
+            first_hop = self.previous_to_first_hop(router, dijkstra_tuple['previous_nodes'])
+
+        return self.dijkstra_to_routing_fn(router, shortest_path, first_hop)
         
-    # convert shortest_path and previous_nodes dicts into 
+    # convert shortest_path and first_hop dicts into 
     # a list of  entries like (destination, next_hop, weight)
-    def dijkstra_to_routing_fn(self, router, shortest_path, previous_nodes):
+    def dijkstra_to_routing_fn(self, router, shortest_path, first_hop):
         """Convert dijkstra_algorithm dict into a routing table"""
         
         # example inputs are:
         # 'shortest_path': {'a': 3, 'b': 2, 'c': 5, 'd': 0, 'e': 4, 'f': 6, 's1': 4, 's2': 4, 's3': 4, 's4': 4, 's5': 4, 'c1': 5, 'c2': 5, 'c3': 5, 'c4': 5, 'c5': 5},
-        # 'previous_nodes': {'b': 'd', 'c': 'd', 'e': 'b', 'a': 'b', 's1': 'a', 's2': 'a', 's3': 'a', 's4': 'a', 's5': 'a', 'c1': 'e', 'c2': 'e', 'c3': 'e', 'c4': 'e', 'c5': 'e', 'f': 'c'}
+        # 'first_hop': {'b': 'b', 'c': 'c', 'e': 'b', 'a': 'b', 's1': 'b', 's2': 'b', 's3': 'b', 's4': 'b', 's5': 'b', 'c1': 'b', 'c2': 'b', 'c3': 'b', 'c4': 'b', 'c5': 'b', 'f': 'c'}
 
         table = []
         
-        # visit the shortest_path dict and work out which is the
+        # visit the shortest_path dict and get the 
         # directly connected node to send to
         for node, weight in shortest_path.items():
             if node == router:
                 # found myself - nothing to do
                 pass
+            elif node not in first_hop:
+                # cannot be reached
+                pass
             else:
-                # now find the directly connected node
-                connected = None
-                lookup = node
-
-                while True:
-                    # find lookup in previous_nodes
-                    connected = previous_nodes[lookup]
-
-                    if connected == router:
-                        # next is directly connected to router
-                        break
-                    else:
-                        lookup = connected
-
-                tuple = (node, lookup, weight) 
+                tuple = (node, first_hop[node], weight) 
 
                 table.append(tuple)
 
         return table
 
-    # convert shortest_path and previous_nodes dicts into 
+    # convert shortest_path and path_latency dicts into 
     # a list of  path latencies
     def dijkstra_to_latency(self, dijkstra_tuple):
         router = dijkstra_tuple['source']
         shortest_path = dijkstra_tuple['shortest_path']
-        previous_nodes = dijkstra_tuple['previous_nodes']
 
-        return self.dijkstra_to_latency_fn(router, shortest_path, previous_nodes)
+        if 'path_latency' in dijkstra_tuple:
+            path_latency = dijkstra_tuple['path_latency']
+        else:
+            path_latency = self.previous_to_path_latency(router, dijkstra_tuple['previous_nodes'])
+
+        return self.dijkstra_to_latency_fn(router, shortest_path, path_latency)
         
-    # convert shortest_path and previous_nodes dicts into 
+    # convert shortest_path and path_latency dicts into 
     # a list of  path latencies
-    def dijkstra_to_latency_fn(self, router, shortest_path, previous_nodes):
+    def dijkstra_to_latency_fn(self, router, shortest_path, path_latency):
         """Convert dijkstra_algorithm dict into latency along the path"""
         
         # example inputs are:
-        # {'source': 'a', 'shortest_path': {'a': 0, 'b': 1, 'c': 1, 'd': 2, 'e': 2}, 'previous_nodes': {'b': 'a', 'c': 'a', 'd': 'b', 'e': 'b'}}
+        # {'source': 'a', 'shortest_path': {'a': 0, 'b': 1, 'c': 1, 'd': 2, 'e': 2}, 'path_latency': {'b': 1, 'c': 4, 'd': 4, 'e': 3}}
         
         latency_table = {}
         
@@ -514,48 +647,106 @@ class Network:
         latency_table[router] = {}
 
         
-        # visit the shortest_path dict and work out the latency along the path
+        # visit the shortest_path dict and get the latency along the path
         # the weights in shortest_path are hop count, and so not used here
         for node in shortest_path.keys():
             if node == router:
                 # found myself - nothing to do
                 pass
+            elif node not in path_latency:
+                # cannot be reached
+                pass
             else:
-                # now find the path
-                connected = None
-                lookup = node
-                path_latency = 0
+                if Trace.DIJKSTRA_LATENCY:
+                    Trace.emit("DIJKSTRA_LATENCY", "Net: dijkstra_to_latency_fn: latency {} --> {} = {}", router, node, path_latency[node])
+                    
+                latency_table[router][node] = path_latency[node]
 
-                # skip through all nodes until we reach router
-                while True:
-                    # find lookup in previous_nodes
-                    connected = previous_nodes[lookup]
+        return latency_table
 
-                    # get the link weight of connected to lookup
-                    link_weight = self.weight(connected, lookup)
+    # set some rows of the latency_table
+    # and update the stats over the latency_table
+    def update_latency_table(self, latency_table_r):
+        for router, row in latency_table_r.items():
+            # take off the totals of the old row
+            if router in self.latency_row_totals:
+                (total, count) = self.latency_row_totals[router]
+                self.latency_total -= total
+                self.latency_count -= count
+
+            # and add the totals of the new row
+            total = sum(row.values())
+            count = len(row)
+
+            self.latency_row_totals[router] = (total, count)
+            self.latency_total += total
+            self.latency_count += count
+
+            self.eccentricities[router] = max(row.values(), default=0)
+
+            self.latency_table[router] = row
+
+        # the diameter is worked out the next time it is needed
+        self.network_diameter_valid = False
+
+        # and the oracle needs new latencies
+        self.oracle.invalidate_latencies()
+
+    # work out the first hop to each node from previous_nodes
+    # each node is visited once, as the first hops are kept as we go
+    def previous_to_first_hop(self, router, previous_nodes):
+        first_hop = {}
+
+        for node in previous_nodes:
+            # walk back until we find a node with a known first hop
+            path = []
+            lookup = node
+
+            while lookup not in first_hop:
+                connected = previous_nodes[lookup]
+                path.append(lookup)
+
+                if connected == router:
+                    # lookup is directly connected to router
+                    first_hop[lookup] = lookup
+                    path.pop()
+                    break
+                else:
+                    lookup = connected
 
-                    path_latency += link_weight
+            # now fill in the nodes on the way
+            for visited in path:
+                first_hop[visited] = first_hop[lookup]
 
-                    if Verbose.level >= 5:
-                        print("Net: dijkstra_to_latency_fn: link_weight: " + connected + " -> " + lookup + " = " + str(link_weight))
+        return first_hop
 
-                    if connected == router:
-                        # next we have reached router
-                        # so the path is complete
-                        break
-                    else:
-                        lookup = connected
+    # work out the path latency to each node from previous_nodes
+    # each node is visited once, as the latencies are kept as we go
+    def previous_to_path_latency(self, router, previous_nodes):
+        path_latency = { router: 0 }
 
-                if Verbose.level >= 4:
-                    print("Net: dijkstra_to_latency_fn: latency " + router + " --> " + node + " = " + str(path_latency))
-                    
-                latency_table[router][node] = path_latency
+        for node in previous_nodes:
+            # walk back until we find a node with a known latency
+            path = []
+            lookup = node
 
-        # before we return, calculate the network diameter
-        # it uses the latency_table values
-        self.network_diameter_val = self.network_diameter_fn()
-        
-        return latency_table
+            while lookup not in path_latency:
+                path.append(lookup)
+                lookup = previous_nodes[lookup]
+
+            # now add up the link weights on the way out again
+            for visited in reversed(path):
+                link_weight = self.weight(lookup, visited)
+
+                if Trace.PATH_LATENCY:
+                    Trace.emit("PATH_LATENCY", "Net: previous_to_path_latency: link_weight: {} -> {} = {}", lookup, visited, link_weight)
+
+                path_latency[visited] = path_latency[lookup] + link_weight
+                lookup = visited
+
+        del path_latency[router]
+
+        return path_latency
 
 
     # Get the latency along a path from src to dst
@@ -588,26 +779,41 @@ class Network:
     # from every node to all other nodes is calculated, the diameter
     # is the longest of all the calculated path lengths
     def network_diameter(self):
+        if not self.network_diameter_valid:
+            self.network_diameter_val = self.network_diameter_fn()
+            self.network_diameter_valid = True
+
         return self.network_diameter_val
 
     # calculate the network diameter
+    # from the max latency from each node
     def network_diameter_fn(self):
         diameter = 1
 
-        # visit the keys -- nodes names
-        for node in self.latency_table:
-            latency_from_node = self.latency_table[node]
+        for distance in self.eccentricities.values():
+            if distance > diameter:
+                diameter = distance
 
+        return diameter
 
-            for dst in latency_from_node:
-                distance = latency_from_node[dst]
+    # the eccentricity of a node
+    # the max latency from the node to any other node
+    def eccentricity(self, r):
+        if isinstance(r, int):
+            name = self.name_of(r)
+        elif isinstance(r, str):
+            name = r
+        else:
+            name = r.id()
 
-                if distance > diameter:
-                    diameter = distance
-            
-                # print(str(dst) + " -> " + str(distance) + " diameter: " + str(diameter))
+        return self.eccentricities[name]
 
-        return diameter
+    # the mean latency over all the paths in the latency_table
+    def mean_path_latency(self):
+        if self.latency_count == 0:
+            return 0
+        else:
+            return self.latency_total / self.latency_count
         
     # Get the utility for best server / replica.
     # This is called by individual Servers
@@ -616,90 +822,67 @@ class Network:
         client_name = packet.src
         requesting_server_id = requesting_server.id()
 
-        # filter out server nodes
-        servers = [ r  for r in self.network_nodes() if isinstance(r, Server) ]
-
-
         # Utility of best replica:
         # - grab snapshot of load on all replicas.
         # - get latency from the client to all replicas (from dijkstra).
         # - calculate utility for each.
         # - Choose minimum.
-        utility_values = {}
-        load_values = {}
-
-
-        for server in servers:
-            # get load at server
-            load = server.calculate_load()
-            load_values[server.id()] = load
-
-            # get latency from client to server
-            latency = self.latency_table[server.id()][client_name]
-
-            # calculate utility
-            # we use
-            # alpha --> same alpha
-            # load --> load at chosen replica
-            # delay --> length of path (sum of weigths) from client to chosen replica
+        # The oracle holds the load and latency for all the Servers
+        # as arrays, and calculates the utility for all of them in one go
+        oracle = self.oracle
 
-            utility = Utility.forwarding_utility_fn(Utility.alpha, load, latency)
+        # we use
+        # alpha --> same alpha
+        # load --> load at chosen replica
+        # delay --> length of path (sum of weigths) from client to chosen replica
+        utility = oracle.utilities(client_name)
 
-            utility_values[server.id()] = utility
+        # the positions of all the Servers which have the maximum value
+        best_positions = oracle.best(utility)
 
-        if Verbose.level >= 3:
-            print("best_replica_utility: '" + requesting_server_id + "' load = " + str(load_values))
-            print("best_replica_utility: '" + requesting_server_id + "' latency = " + str(self.latency_table[requesting_server_id]))
-            print("best_replica_utility: '" + requesting_server_id + "' utility from " + str(client_name) + " = " + str(utility_values))
+        if Trace.BEST_REPLICA_DETAIL:
+            servers = [ server.id() for server in oracle.servers ]
+            load_values = dict(zip(servers, oracle.loads.tolist()))
+            utility_values = dict(zip(servers, utility.tolist()))
 
+            Trace.emit("BEST_REPLICA_DETAIL", "best_replica_utility: '{}' load = {}", requesting_server_id, str(load_values))
+            Trace.emit("BEST_REPLICA_DETAIL", "best_replica_utility: '{}' latency = {}", requesting_server_id, str(self.latency_table[requesting_server_id]))
+            Trace.emit("BEST_REPLICA_DETAIL", "best_replica_utility: '{}' utility from {} = {}", requesting_server_id, client_name, str(utility_values))
 
-        # now we sort them by value (descending), so the maximum value is the first item
-        ordered = {k: v for k, v in sorted(utility_values.items(), key=lambda item: item[1], reverse=True)}
-        
-        if Verbose.level >= 3:
-            print("best_replica_utility: '" + requesting_server_id + "' ordered_utility = " + str(ordered))
-
-        # and select all the keys which match the minimum value
-        minimum_pair = list(ordered.items())[0]
+            # sorted by value (descending), so the maximum value is the first item
+            ordered = {k: v for k, v in sorted(utility_values.items(), key=lambda item: item[1], reverse=True)}
 
-        if Verbose.level >= 3:
-            print("best_replica_utility: '" + requesting_server_id + "' minimum_pair = " + str(minimum_pair))
-        
-        minimum_replicas = [k for k, v in ordered.items() if v == minimum_pair[1]]
-        
-        if Verbose.level >= 3:
-            print("best_replica_utility: '" + requesting_server_id + "' minimum_replicas = " + str(minimum_replicas))
+            Trace.emit("BEST_REPLICA_DETAIL", "best_replica_utility: '{}' ordered_utility = {}", requesting_server_id, str(ordered))
+            Trace.emit("BEST_REPLICA_DETAIL", "best_replica_utility: '{}' minimum_pair = {}", requesting_server_id, str(list(ordered.items())[0]))
+            Trace.emit("BEST_REPLICA_DETAIL", "best_replica_utility: '{}' minimum_replicas = {}", requesting_server_id, str([ servers[pos] for pos in best_positions ]))
 
         # need to keep:
         # selected server load, selected server latency, selected server utility
         # for logging
-        selected_server_load = 0
-        selected_server_latency = 0
-        selected_server_utility = 0
-
-        best_server_id = None
-        best_server_load = 0
-        best_server_latency = 0
-        best_server_utility = 0
-        
-        selected_server_load = load_values[requesting_server_id]
+        requesting_pos = oracle.position_of(requesting_server_id)
+
+        selected_server_load = int(oracle.loads[requesting_pos])
         selected_server_latency = self.latency_table[requesting_server_id][client_name]
-        selected_server_utility = utility_values[requesting_server_id]
-                
-        if requesting_server.id() in minimum_replicas:
+        selected_server_utility = utility[requesting_pos].item()
+
+        if requesting_pos in best_positions:
             # requesting_server has minimum load
-            best_server_id = requesting_server.id()
+            best_pos = requesting_pos
         else:
             # just pick one
-            best_server_id = minimum_replicas[0]
+            best_pos = best_positions[0]
 
-        best_server_load = load_values[best_server_id]
+        best_server_id = oracle.servers[best_pos].id()
+        best_server_load = int(oracle.loads[best_pos])
         best_server_latency = self.latency_table[best_server_id][client_name]
-        best_server_utility = utility_values[best_server_id]
+        best_server_utility = utility[best_pos].item()
+
+        if self.results != None:
+            self.results.best_replica(self.env.now, client_name, packet.id, requesting_server_id, selected_server_load, selected_server_latency, selected_server_utility, best_server_id, best_server_load, best_server_latency, best_server_utility)
 
         # Log utility of true best replica and utility of selected replica: timestamp, selected server id, client id, client request id,  selected server id,  selected server load, selected server latency, selected server utility, best server id, best server load, best server latency
-        if Verbose.level >= 0:
-            print("{:.3f}: {:5s} BEST_REPLICA_UTILITY '{}' pkt: {}.{} selected: {} load({}) latency({}) utility({}) best: {} load({}) latency({}) utility({}) {}".format(self.env.now, "Net ", requesting_server.id(),  packet.src, packet.id, requesting_server.id(), selected_server_load, selected_server_latency, selected_server_utility,  best_server_id, best_server_load, best_server_latency, best_server_utility, "SAME" if requesting_server_id == best_server_id else "DIFFERENT"))
+        if Trace.BEST_REPLICA_UTILITY:
+            Trace.emit("BEST_REPLICA_UTILITY", "{:.3f}: {:5s} BEST_REPLICA_UTILITY '{}' pkt: {}.{} selected: {} load({}) latency({}) utility({}) best: {} load({}) latency({}) utility({}) {}", self.env.now, "Net ", requesting_server_id,  packet.src, packet.id, requesting_server_id, selected_server_load, selected_server_latency, selected_server_utility,  best_server_id, best_server_load, best_server_latency, best_server_utility, "SAME" if requesting_server_id == best_server_id else "DIFFERENT")
 
     # Get replica capacity
     def get_replica_capacity(self, replica, entry):
@@ -721,19 +904,28 @@ class Network:
     def update_replica_capacity(self, replica, aDict):
         self.replica_capacity[replica] = aDict
 
-        # calculate total
-        self.replica_capacity_total = { 'load': 0, 'no_of_flows': 0, 'slots': 0,  'capacity': 0  }
+        # update the totals
+        # take off the old values for the replica, and add the new ones
+        sums = self.replica_capacity_sums
+        old = self.replica_capacity_counted.get(replica, None)
+        new = dict()
 
-        for key in self.replica_capacity:
-            entry = self.replica_capacity[key]
-            
-            self.replica_capacity_total["load"] += entry["load"]
-            self.replica_capacity_total["no_of_flows"] += entry["no_of_flows"]
-            self.replica_capacity_total["slots"] += entry["slots"]
-            self.replica_capacity_total["capacity"] += entry["capacity"]
+        for key in sums:
+            if old != None:
+                sums[key] -= old[key]
+
+            new[key] = aDict[key]
+            sums[key] += new[key]
+
+        self.replica_capacity_counted[replica] = new
 
-        if Verbose.level >= 0:
-            print ("{:.3f}: {:5s} REPLICA_CAPACITY_NETWORK 'load': {}, 'no_of_flows': {}, 'slots': {},  'capacity': {}".format(self.env.now, "Net ", self.replica_capacity_total["load"],  self.replica_capacity_total["no_of_flows"],  self.replica_capacity_total["slots"] ,  self.replica_capacity_total["capacity"]   ))
+        self.replica_capacity_total = sums
+
+        if self.results != None:
+            self.results.replica_capacity(self.env.now, sums)
+
+        if Trace.REPLICA_CAPACITY_NETWORK:
+            Trace.emit("REPLICA_CAPACITY_NETWORK", "{:.3f}: {:5s} REPLICA_CAPACITY_NETWORK 'load': {}, 'no_of_flows': {}, 'slots': {},  'capacity': {}", self.env.now, "Net ", sums["load"], sums["no_of_flows"], sums["slots"], sums["capacity"])
 
     # Get the load_utility for a replica
     def get_load_utility(self, replica):
@@ -742,23 +934,23 @@ class Network:
 
     # An update for load_utility
     def update_load_utility(self, replica, load_val):
+        # update the total
+        # take off the old value for the replica, and add the new one
+        if replica in self.replica_load_utility:
+            self.load_utility_total -= self.replica_load_utility[replica]
+
         self.replica_load_utility[replica] = load_val
+        self.load_utility_total += load_val
+
+    # total load_utility
+    def total_load_utility(self):
+        return self.load_utility_total
         
     # current average load_utility
     # average load_utilty = Network object collects all load_utility, returns average
     def average_load_utility(self):
-        count = 0
-        total = 0
-        
-        for key in self.replica_load_utility:
-
-            load_val = self.replica_load_utility[key]
-
-            # print("Network: average_load_utility: load at " + str(key) + " = " + str(load_val))
-
-            count += 1
-            total += load_val
-
+        count = len(self.replica_load_utility)
+        total = self.load_utility_total
 
         avg =  total / count
 
@@ -767,6 +959,15 @@ class Network:
         return avg
         
 
+    # the number of replicas which have a capacity
+    def replica_count(self):
+        return len(self.replica_capacity)
+
+    # current average of a replica capacity value
+    def average_replica_capacity(self, entry):
+        return self.get_total_replica_capacity(entry) / len(self.replica_capacity)
+
+
 
     def print(self):
         print("{", end="\n")
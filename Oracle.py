@@ -0,0 +1,109 @@
+import numpy as np
+from Utility import Utility
+
+
+class ReplicaOracle(object):
+    """A global view of the Servers in a Network, used to work out
+       the utility of the best replica for a client request.
+       The load at each Server is held in a NumPy array, which is
+       updated in place when a Server's load changes.
+       The latencies from a client to all the Servers are held as a
+       NumPy array for each client, taken from the Network latency_table.
+       The utility for all the Servers is then worked out in one go,
+       using Utility.forwarding_utility_values().
+    """
+    def __init__(self, network):
+        self.network = network
+
+        # the Servers, and their positions in the arrays
+        self.servers = []
+        self.positions = dict()
+
+        # the load at each Server
+        self.loads = np.zeros(0, dtype=np.int64)
+
+        # client name -> array of latencies from client to each Server
+        self.latency_rows = dict()
+
+        # do the arrays need rebuilding
+        self.valid = False
+
+    # The no of Servers
+    def __len__(self):
+        return len(self.servers)
+
+    # the Servers in the Network have changed
+    def invalidate(self):
+        """Rebuild the arrays next time they are used"""
+        self.valid = False
+
+    # the latency_table in the Network has changed
+    def invalidate_latencies(self):
+        """Rebuild the latency rows next time they are used"""
+        self.latency_rows.clear()
+
+    # rebuild the arrays if needed
+    def refresh(self):
+        if self.valid:
+            return
+
+        self.servers = self.network.server_nodes()
+        self.positions = { server.id(): pos for pos, server in enumerate(self.servers) }
+        self.loads = np.array([ server.calculate_load() for server in self.servers ], dtype=np.int64)
+        self.latency_rows.clear()
+
+        self.valid = True
+
+    # a Server's load has changed
+    def update_load(self, server):
+        """Set the load for 'server' from its calculate_load()"""
+        if not self.valid:
+            # it will be picked up on the rebuild
+            return
+
+        pos = self.positions.get(server.id(), None)
+
+        if pos == None:
+            # a new Server
+            self.invalidate()
+        else:
+            self.loads[pos] = server.calculate_load()
+
+    # the position of a Server in the arrays
+    def position_of(self, server_id):
+        self.refresh()
+        return self.positions[server_id]
+
+    # the latencies from a client to all the Servers
+    def latencies(self, client_name):
+        """An array of the latencies from 'client_name' to each Server"""
+        self.refresh()
+
+        row = self.latency_rows.get(client_name, None)
+
+        if row is None:
+            latency_table = self.network.latency_table
+            row = np.array([ latency_table[server.id()][client_name] for server in self.servers ])
+            self.latency_rows[client_name] = row
+
+        return row
+
+    # the utility of each Server for a client
+    def utilities(self, client_name):
+        """An array of the utility of each Server for 'client_name'"""
+        self.refresh()
+
+        latencies = self.latencies(client_name)
+
+        return Utility.forwarding_utility_values(Utility.alpha, self.loads, latencies)
+
+    # the Servers with the best utility
+    def best(self, utility):
+        """The positions of the Servers with the highest value in 'utility'"""
+        return np.flatnonzero(utility == utility.max())
+
+    def __str__(self):
+        return "ReplicaOracle " + str([ server.id() for server in self.servers ])
+
+    def __repr__(self):
+        return "ReplicaOracle " + str([ server.id() for server in self.servers ])
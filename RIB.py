@@ -0,0 +1,440 @@
+import heapq
+import itertools
+
+
+class RIBEntry(dict):
+    """An entry in the ServiceRIB.
+       It is a dict of the metric values, plus a stable doc_id.
+    """
+    def __init__(self, value, doc_id):
+        super().__init__(value)
+        self.doc_id = doc_id
+
+
+class ServiceRIB(object):
+    """An in-memory Service RIB, keyed by replica.
+       Every entry gets a stable doc_id when it is inserted,
+       which is kept across updates.
+       There are secondary indexes by servicename and by neighbour,
+       so all the lookups are O(1).
+       The doc_ids come from 'doc_ids', which can be shared between
+       a number of ServiceRIBs so the doc_ids are unique over all of them.
+    """
+    def __init__(self, doc_ids=None):
+        # doc_id -> RIBEntry, kept in insertion order
+        self.entries = dict()
+
+        # replica -> doc_id
+        self.replica_index = dict()
+
+        # servicename -> { doc_id: RIBEntry }
+        self.servicename_index = dict()
+
+        # neighbour -> { doc_id: RIBEntry }
+        self.neighbour_index = dict()
+
+        # where the doc_ids come from
+        # they are never reused
+        if doc_ids == None:
+            self.doc_ids = itertools.count(1)
+        else:
+            self.doc_ids = doc_ids
+
+    # The size of the RIB
+    def __len__(self):
+        return len(self.entries)
+
+    # iterate over the entries
+    def __iter__(self):
+        return iter(list(self.entries.values()))
+
+    # contains a replica
+    def __contains__(self, replica):
+        return replica in self.replica_index
+
+    # insert a new entry
+    # returns the doc_id
+    def insert(self, value):
+        """Insert a new entry, which must have a 'replica'.
+           Returns the doc_id of the new entry."""
+        replica = value['replica']
+
+        if replica in self.replica_index:
+            raise ValueError("replica " + str(replica) + " already in ServiceRIB")
+
+        doc_id = next(self.doc_ids)
+
+        entry = RIBEntry(value, doc_id)
+
+        self.entries[doc_id] = entry
+        self.replica_index[replica] = doc_id
+        self.add_to_index(self.servicename_index, entry.get('servicename'), entry)
+        self.add_to_index(self.neighbour_index, entry.get('neighbour'), entry)
+
+        return doc_id
+
+    # update some entries with the values in fields
+    # returns the list of updated doc_ids
+    def update(self, fields, doc_ids):
+        """Update the entries with 'doc_ids' using the values in 'fields'.
+           Returns the list of updated doc_ids."""
+        updated = []
+
+        for doc_id in doc_ids:
+            entry = self.entries.get(doc_id, None)
+
+            if entry == None:
+                continue
+
+            # take the entry out of the secondary indexes
+            self.remove_from_index(self.servicename_index, entry.get('servicename'), entry)
+            self.remove_from_index(self.neighbour_index, entry.get('neighbour'), entry)
+
+            if 'replica' in fields and fields['replica'] != entry['replica']:
+                del self.replica_index[entry['replica']]
+                self.replica_index[fields['replica']] = doc_id
+
+            entry.update(fields)
+
+            # and put it back
+            self.add_to_index(self.servicename_index, entry.get('servicename'), entry)
+            self.add_to_index(self.neighbour_index, entry.get('neighbour'), entry)
+
+            updated.append(doc_id)
+
+        return updated
+
+    # get an entry by doc_id
+    def get(self, doc_id):
+        """Get the entry with 'doc_id', or None"""
+        return self.entries.get(doc_id, None)
+
+    # find the entry for a replica
+    def find_replica(self, replica):
+        """Get the entry for 'replica', or None"""
+        doc_id = self.replica_index.get(replica, None)
+
+        if doc_id == None:
+            return None
+        else:
+            return self.entries[doc_id]
+
+    # all the entries for a servicename
+    def find_servicename(self, servicename):
+        """A list of the entries for 'servicename'"""
+        return list(self.servicename_index.get(servicename, {}).values())
+
+    # all the entries learned from a neighbour
+    def find_neighbour(self, neighbour):
+        """A list of the entries received from 'neighbour'"""
+        return list(self.neighbour_index.get(neighbour, {}).values())
+
+    # all the entries
+    def all(self):
+        """A list of all the entries, in doc_id order"""
+        return list(self.entries.values())
+
+    # remove an entry by doc_id
+    def remove(self, doc_id):
+        """Remove the entry with 'doc_id'.
+           Returns the removed entry, or None"""
+        entry = self.entries.pop(doc_id, None)
+
+        if entry != None:
+            del self.replica_index[entry['replica']]
+            self.remove_from_index(self.servicename_index, entry.get('servicename'), entry)
+            self.remove_from_index(self.neighbour_index, entry.get('neighbour'), entry)
+
+        return entry
+
+    # remove the entry for a replica
+    def remove_replica(self, replica):
+        """Remove the entry for 'replica'.
+           Returns the removed entry, or None"""
+        doc_id = self.replica_index.get(replica, None)
+
+        if doc_id == None:
+            return None
+        else:
+            return self.remove(doc_id)
+
+    # remove everything
+    def truncate(self):
+        """Remove all the entries"""
+        self.entries.clear()
+        self.replica_index.clear()
+        self.servicename_index.clear()
+        self.neighbour_index.clear()
+
+    # add an entry to a secondary index
+    def add_to_index(self, index, key, entry):
+        if key in index:
+            index[key][entry.doc_id] = entry
+        else:
+            index[key] = { entry.doc_id: entry }
+
+    # remove an entry from a secondary index
+    def remove_from_index(self, index, key, entry):
+        bucket = index.get(key, None)
+
+        if bucket != None:
+            bucket.pop(entry.doc_id, None)
+
+            if not bucket:
+                del index[key]
+
+    def __str__(self):
+        return "ServiceRIB " + str(self.all())
+
+    def __repr__(self):
+        return "ServiceRIB " + str(self.all())
+
+
+class SentTable(object):
+    """A table of the metrics which have been sent to each neighbour.
+       It maps a metric doc_id to the set of neighbours it was sent to,
+       with a reverse index from neighbour to doc_ids.
+       Membership, insert and clearing a metric are all O(1).
+    """
+    def __init__(self):
+        # metric doc_id -> { neighbour: True }, in the order sent
+        self.sent = dict()
+
+        # neighbour -> { metric doc_id: True }
+        self.neighbour_index = dict()
+
+        # (metric doc_id, neighbour) -> True, in the order sent
+        # this keeps the same ordering as the old table for printing
+        self.order = dict()
+
+    # The size of the table
+    def __len__(self):
+        return len(self.order)
+
+    # iterate over the entries
+    def __iter__(self):
+        return iter(self.all())
+
+    # contains a (metric doc_id, neighbour) pair
+    def contains(self, metric_doc_id, neighbour):
+        """Has metric 'metric_doc_id' been sent to 'neighbour'"""
+        return (metric_doc_id, neighbour) in self.order
+
+    # contains a metric doc_id
+    def contains_metric(self, metric_doc_id):
+        """Has metric 'metric_doc_id' been sent to any neighbour"""
+        return metric_doc_id in self.sent
+
+    # add a (metric doc_id, neighbour) pair
+    def insert(self, metric_doc_id, neighbour):
+        """Record that metric 'metric_doc_id' has been sent to 'neighbour'.
+           Returns False if it was already there."""
+        if (metric_doc_id, neighbour) in self.order:
+            return False
+
+        self.order[(metric_doc_id, neighbour)] = True
+        self.sent.setdefault(metric_doc_id, dict())[neighbour] = True
+        self.neighbour_index.setdefault(neighbour, dict())[metric_doc_id] = True
+
+        return True
+
+    # the neighbours that a metric was sent to
+    def neighbours_of(self, metric_doc_id):
+        """A list of the neighbours that 'metric_doc_id' was sent to"""
+        return list(self.sent.get(metric_doc_id, {}).keys())
+
+    # the metrics sent to a neighbour
+    def metrics_to(self, neighbour):
+        """A list of the metric doc_ids sent to 'neighbour'"""
+        return list(self.neighbour_index.get(neighbour, {}).keys())
+
+    # the set of metric doc_ids which have been sent
+    def metric_doc_ids(self):
+        """The set of metric doc_ids in the table"""
+        return set(self.sent.keys())
+
+    # clear all the entries for a metric
+    def clear(self, metric_doc_id):
+        """Remove all entries for 'metric_doc_id'.
+           Returns the no of entries removed."""
+        neighbours = self.sent.pop(metric_doc_id, None)
+
+        if neighbours == None:
+            return 0
+
+        for neighbour in neighbours:
+            del self.order[(metric_doc_id, neighbour)]
+
+            bucket = self.neighbour_index[neighbour]
+            del bucket[metric_doc_id]
+
+            if not bucket:
+                del self.neighbour_index[neighbour]
+
+        return len(neighbours)
+
+    # all the entries
+    def all(self):
+        """A list of all the entries, as dicts of metric_doc_id and neighbour"""
+        return [ {'metric_doc_id': metric_doc_id, 'neighbour': neighbour} for (metric_doc_id, neighbour) in self.order ]
+
+    # remove everything
+    def truncate(self):
+        """Remove all the entries"""
+        self.sent.clear()
+        self.neighbour_index.clear()
+        self.order.clear()
+
+    def __str__(self):
+        return "SentTable " + str(self.all())
+
+    def __repr__(self):
+        return "SentTable " + str(self.all())
+
+
+class ReplicaHeap(object):
+    """A priority queue of the RIB entries for one service,
+       keyed by their forwarding utility, so the best replica
+       can be found in O(log n).
+       The utility of an entry is only recalculated after the entry
+       has been invalidated, which happens when its load or delay changes.
+       Old heap items are not removed straight away, but are skipped
+       when they get to the top.
+       If some entries have the same utility, the one with the lowest
+       doc_id is the best, which is the first one in the ServiceRIB.
+    """
+    def __init__(self):
+        # a heap of (-utility, doc_id, version)
+        self.heap = []
+
+        # doc_id -> RIBEntry, for the entries in the heap
+        self.entries = dict()
+
+        # doc_id -> current utility
+        self.utility = dict()
+
+        # doc_id -> version of the current heap item
+        self.version = dict()
+
+        # doc_id -> RIBEntry, for entries which need a new utility
+        self.invalid = dict()
+
+    # The size of the heap
+    def __len__(self):
+        return len(self.entries)
+
+    # an entry has been added or its metrics have changed
+    def invalidate(self, entry):
+        """'entry' is new or has new metrics, so its utility
+           needs to be recalculated"""
+        self.entries[entry.doc_id] = entry
+        self.invalid[entry.doc_id] = entry
+
+    # remove an entry
+    def remove(self, entry):
+        """Remove 'entry'. Its heap item is skipped later."""
+        doc_id = entry.doc_id
+
+        self.entries.pop(doc_id, None)
+        self.utility.pop(doc_id, None)
+        self.version.pop(doc_id, None)
+        self.invalid.pop(doc_id, None)
+
+    # recalculate the utility of the invalid entries
+    def refresh(self, utility_fn):
+        """Calculate the utility of the invalid entries with
+           'utility_fn', which takes a list of entries and returns
+           a list of their utilities"""
+        if not self.invalid:
+            return
+
+        utilities = utility_fn(list(self.invalid.values()))
+
+        for (doc_id, entry), utility in zip(self.invalid.items(), utilities):
+            version = self.version.get(doc_id, 0) + 1
+
+            self.utility[doc_id] = utility
+            self.version[doc_id] = version
+
+            heapq.heappush(self.heap, (-utility, doc_id, version))
+
+        self.invalid.clear()
+
+        # rebuild the heap if it is mostly old items
+        if len(self.heap) > 2 * len(self.entries) + 16:
+            self.heap = [ (-self.utility[doc_id], doc_id, self.version[doc_id]) for doc_id in self.utility ]
+            heapq.heapify(self.heap)
+
+    # the best entry
+    def best(self):
+        """Returns a tuple of (entry, utility) for the entry with the
+           highest utility, or (None, None) if there are no entries.
+           refresh() should be called first."""
+        heap = self.heap
+
+        while heap:
+            (neg_utility, doc_id, version) = heap[0]
+
+            if self.version.get(doc_id, None) == version:
+                return (self.entries[doc_id], -neg_utility)
+            else:
+                # an old item
+                heapq.heappop(heap)
+
+        return (None, None)
+
+    # is the entry the best of the entries up to it
+    def is_leading(self, entry):
+        """Is 'entry' better than all the entries with a lower doc_id.
+           This is True if it would be the best so far, in a scan
+           of the entries in doc_id order.
+           Only the heap items with a utility at least as good as
+           the utility of 'entry' are visited."""
+        utility = self.utility.get(entry.doc_id, None)
+
+        if utility == None:
+            return False
+
+        heap = self.heap
+        todo = [0]
+
+        while todo:
+            pos = todo.pop()
+
+            if pos >= len(heap):
+                continue
+
+            (neg_utility, doc_id, version) = heap[pos]
+
+            if -neg_utility < utility:
+                # the children are all worse too
+                continue
+
+            if doc_id < entry.doc_id and self.version.get(doc_id, None) == version:
+                # an earlier entry which is as good
+                return False
+
+            todo.append(2 * pos + 1)
+            todo.append(2 * pos + 2)
+
+        return True
+
+    # the current utility of an entry
+    def utility_of(self, entry):
+        """The last calculated utility of 'entry', or None"""
+        return self.utility.get(entry.doc_id, None)
+
+    # remove everything
+    def truncate(self):
+        """Remove all the entries"""
+        self.heap = []
+        self.entries.clear()
+        self.utility.clear()
+        self.version.clear()
+        self.invalid.clear()
+
+    def __str__(self):
+        return "ReplicaHeap " + str(self.utility)
+
+    def __repr__(self):
+        return "ReplicaHeap " + str(self.utility)
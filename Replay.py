@@ -0,0 +1,107 @@
+import mmap
+import os
+import numpy as np
+
+
+class ReplayTrace(object):
+    """A trace of client requests, read from a file to be replayed.
+       Each record is (time, source, service, size).
+
+       The file is either:
+       - a .npy file of records with ReplayTrace.dtype, as written by save(), or
+       - a CSV file with a line for each record, such as
+             time,source,service,size
+             0.5,c1,§a,60
+         where the header line is optional, and lines starting with # are skipped.
+
+       Either type of file is memory-mapped, and the records are read
+       as they are needed, so the trace is not loaded into memory.
+    """
+    # the record type for .npy files
+    dtype = np.dtype([('time', '<f8'), ('source', '<U32'), ('service', '<U32'), ('size', '<f8')])
+
+    # the no of .npy records to convert at once
+    block_size = 4096
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.binary = filename.endswith(".npy")
+
+    # the records, in file order
+    def __iter__(self):
+        if self.binary:
+            return self.npy_records()
+        else:
+            return self.csv_records()
+
+    # the records from a .npy file
+    def npy_records(self):
+        data = np.load(self.filename, mmap_mode='r')
+
+        if data.dtype.names != self.dtype.names:
+            raise ValueError("ReplayTrace " + self.filename + " has fields " + str(data.dtype.names) + " not " + str(self.dtype.names))
+
+        for pos in range(0, len(data), self.block_size):
+            block = data[pos:pos + self.block_size]
+
+            for time, source, service, size in zip(block['time'].tolist(), block['source'].tolist(), block['service'].tolist(), block['size'].tolist()):
+                yield (time, source, service, number(size))
+
+    # the records from a CSV file
+    def csv_records(self):
+        if os.path.getsize(self.filename) == 0:
+            return
+
+        with open(self.filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                line_no = 0
+
+                # the header can only be the first line which is not blank or a comment
+                first = True
+
+                for line in iter(data.readline, b""):
+                    line_no += 1
+                    line = line.decode("utf-8").strip()
+
+                    if line == "" or line.startswith("#"):
+                        continue
+
+                    fields = [ field.strip() for field in line.split(",") ]
+
+                    if len(fields) != 4:
+                        raise ValueError("ReplayTrace " + self.filename + " line " + str(line_no) + " has " + str(len(fields)) + " fields, not 4")
+
+                    try:
+                        time = float(fields[0])
+                    except ValueError:
+                        if first:
+                            # the header
+                            first = False
+                            continue
+                        else:
+                            raise
+
+                    first = False
+
+                    yield (time, fields[1], fields[2], number(float(fields[3])))
+
+    # write records to a .npy file
+    @classmethod
+    def save(cls, filename, records):
+        """Save a list of (time, source, service, size) records to a .npy file
+        which can be replayed"""
+        np.save(filename, np.array([ tuple(record) for record in records ], dtype=cls.dtype))
+
+    def __str__(self):
+        return "ReplayTrace " + self.filename
+
+    def __repr__(self):
+        return "ReplayTrace " + self.filename
+
+
+# a size as an int if it is a whole number
+def number(value):
+    if value.is_integer():
+        return int(value)
+    else:
+        return value
@@ -0,0 +1,191 @@
+from array import array
+import csv
+import os
+import numpy as np
+
+
+class RecordTable(object):
+    """A table of records of one type, held as columns.
+       Each column is an array.array, so appending a record
+       only appends numbers, and the columns can be turned into
+       NumPy arrays at the end of a run.
+       The fields are a list of (name, typecode), where typecode
+       is 'd' for a float, 'q' for an int, and 'n' for a name,
+       which is held as an int from the Results name table.
+    """
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = [ field for field, code in fields ]
+        self.names = [ field for field, code in fields if code == 'n' ]
+        self.columns = [ array('q' if code == 'n' else code) for field, code in fields ]
+
+        # the append fns, one for each column
+        self.appends = [ column.append for column in self.columns ]
+
+    # The no of records
+    def __len__(self):
+        return len(self.columns[0])
+
+    # add a record
+    def append(self, values):
+        """Add a record, which is a tuple with a value for each field"""
+        for append, value in zip(self.appends, values):
+            append(value)
+
+    # remove all the records
+    def truncate(self):
+        for column in self.columns:
+            del column[:]
+
+    # the columns as NumPy arrays
+    def arrays(self):
+        """A dict of field -> NumPy array"""
+        return { field: np.array(column) for field, column in zip(self.fields, self.columns) }
+
+    def __str__(self):
+        return "RecordTable " + self.name + " " + str(len(self)) + " records"
+
+    def __repr__(self):
+        return "RecordTable " + self.name + " " + str(self.fields)
+
+
+class Results(object):
+    """A collector for the measurements in a run.
+       Each type of event has its own RecordTable, and names such
+       as Server and Client ids, and the ServerMetric operation, are
+       held as ints, with a name table to map them back.
+       Nothing is formatted while the simulation runs; the tables
+       are written out by save() or save_csv() at the end.
+
+       It is switched on for a Network with:
+           network.results = Results()
+    """
+    def __init__(self):
+        # the name table
+        # position -> name, and name -> position
+        self.name_list = []
+        self.name_ids = dict()
+
+        # a client request accepted by a Server
+        self.served = RecordTable("request_served", [('time', 'd'), ('server', 'n'), ('client', 'n'), ('pkt', 'q'), ('size', 'd'), ('load', 'q'), ('no_of_flows', 'q')])
+
+        # a client request a Server had no capacity for
+        self.dropped = RecordTable("request_dropped", [('time', 'd'), ('server', 'n'), ('client', 'n'), ('pkt', 'q'), ('size', 'd')])
+
+        # the selected replica for a request, against the best one
+        self.replica = RecordTable("best_replica", [('time', 'd'), ('client', 'n'), ('pkt', 'q'),
+                                                     ('selected', 'n'), ('selected_load', 'q'), ('selected_latency', 'd'), ('selected_utility', 'd'),
+                                                     ('best', 'n'), ('best_load', 'q'), ('best_latency', 'd'), ('best_utility', 'd'),
+                                                     ('utility_gap', 'd')])
+
+        # a change of load at a Server
+        self.server_load_table = RecordTable("server_load", [('time', 'd'), ('server', 'n'), ('load', 'q'), ('no_of_flows', 'q')])
+
+        # the network total of replica capacity
+        self.capacity = RecordTable("replica_capacity", [('time', 'd'), ('load', 'd'), ('no_of_flows', 'd'), ('slots', 'd'), ('capacity', 'd')])
+
+        # a ServerMetric control message, sent or received
+        self.control = RecordTable("control_message", [('time', 'd'), ('node', 'n'), ('replica', 'n'), ('pkt', 'q'), ('operation', 'n'), ('received', 'q'), ('msg_time', 'd'), ('delay', 'd')])
+
+        self.tables = [ self.served, self.dropped, self.replica, self.server_load_table, self.capacity, self.control ]
+
+    # the int for a name
+    def name_id(self, name):
+        """The position of 'name' in the name table, adding it if needed"""
+        position = self.name_ids.get(name, None)
+
+        if position == None:
+            position = len(self.name_list)
+            self.name_ids[name] = position
+            self.name_list.append(name)
+
+        return position
+
+    # the name for an int
+    def name_of(self, position):
+        return self.name_list[position]
+
+    # A client request was accepted by a Server
+    def request_served(self, time, server, client, pkt, size, load, no_of_flows):
+        self.served.append((time, self.name_id(server), self.name_id(client), pkt, size, load, no_of_flows))
+
+    # A client request was dropped by a Server
+    def request_dropped(self, time, server, client, pkt, size):
+        self.dropped.append((time, self.name_id(server), self.name_id(client), pkt, size))
+
+    # The selected and best replica for a request
+    def best_replica(self, time, client, pkt, selected, selected_load, selected_latency, selected_utility, best, best_load, best_latency, best_utility):
+        self.replica.append((time, self.name_id(client), pkt,
+                             self.name_id(selected), selected_load, selected_latency, selected_utility,
+                             self.name_id(best), best_load, best_latency, best_utility,
+                             best_utility - selected_utility))
+
+    # The load at a Server changed
+    def server_load(self, time, server, load, no_of_flows):
+        self.server_load_table.append((time, self.name_id(server), load, no_of_flows))
+
+    # The network total of replica capacity changed
+    def replica_capacity(self, time, total):
+        self.capacity.append((time, total['load'], total['no_of_flows'], total['slots'], total['capacity']))
+
+    # A ServerMetric message was sent or received
+    def control_message(self, time, node, replica, pkt, operation, received, msg_time, delay):
+        self.control.append((time, self.name_id(node), self.name_id(replica), pkt, self.name_id(operation), 1 if received else 0, msg_time, delay))
+
+    # remove all the records
+    def truncate(self):
+        for table in self.tables:
+            table.truncate()
+
+    # write all the tables to an NPZ file
+    def save(self, filename):
+        """Save the tables to a compressed NumPy .npz file.
+        Each column is saved as 'table.field', and the name table as 'names'"""
+        arrays = { 'names': np.array(self.name_list, dtype=str) }
+
+        for table in self.tables:
+            for field, values in table.arrays().items():
+                arrays[table.name + "." + field] = values
+
+        np.savez_compressed(filename, **arrays)
+
+    # write each table to a CSV file
+    def save_csv(self, dirname):
+        """Save each table to 'dirname'/table.csv, with the names filled in"""
+        os.makedirs(dirname, exist_ok=True)
+
+        for table in self.tables:
+            name_columns = [ pos for pos, field in enumerate(table.fields) if field in table.names ]
+
+            with open(os.path.join(dirname, table.name + ".csv"), "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(table.fields)
+
+                for row in zip(*table.columns):
+                    row = list(row)
+                    for pos in name_columns:
+                        row[pos] = self.name_list[row[pos]]
+                    writer.writerow(row)
+
+    # read the tables back from an NPZ file
+    @classmethod
+    def load(cls, filename):
+        """A dict of table name -> dict of field -> NumPy array,
+        with the name table as 'names'"""
+        tables = dict()
+
+        with np.load(filename) as data:
+            for key in data.files:
+                if key == 'names':
+                    tables['names'] = data[key].tolist()
+                else:
+                    table, field = key.split(".", 1)
+                    tables.setdefault(table, dict())[field] = data[key]
+
+        return tables
+
+    def __str__(self):
+        return "Results " + str({ table.name: len(table) for table in self.tables })
+
+    def __repr__(self):
+        return "Results " + str({ table.name: len(table) for table in self.tables })
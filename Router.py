@@ -3,14 +3,83 @@ from SimComponents import SwitchPort, PacketSink, Packet
 from Link import LinkEnd
 from Host import Host
 from Verbose import Verbose
+from Trace import Trace
 from Utility import Utility
 from Server import ServerMetricMessageType
-from tinydb import TinyDB, Query
+from RIB import ServiceRIB, SentTable, ReplicaHeap
+from Skyline import Skyline, IncrementalSkyline
 from enum import Enum
 # importing "collections" for defaultdict
 import collections
 import itertools
 
+# The trace categories, and the Verbose level they are on at
+Trace.categories({
+    'RECV_PACKET': 0,
+    'NO_SERVICE_FORWARDING_TABLE_ENTRY': 1,
+
+    'LINKEND_ADD': 1,
+    'PACKET_CONSUMED': 1,
+    'INCOMING_VALUES': 1,
+    'UNICAST_ROUTE': 1,
+    'SYSTEM_AVAILABLE_CAPACITY': 1,
+    'ANNOUNCEMENT_DISTANCE': 1,
+    'ADD_METRIC': 1,
+    'METRIC_TOO_OLD': 1,
+    'UPDATE_METRIC': 1,
+    'SENT_TABLE_NOTHING': 1,
+    'WITHDRAW_FORWARD': 1,
+    'CONNECTED_CAPACITY': 1,
+    'ALREADY_IN_SENT_TABLE': 1,
+    'FORWARD_METRIC': 1,
+    'FORWARD_WITHDRAW': 1,
+    'NOT_IN_SENT_TABLE': 1,
+    'CHOOSE_BEST_REPLICA': 1,
+    'BEST_REPLICA': 1,
+    'SERVICE_FORWARDING_TABLE': 1,
+    'NO_VALUE_FOR': 1,
+    'FORWARD_PACKET': 1,
+    'PACKET_FORWARDED': 1,
+    'PACKET_FAILURE': 1,
+    'REMOVE_METRIC': 1,
+    'ADD_SENT_TABLE': 1,
+    'UPDATE_SENT_TABLE': 1,
+    'CLEAR_SENT_TABLE': 1,
+    'ROUTER_PACKET_CREATED': 1,
+    'PACKET_ARRIVED': 1,
+
+    'LINKEND_EXISTS': 2,
+    'METRIC_SEARCH_RESULTS': 2,
+    'MARK_METRIC': 2,
+    'SERVER_METRICS_PACKET_WITHDRAW': 2,
+    'WITHDRAW_SEARCH_RESULTS': 2,
+    'SENT_TABLE_FOUND': 2,
+    'WITHDRAW_PACKET': 2,
+    'WITHDRAW_END': 2,
+    'ANNOUNCE': 2,
+    'NOT_TO_HOST': 2,
+    'NO_RETURN': 2,
+    'ANNOUNCE_END': 2,
+    'CHECK_WORSE_METRICS': 2,
+    'CHOOSE_BEST_FORWARDING_REPLICA': 2,
+    'UTILITY_NEIGHBOURS': 2,
+    'CLIENT_REQUEST_NEIGHBOUR': 2,
+    'PACKET_NOT_FORWARDED': 2,
+
+    'IS_NEIGHBOUR': 3,
+    'DECISION_SETS': 3,
+})
+
+# the tables, which are also off if Verbose.table is 0
+Trace.category('METRIC_TABLE', 1, table=True)
+Trace.category('SENT_TABLE', 1, table=True)
+Trace.category('UTILITY_TABLE', 1, table=True)
+Trace.category('ANNOUNCE_TABLE', 1, table=True)
+
+# only on at one level
+Trace.category('DECIDE_ANNOUNCEMENTS', 3, exact=True)
+Trace.category('METRIC_IS_BETTER', 4, exact=True)
+
 
 class Compare(Enum):
     Same = 0
@@ -20,7 +89,36 @@ class Compare(Enum):
     def __repr__(self):
         return self.name
 
-    
+
+class ServicePartition(object):
+    """The state a Router keeps for one service name.
+       It has the RIB entries for the replicas of the service,
+       the skyline of those entries, and the best replica info.
+    """
+    def __init__(self, servicename, metric_list, doc_ids=None):
+        self.servicename = servicename
+
+        # the table for metrics of this service
+        self.service_RIB = ServiceRIB(doc_ids)
+
+        # the skyline of the service_RIB, for deciding announcements
+        # it is kept up to date as entries are added, updated and removed
+        self.skyline = IncrementalSkyline(metric_list)
+
+        # the entries of the service_RIB ordered by forwarding utility
+        self.replica_heap = ReplicaHeap()
+
+        # best replica info
+        self.best_replica = None
+        self.best_neighbour = None
+        self.best_utility = -1
+
+    def __str__(self):
+        return "ServicePartition " + str(self.servicename)
+
+    def __repr__(self):
+        return "ServicePartition " + str(self.servicename)
+
 
 LINKRATE = 10000000
 
@@ -72,22 +170,16 @@ class Router(object):
         # set the simulation environment
         self.set_env(network)
 
-        # a database of metrics
-        self.db = TinyDB('/tmp/router-metrics-' + str(routerid) + '.json')
-        
-        # the table for metrics
-        self.service_RIB = self.db.table('metrics')
-        self.service_RIB.truncate()
-        
-        # the table for announcements which have been sent
-        self.sent_table = self.db.table('sent')
-        self.sent_table.truncate()
+        # the metrics, skyline and best replica info for each service
+        # servicename -> ServicePartition
+        self.services = dict()
 
-        # best replica info
-        self.best_replica = None
-        self.best_neighbour = None
-        self.servicename = None
-        self.best_utility = -1
+        # the doc_ids for metrics are unique over all the services
+        # as the sent_table uses them
+        self.doc_ids = itertools.count(1)
+
+        # the table for announcements which have been sent
+        self.sent_table = SentTable()
 
         # service forwarding table
         self.service_forwarding_table = dict()
@@ -108,6 +200,9 @@ class Router(object):
         self.metric_list =  [
             { 'name': 'load',  'better': Router.better_than_fn },
             { 'name': 'delay', 'better': Router.better_than_fn }   ]
+
+        # the skyline engine for deciding announcements
+        self.skyline = Skyline(self.metric_list)
     
 
 
@@ -171,16 +266,16 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         if (self.contains_edge(neighbour_obj)):
             # no need to add a link
 
-            if Verbose.level >= 2:
-                print("LinkEnd Exists "  + str(self.id()) + " --> " + str(neighbour) + " Cancel " +  str(self.id()) + " --> " + str(neighbour) )
+            if Trace.LINKEND_EXISTS:
+                Trace.emit("LINKEND_EXISTS", "LinkEnd Exists {} --> {} Cancel {} --> {}", self.id(), neighbour, self.id(), neighbour)
 
             return ("exists", self.outgoing_ports[neighbour_obj.id()])
 
         else:
-            if Verbose.level >= 1:
-                print("LinkEnd Add " + self.id() + " -> " + "neighbour " + str(neighbour) + " neighbour_obj " + str(neighbour_obj.id()) + " delay " + str(propdelay))
+            if Trace.LINKEND_ADD:
+                Trace.emit("LINKEND_ADD", "LinkEnd Add {} -> neighbour {} neighbour_obj {} delay {}", self.id(), neighbour, neighbour_obj.id(), propdelay)
 
-            self.outgoing_ports[neighbour] = SwitchPort(self.env, rate=rate, limit_bytes=False)
+            self.outgoing_ports[neighbour] = SwitchPort(self.env, rate=rate, limit_bytes=False, fast=True)
 
             # create a link object for modelling propagation delay. 
             link = LinkEnd(env=self.env,
@@ -239,8 +334,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
 
             else:
                 # packet for me, but not a ServerMetric
-                if Verbose.level >= 1:
-                    print("{:.3f}: PACKET {}.{}  ({:.3f}) consumed in {} after {:.3f}".format(self.env.now, packet.src, packet.pkt_no, packet.time, self.id(), (self.env.now - packet.time)))
+                if Trace.PACKET_CONSUMED:
+                    Trace.emit("PACKET_CONSUMED", "{:.3f}: PACKET {}.{}  ({:.3f}) consumed in {} after {:.3f}", self.env.now, packet.src, packet.pkt_no, packet.time, self.id(), (self.env.now - packet.time))
 
 
 
@@ -276,8 +371,11 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
     def incoming_server_metrics_packet(self, link_end, packet):
         """The process for a packet with type ServerMetric"""
 
-        if Verbose.level >= 0:
-            print("{:.3f}: {:5s} RECV_PACKET  ServerMetric {} {}.{} ({:.3f}) [{}.{}] MT({:.3f}) managed in {} after {:.3f}".format(self.env.now, self.id(), packet.operation, packet.src, packet.pkt_no, packet.time, packet.replica, packet.id, packet.msg_time, self.id(), (self.env.now - packet.time)))
+        if Trace.RECV_PACKET:
+            Trace.emit("RECV_PACKET", "{:.3f}: {:5s} RECV_PACKET  ServerMetric {} {}.{} ({:.3f}) [{}.{}] MT({:.3f}) managed in {} after {:.3f}", self.env.now, self.id(), packet.operation, packet.src, packet.pkt_no, packet.time, packet.replica, packet.id, packet.msg_time, self.id(), (self.env.now - packet.time))
+
+        if self.network != None and self.network.results != None:
+            self.network.results.control_message(self.env.now, self.id(), packet.replica, packet.id, packet.operation, True, packet.msg_time, self.env.now - packet.time)
 
         # collect incoming metrics table [servicename, replicaID, metrics (delay, load), original messageID, creation timestamp, last update timestamp, link_received, calculated utility]
         servicename = packet.service
@@ -288,9 +386,9 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         operation = ServerMetricMessageType.from_val(packet.operation)
 
 
-        if Verbose.level >= 1:
+        if Trace.INCOMING_VALUES:
             #print("{:.3f}: INCOMING_VALUES '{}' link_end: {} msgID: {} replica: {} time: {}  service: {} op: {} aggregate: {} metrics: {}".format(self.env.now, self.id(), str(link_end), msgID, replica, creationTime, servicename, operation, hasattr(packet,'aggregate'), metrics))
-            print("{:.3f}: {:5s} INCOMING_VALUES link_end: {} msgID: {} replica: {} time: {}  service: {} op: {} metrics: {}".format(self.env.now, self.id(), str(link_end), msgID, replica, creationTime, servicename, operation, metrics))
+            Trace.emit("INCOMING_VALUES", "{:.3f}: {:5s} INCOMING_VALUES link_end: {} msgID: {} replica: {} time: {}  service: {} op: {} metrics: {}", self.env.now, self.id(), str(link_end), msgID, replica, creationTime, servicename, operation, str(metrics))
 
         # add the delay of the last hop to the metrics
         metrics['delay'] +=  link_end.propagation_delay
@@ -300,8 +398,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         # in the forwarding table, for the replica then Drop the message
         valid_route = self.arrived_from_unicast_route(replica, link_end)
 
-        if Verbose.level >= 1:
-            print("{:.3f}: {:5s} UNICAST_ROUTE for {} from {} --> {} ".format(self.env.now, self.id(), replica, link_end.src_node.id(), 'VALID' if valid_route else 'INVALID'))
+        if Trace.UNICAST_ROUTE:
+            Trace.emit("UNICAST_ROUTE", "{:.3f}: {:5s} UNICAST_ROUTE for {} from {} --> {} ", self.env.now, self.id(), replica, link_end.src_node.id(), 'VALID' if valid_route else 'INVALID')
 
         if not valid_route:
             return
@@ -345,16 +443,16 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
 
             
             if system_available_capacity == 0:
-                if Verbose.level >= 1:
-                    print("SYSTEM_AVAILABLE_CAPACITY " + "'" + str(self.id()) + "'" + " == 0 announcement_distance 0")
+                if Trace.SYSTEM_AVAILABLE_CAPACITY:
+                    Trace.emit("SYSTEM_AVAILABLE_CAPACITY", "SYSTEM_AVAILABLE_CAPACITY '{}' == 0 announcement_distance 0", self.id())
                 announcement_distance = 0
             else:
                 announcement_distance =  (replica_available_capacity / system_available_capacity)  * (load_utility - average_load_utility + 1) * network_diameter 
 
 
-            if Verbose.level >= 1:
+            if Trace.ANNOUNCEMENT_DISTANCE:
                 # example:   381.000: POT   ANNOUNCEMENT_DISTANCE msgid: 24 replica: s4 msg time: 379.0  propagation_time: 2 load_utility(s4): 2.0 average_load_utility: 1.9 replica_capacity: 45 system_available_capacity: 232 announcement_distance: 1.494 
-                print("{:.3f}: {:5s} ANNOUNCEMENT_DISTANCE msgid: {} replica: {} msg time: {}  propagation_time: {} load_utility({}): {} average_load_utility: {} replica_capacity: {} system_available_capacity: {} announcement_distance: {} ".format(self.env.now, self.id(), msgID, replica, creationTime, round(propagation_time, 6), replica, load_utility, average_load_utility, replica_available_capacity, system_available_capacity,  round(announcement_distance, 3)))
+                Trace.emit("ANNOUNCEMENT_DISTANCE", "{:.3f}: {:5s} ANNOUNCEMENT_DISTANCE msgid: {} replica: {} msg time: {}  propagation_time: {} load_utility({}): {} average_load_utility: {} replica_capacity: {} system_available_capacity: {} announcement_distance: {} ", self.env.now, self.id(), msgID, replica, creationTime, round(propagation_time, 6), replica, load_utility, average_load_utility, replica_available_capacity, system_available_capacity,  round(announcement_distance, 3))
 
             # do the announcement
             self.incoming_server_metrics_packet_announce(link_end, packet)
@@ -381,12 +479,15 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         # marked for later use
         marked  = None
 
+        # the state for this service
+        partition = self.service_partition(servicename)
+
 
         # did the ServerMetric come from a direct neighbour Host
         if self.is_neighbour(replica):
             if self.is_neighbour_host(replica):
-                if Verbose.level >= 3:
-                    print("server_metrics_packet_announce: IS_NEIGHBOUR_HOST: " + replica + " " + str(operation))
+                if Trace.IS_NEIGHBOUR:
+                    Trace.emit("IS_NEIGHBOUR", "server_metrics_packet_announce: IS_NEIGHBOUR_HOST: {} {}", replica, operation)
 
                 # check if we are aggregating directly connected replicas
                 if self.aggregating_connected:
@@ -408,12 +509,12 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                     self.expose_replica_connected_capacity(packet)
 
             else:
-                if Verbose.level >= 3:
-                    print("server_metrics_packet_announce: IS_NEIGHBOUR: " + replica + " " + str(operation))
+                if Trace.IS_NEIGHBOUR:
+                    Trace.emit("IS_NEIGHBOUR", "server_metrics_packet_announce: IS_NEIGHBOUR: {} {}", replica, operation)
                     
         else:
-            if Verbose.level >= 3:
-                print("server_metrics_packet_announce: NOT_NEIGHBOUR: " + replica + " " + str(operation))
+            if Trace.IS_NEIGHBOUR:
+                Trace.emit("IS_NEIGHBOUR", "server_metrics_packet_announce: NOT_NEIGHBOUR: {} {}", replica, operation)
 
                 
             
@@ -425,57 +526,69 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         # 'replica' is key for decision for deleting old data
 
         # If there is an existing entry in the service RIB 
-        # so find entry from database for replica
-        searchR = Query()
-        results = self.service_RIB.search((searchR.replica == replica))
+        # so find entry from the RIB for replica
+        entry = partition.service_RIB.find_replica(replica)
+        results = [] if entry == None else [entry]
 
-        if Verbose.level >= 2:
-            print("{:.3f}: {:5s} METRIC_SEARCH_RESULTS link_end: {} replica: {} ==> {}".format(self.env.now, self.id(), link_end, replica, list(zip (map(lambda doc: doc.doc_id, results), results))))
+        if Trace.METRIC_SEARCH_RESULTS:
+            Trace.emit("METRIC_SEARCH_RESULTS", "{:.3f}: {:5s} METRIC_SEARCH_RESULTS link_end: {} replica: {} ==> {}", self.env.now, self.id(), link_end, replica, str(list(zip (map(lambda doc: doc.doc_id, results), results))))
         
         # check results
         # If there is NO existing entry in the service RIB
         if results == []:
             # nothing found - it must be new, so add it
-            val = self.service_RIB.insert({ 'replica': replica, 'neighbour': neighbour, 'link_end': str(link_end), 'msgID': msgID, 'servicename': servicename, 'creationTime': creationTime, 'load': int(metrics['load']), 'no_of_flows': int(metrics['no_of_flows']), 'delay': int(metrics['delay']), 'slots': metrics['slots']  })
+            val = partition.service_RIB.insert({ 'replica': replica, 'neighbour': neighbour, 'link_end': str(link_end), 'msgID': msgID, 'servicename': str(servicename), 'creationTime': creationTime, 'load': int(metrics['load']), 'no_of_flows': int(metrics['no_of_flows']), 'delay': int(metrics['delay']), 'slots': metrics['slots']  })
+
+            # add it to the skyline
+            partition.skyline.insert(partition.service_RIB.get(doc_id=val))
+
+            # and it needs a utility
+            partition.replica_heap.invalidate(partition.service_RIB.get(doc_id=val))
 
-            if Verbose.level >= 1:
-                print ("{:.3f}: {:5s} ADD_METRIC metric from {} as no {}".format(self.env.now, self.id(), replica, val) )
+            if Trace.ADD_METRIC:
+                Trace.emit("ADD_METRIC", "{:.3f}: {:5s} ADD_METRIC metric from {} as no {}", self.env.now, self.id(), replica, val)
 
         else:
             # something found in service_RIB
 
             # existing entry is newer than the incoming update
-            searchT = Query()
-            resultsT = self.service_RIB.search((searchT.replica == replica) & (searchT.creationTime > creationTime))
+            resultsT = [r for r in results if r['creationTime'] > creationTime]
 
             # check results
             if resultsT != []:
                 # we found an entry with a newer time
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} METRIC_TOO_OLD link_end: {} replica: {} ==> {}".format(self.env.now, self.id(), link_end, replica, list(zip (map(lambda doc: doc.doc_id, results), resultsT))))
+                if Trace.METRIC_TOO_OLD:
+                    Trace.emit("METRIC_TOO_OLD", "{:.3f}: {:5s} METRIC_TOO_OLD link_end: {} replica: {} ==> {}", self.env.now, self.id(), link_end, replica, str(list(zip (map(lambda doc: doc.doc_id, results), resultsT))))
                     
                 return
 
             # Update the metrics in the existing RIB entry
 
             # replica stay the same
+            # keep the old load and delay, to see if the utility changes
+            old_load_delay = (entry['load'], entry['delay'])
+
             # update other values
-            val = self.service_RIB.update({ 'neighbour': neighbour, 'link_end': str(link_end), 'msgID': msgID, 'servicename': servicename, 'creationTime': creationTime, 'load': int(metrics['load']), 'no_of_flows': int(metrics['no_of_flows']), 'delay': int(metrics['delay']), 'slots': metrics['slots'] } , doc_ids=[ r.doc_id for r in results ])
+            val = partition.service_RIB.update({ 'neighbour': neighbour, 'link_end': str(link_end), 'msgID': msgID, 'servicename': str(servicename), 'creationTime': creationTime, 'load': int(metrics['load']), 'no_of_flows': int(metrics['no_of_flows']), 'delay': int(metrics['delay']), 'slots': metrics['slots'] } , doc_ids=[ r.doc_id for r in results ])
+
+            # and check where it is in the skyline
+            partition.skyline.update(partition.service_RIB.get(doc_id=val[0]))
 
-            if Verbose.level >= 1:
-                print("{:.3f}: {:5s} UPDATE_METRIC metric no {} msgID: {} creationTime: {:.6f}  load: {} delay: {}".format(self.env.now, self.id(), val, msgID, creationTime, int(metrics['load']), int(metrics['delay']) ))
+            # the utility only changes if the load or delay changes
+            if old_load_delay != (entry['load'], entry['delay']):
+                partition.replica_heap.invalidate(entry)
+
+            if Trace.UPDATE_METRIC:
+                Trace.emit("UPDATE_METRIC", "{:.3f}: {:5s} UPDATE_METRIC metric no {} msgID: {} creationTime: {:.6f}  load: {} delay: {}", self.env.now, self.id(), val, msgID, creationTime, int(metrics['load']), int(metrics['delay']))
 
             # mark this doc_id, if in sent_table
             # val[0] is a doc_id
-            sent_query = Query()
-            sent_results = self.sent_table.search(sent_query.metric_doc_id == val[0])
-
-            if sent_results != []:
+            if self.sent_table.contains_metric(val[0]):
                 # it is in the sent_table
-                metric = self.service_RIB.get(doc_id=val[0])
+                metric = partition.service_RIB.get(doc_id=val[0])
                 marked = metric
-                if Verbose.level >= 2:
-                    print("{:.3f}: {:5s} MARK_METRIC {}".format(self.env.now, self.id(), metric['replica']))
+                if Trace.MARK_METRIC:
+                    Trace.emit("MARK_METRIC", "{:.3f}: {:5s} MARK_METRIC {}", self.env.now, self.id(), metric['replica'])
 
                 
         # STEP 5,11 forward to appropriate links based on routing information base (fix code below)
@@ -486,59 +599,50 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         # announce on all the links that it wasn't received from
 
 
-        if Verbose.level >= 1:
+        if Trace.METRIC_TABLE:
             self.print_metric_table()
 
         # ---- Announcement Decision Phase ----
 
-        #  decide the PBR entries to announce        
-        decide_pbr = self.decide_announcements(self.service_RIB.all())
-
-        if Verbose.level >= 1:
-            self.print_announce_info(decide_pbr)
+        # the PBR entries to announce are the skyline of the service_RIB
+        # which is kept up to date as the RIB changes, so we just get
+        # the entries which have joined or left it since the last decision
+        (joined, left) = partition.skyline.take_delta()
 
-        # Work out what to send from the PBR and the sent_table
+        if Trace.ANNOUNCE_TABLE:
+            self.print_announce_info(partition.skyline.all())
 
-        # First evaluate the metrics from the sent_table
-        
-        # get unique list of sent doc_ids
-        sent_doc_ids = list(set([s['metric_doc_id'] for s in self.sent_table]))
-        # sent is list of metrics
-        sent_set = [self.service_RIB.get(doc_id=d) for d in sent_doc_ids]
-
-        if sent_set:
-            if Verbose.level >= 3:
-                print("\t\t >>> sent_set " + str(len(sent_set)) + " " + str(sent_set))
+        # Work out what to send from the delta and the sent_table
 
-        # announce set are those in decide_pbr and not in sent
-        # plus the marked one, if it is in the decide_pbr
+        # announce set are those which joined the skyline and not in sent
+        # plus the marked one, if it is in the skyline
 
-        marked_set = [marked] if marked in decide_pbr else []
+        marked_set = [marked] if marked != None and partition.skyline.contains(marked) else []
 
         if marked_set:
-            if Verbose.level >= 3:
-                print("\t\t >>> marked_set " + str(len(marked_set)) + " " + str(marked_set))
+            if Trace.DECISION_SETS:
+                Trace.emit("DECISION_SETS", "\t\t >>> marked_set {} {}", len(marked_set), str(marked_set))
                 
-        announce_set = [m for m in decide_pbr if m.doc_id not in [ s.doc_id for s in sent_set ]] + marked_set
+        announce_set = [m for m in joined if not self.sent_table.contains_metric(m.doc_id)] + marked_set
 
 
         # use all of them and label announce entries to have message type Announce
         announce = list(zip(announce_set, itertools.repeat(ServerMetricMessageType.Announce)))
 
         if announce:
-            if Verbose.level >= 3:
-                print("\t\t >>> announce_set " + str(len(announce)) + " " + str(announce))
+            if Trace.DECISION_SETS:
+                Trace.emit("DECISION_SETS", "\t\t >>> announce_set {} {}", len(announce), str(announce))
 
 
-        # withdraw set are those in sent_table minus those in decide_pbr
-        withdraw_set = [s for s in sent_set if s.doc_id not in [ d.doc_id for d in decide_pbr ]]
+        # withdraw set are those which left the skyline and are in sent_table
+        withdraw_set = [m for m in left if self.sent_table.contains_metric(m.doc_id)]
         
         # label withdraw_set entries to have message type Withdraw
         withdraw = list(zip(withdraw_set, itertools.repeat(ServerMetricMessageType.Withdraw)))
                      
         if withdraw:
-            if Verbose.level >= 3:
-                print("\t\t>>> withdraw_set " + str(len(withdraw)) + " " + str(withdraw))
+            if Trace.DECISION_SETS:
+                Trace.emit("DECISION_SETS", "\t\t>>> withdraw_set {} {}", len(withdraw), str(withdraw))
             
 
         # if there is a metric in the marked_set
@@ -555,13 +659,13 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
             self.announce_metrics(announce + withdraw)
 
 
-        if Verbose.level >= 1:
+        if Trace.SENT_TABLE:
             self.print_sent_table()
 
 
         # STEP 6,12 check if fw table needs changing. If yes, change it. Choose the one with best utility function.
 
-        self.choose_best_forwarding_replica(self.service_RIB.all())
+        self.choose_best_forwarding_replica(partition)
 
         
 
@@ -577,23 +681,24 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
 
         # did the ServerMetric come from a direct neighbour
         if self.is_neighbour(replica):
-            if Verbose.level >= 2:
-                print("{:.3f}: {:5s} SERVER_METRICS_PACKET_WITHDRAW: IS_NEIGHBOUR: ".format(self.env.now, self.id(), replica))
+            if Trace.SERVER_METRICS_PACKET_WITHDRAW:
+                Trace.emit("SERVER_METRICS_PACKET_WITHDRAW", "{:.3f}: {:5s} SERVER_METRICS_PACKET_WITHDRAW: IS_NEIGHBOUR: ", self.env.now, self.id(), replica)
 
             # for neighbours we keep an aggregate of the connected capacity
             self.withdraw_connected_capacity(packet)
         else:
-            if Verbose.level >= 2:
-                print("{:.3f}: {:5s} SERVER_METRICS_PACKET_WITHDRAW: NOT_NEIGHBOUR: ".format(self.env.now, self.id(), replica))
+            if Trace.SERVER_METRICS_PACKET_WITHDRAW:
+                Trace.emit("SERVER_METRICS_PACKET_WITHDRAW", "{:.3f}: {:5s} SERVER_METRICS_PACKET_WITHDRAW: NOT_NEIGHBOUR: ", self.env.now, self.id(), replica)
             
 
         # withdrawal might have to go to neighbours too
         # should be in sent_table
 
         # If there is an existing entry in the service RIB 
-        # so find entry from database for replica
-        searchR = Query()
-        results = self.service_RIB.search((searchR.replica == replica))
+        # so find entry from the RIB for replica
+        partition = self.service_partition(servicename, create=False)
+        entry = None if partition == None else partition.service_RIB.find_replica(replica)
+        results = [] if entry == None else [entry]
 
         # check results
         # If there is NO existing entry in the service RIB
@@ -601,18 +706,17 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
             # nothing found - nothing to do
             pass
         else:
-            if Verbose.level >= 2:
-                print("{:.3f}: {:5s} WITHDRAW_SEARCH_RESULTS link_end: {} replica: {} ==> {}".format(self.env.now, self.id(), link_end, replica, list(zip (map(lambda doc: doc.doc_id, results), results))))
+            if Trace.WITHDRAW_SEARCH_RESULTS:
+                Trace.emit("WITHDRAW_SEARCH_RESULTS", "{:.3f}: {:5s} WITHDRAW_SEARCH_RESULTS link_end: {} replica: {} ==> {}", self.env.now, self.id(), link_end, replica, str(list(zip (map(lambda doc: doc.doc_id, results), results))))
 
             # there should only be 1 entry of relevance
             candidate = results[0]
 
             # now check the sent table
-            sent_query = Query()
-            sent_results = self.sent_table.search((sent_query.metric_doc_id == candidate.doc_id))
+            sent_neighbours = self.sent_table.neighbours_of(candidate.doc_id)
 
             # how many times did we find this doc_id in the sent_table
-            no_found_in_sent_table = len(sent_results)
+            no_found_in_sent_table = len(sent_neighbours)
 
             #self.print_sent_table()
 
@@ -620,32 +724,30 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
             if no_found_in_sent_table == 0:
                 # nothing in sent_table
                 # so no withdrawals sent on
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} SENT_TABLE_NOTHING in sent_table: for {}".format(self.env.now, self.id(), candidate.doc_id))
+                if Trace.SENT_TABLE_NOTHING:
+                    Trace.emit("SENT_TABLE_NOTHING", "{:.3f}: {:5s} SENT_TABLE_NOTHING in sent_table: for {}", self.env.now, self.id(), candidate.doc_id)
 
                 # now delete the candidate metric from the RIB
                 self.delete_rib_entry(candidate)
 
-                if Verbose.level >= 1:
+                if Trace.METRIC_TABLE:
                     self.print_metric_table()
             
             else:
                 # this metric is in the sent table
-                if Verbose.level >= 2:
-                    print("{:.3f}: {:5s} SENT_TABLE_FOUND {} in sent_table:  metric [{}] need to withdraw".format(self.env.now,  self.id(), no_found_in_sent_table, candidate.doc_id))
+                if Trace.SENT_TABLE_FOUND:
+                    Trace.emit("SENT_TABLE_FOUND", "{:.3f}: {:5s} SENT_TABLE_FOUND {} in sent_table:  metric [{}] need to withdraw", self.env.now,  self.id(), no_found_in_sent_table, candidate.doc_id)
 
             
                 # do we need any withdrawal announcements
-                for sent_entry in sent_results:
-                    #print("link_end = " + str(link_end) + " sent_entry = " + str(sent_entry))
-
-                    neighbour = sent_entry['neighbour']
+                for neighbour in sent_neighbours:
+                    #print("link_end = " + str(link_end) + " neighbour = " + str(neighbour))
 
                     # check link_end
                     if link_end.src_node.id() == neighbour:
                         # don't send to where it came from
-                        if Verbose.level >= 2:
-                            print("{:.3f}: {:5s} WITHDRAW_PACKET {}.{} dont send back to {} ".format(self.env.now, self.id(), packet.src, packet.pkt_no, link_end.src_node.id()))
+                        if Trace.WITHDRAW_PACKET:
+                            Trace.emit("WITHDRAW_PACKET", "{:.3f}: {:5s} WITHDRAW_PACKET {}.{} dont send back to {} ", self.env.now, self.id(), packet.src, packet.pkt_no, link_end.src_node.id())
                         pass
 
                     else:
@@ -655,8 +757,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                         self.pkt_no += 1
 
                         # forward the packet
-                        if Verbose.level >= 1:
-                            print("{:.3f}: {:5s} WITHDRAW_FORWARD {} to {}".format(self.env.now, self.id(), candidate['replica'], neighbour))
+                        if Trace.WITHDRAW_FORWARD:
+                            Trace.emit("WITHDRAW_FORWARD", "{:.3f}: {:5s} WITHDRAW_FORWARD {} to {}", self.env.now, self.id(), candidate['replica'], neighbour)
 
                         # send to relevant SwitchPort
                         self.outgoing_ports[neighbour].put(new_packet)
@@ -671,11 +773,11 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                 # now delete the candidate metric from the RIB
                 self.delete_rib_entry(candidate)
 
-                if Verbose.level >= 1:
+                if Trace.METRIC_TABLE:
                     self.print_metric_table()
 
-            if Verbose.level >= 2:
-                print("{:.3f}: {:5s} WITHDRAW_END".format(self.env.now, self.id()))
+            if Trace.WITHDRAW_END:
+                Trace.emit("WITHDRAW_END", "{:.3f}: {:5s} WITHDRAW_END", self.env.now, self.id())
         
 
     # the replica capacity only and expose to Network
@@ -711,8 +813,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
             self.connected_capacity_total["slots"] += entry["slots"]
             self.connected_capacity_total["capacity"] += entry["capacity"]
 
-        if Verbose.level >= 1:
-            print ("{:.3f}: CONNECTED_CAPACITY {} 'load': {}, 'no_of_flows': {}, 'slots': {}, 'capacity': {}".format(self.env.now, self.id(),  self.connected_capacity_total["load"],  self.connected_capacity_total["no_of_flows"],  self.connected_capacity_total["slots"], self.connected_capacity_total["capacity"]   ))
+        if Trace.CONNECTED_CAPACITY:
+            Trace.emit("CONNECTED_CAPACITY", "{:.3f}: CONNECTED_CAPACITY {} 'load': {}, 'no_of_flows': {}, 'slots': {}, 'capacity': {}", self.env.now, self.id(),  self.connected_capacity_total["load"],  self.connected_capacity_total["no_of_flows"],  self.connected_capacity_total["slots"], self.connected_capacity_total["capacity"])
 
         self.network.update_replica_capacity(self.id(), self.connected_capacity_total)
                                             
@@ -736,8 +838,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
             # 12/9/2023
             # is neighbour a directly connected host
             if self.is_neighbour_host(metric_to_send['replica']):
-                if Verbose.level >= 2:
-                    print("{:.3f}: {:5s} ANNOUNCE directly connected {}".format(self.env.now, self.id(), metric_to_send['replica']))
+                if Trace.ANNOUNCE:
+                    Trace.emit("ANNOUNCE", "{:.3f}: {:5s} ANNOUNCE directly connected {}", self.env.now, self.id(), metric_to_send['replica'])
 
                 # if we are doing aggregation, then use values from
                 # the metric_to_send in the connected_capacity table
@@ -752,8 +854,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                 #    metric_to_send['slots'] = self.connected_capacity_total['slots']
                 
             else:
-                if Verbose.level >= 2:
-                    print("{:.3f}: {:5s} ANNOUNCE NOT directly connected {}".format(self.env.now, self.id(), metric_to_send['replica']))
+                if Trace.ANNOUNCE:
+                    Trace.emit("ANNOUNCE", "{:.3f}: {:5s} ANNOUNCE NOT directly connected {}", self.env.now, self.id(), metric_to_send['replica'])
 
 
 
@@ -764,15 +866,15 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
 
                 if isinstance(self.outgoing_ports[neighbour].out.dst_node,  Host):
                     # don't send to any connected Hosts
-                    if Verbose.level >= 2:
-                        print("{:.3f}: {:5s} NOT_TO_HOST {} - metric no {}".format(self.env.now, self.id(), self.outgoing_ports[neighbour].out.dst_node, metric_to_send.doc_id))
+                    if Trace.NOT_TO_HOST:
+                        Trace.emit("NOT_TO_HOST", "{:.3f}: {:5s} NOT_TO_HOST {} - metric no {}", self.env.now, self.id(), self.outgoing_ports[neighbour].out.dst_node, metric_to_send.doc_id)
                     pass
 
 
                 elif metric_to_send['neighbour'] == str(neighbour):
                     # don't send to where it came from
-                    if Verbose.level >= 2:
-                        print("{:.3f}: {:5s} NO_RETURN to {} - metric no {}".format(self.env.now, self.id(), neighbour,  metric_to_send.doc_id))
+                    if Trace.NO_RETURN:
+                        Trace.emit("NO_RETURN", "{:.3f}: {:5s} NO_RETURN to {} - metric no {}", self.env.now, self.id(), neighbour,  metric_to_send.doc_id)
                     pass
 
                 else:
@@ -785,8 +887,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
 
                         if self.check_sent_table(metric_to_send, neighbour):
                             # this is in the sent table, so no need to send
-                            if Verbose.level >= 1:
-                                print ("{:.3f}: {:5s} ALREADY_IN_SENT_TABLE neighbour {} metric no {} msgID {}".format(self.env.now, self.id(), neighbour, metric_to_send.doc_id, metric_to_send['msgID']) )
+                            if Trace.ALREADY_IN_SENT_TABLE:
+                                Trace.emit("ALREADY_IN_SENT_TABLE", "{:.3f}: {:5s} ALREADY_IN_SENT_TABLE neighbour {} metric no {} msgID {}", self.env.now, self.id(), neighbour, metric_to_send.doc_id, metric_to_send['msgID'])
                                 pass
 
 
@@ -799,8 +901,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                             self.pkt_no += 1
 
                             # forward the packet
-                            if Verbose.level >= 1:
-                                print("{:.3f}: {:5s} FORWARD_METRIC {} to {}".format(self.env.now,  self.id(), metric_to_send.doc_id, neighbour))
+                            if Trace.FORWARD_METRIC:
+                                Trace.emit("FORWARD_METRIC", "{:.3f}: {:5s} FORWARD_METRIC {} to {}", self.env.now,  self.id(), metric_to_send.doc_id, neighbour)
 
                             # send to relevant SwitchPort
                             self.outgoing_ports[neighbour].put(new_packet)
@@ -822,16 +924,16 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                             self.pkt_no += 1
 
                             # forward the packet
-                            if Verbose.level >= 1:
-                                print("{:.3f}: {:5s} FORWARD_WITHDRAW to {}".format(self.env.now, self.id(), metric_to_send.doc_id, neighbour))
+                            if Trace.FORWARD_WITHDRAW:
+                                Trace.emit("FORWARD_WITHDRAW", "{:.3f}: {:5s} FORWARD_WITHDRAW to {}", self.env.now, self.id(), metric_to_send.doc_id, neighbour)
 
                             # send to relevant SwitchPort
                             self.outgoing_ports[neighbour].put(new_packet)
 
                         else:
                             # not in sent_table, so no need to send Withdraw
-                            if Verbose.level >= 1:
-                                print ("{:.3f}: {:5s} NOT_IN_SENT_TABLE neighbour {} metric no {} msgID {}".format(self.env.now, self.id(), neighbour, metric_to_send.doc_id, metric_to_send['msgID']) )
+                            if Trace.NOT_IN_SENT_TABLE:
+                                Trace.emit("NOT_IN_SENT_TABLE", "{:.3f}: {:5s} NOT_IN_SENT_TABLE neighbour {} metric no {} msgID {}", self.env.now, self.id(), neighbour, metric_to_send.doc_id, metric_to_send['msgID'])
 
                             pass
                     else:
@@ -843,8 +945,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                 self.clear_sent_table(metric_to_send.doc_id)
 
 
-        if Verbose.level >= 2:
-            print("{:.3f}: {:5s} ANNOUNCE_END".format(self.env.now, self.id()))
+        if Trace.ANNOUNCE_END:
+            Trace.emit("ANNOUNCE_END", "{:.3f}: {:5s} ANNOUNCE_END", self.env.now, self.id())
 
         
     # Create a new packet from a metric
@@ -916,8 +1018,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
             better[index_m] = self.metric_is_better(i[m], j[m], fn)
 
             
-            if Verbose.level == 4:
-                print("metric_is_better = " + str(better[index_m]) + " for " + "i["+ m + "] and j[" + m + "]")
+            if Trace.METRIC_IS_BETTER:
+                Trace.emit("METRIC_IS_BETTER", "metric_is_better = {} for i[{}] and j[{}]", better[index_m], m, m)
 
         # return value
         if all(v == Compare.Same for v in better):            # ALL the Same
@@ -931,59 +1033,18 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
 
 
     # decide the entries to announce, given a set of entries
+    # these are the entries which are not dominated by any other entry
+    # in all metrics, i.e. the Pareto skyline of the entries
     def decide_announcements(self, entries):
-        if len(entries) == 1:
-            return [entries[0]]
-
-        else:
-            # the list of things to announce
-            announce = [False for i in entries]
+        announce = self.skyline.compute(entries)
 
-            # skip through all entries - outer loop
-            for index_i, i in enumerate(entries):
-
-                # label i as True
-                announce[index_i] = True
-                
-                # skip through all entries - inner loop
-                for index_j, j in enumerate(entries):
+        # at this point announce has all the entries to announce
+        # as a True or False for each entry
+        if Trace.DECIDE_ANNOUNCEMENTS:
+            kept = set(map(id, announce))
+            Trace.emit("DECIDE_ANNOUNCEMENTS", "announce: {}", str([ id(entry) in kept for entry in entries ]))
 
-                    # no need to do the diagonal
-                    if index_i != index_j:
-
-                        # is j better than i
-                        better_j_i = self.is_better_in_any_metrics(j,i) 
-
-                        if better_j_i == Compare.Better: # j is better than i in at least 1 metrics 
-                            # so we don't need i anymore
-                            announce[index_i] = False
-
-                            if Verbose.level == 3:
-                                print("Compare.Better: j_{} is better than i_{}: {} {}".format(index_j, index_i, self.displayMetrics('j: ', j), self.displayMetrics('i: ', i)))
-                        
-                            break
-
-                        elif better_j_i == Compare.Same: # j is same in all metrics
-
-                            # so we don't need j
-                            announce[index_j] = False
-                            
-                            if Verbose.level == 3:
-                                print("Compare.Same: j_{} is same as i_{}: {} {}".format(index_j, index_i, self.displayMetrics('j: ', j), self.displayMetrics('i: ', i)))
-
-
-                        else:
-                            # we keep i
-                            if Verbose.level == 3:
-                                print("Compare.Worse: j_{} is not better than i_{}: {} {}".format(index_j, index_i, self.displayMetrics('j: ', j), self.displayMetrics('i: ', i)))
-                        
-
-            # at this point the announce list should have a True for all the entries to announce
-            if Verbose.level == 3:
-                print("announce: {}".format(announce))
-
-            # select those entries which are laballed as True in announce
-            return [ entry for ann, entry in zip(announce, entries) if ann == True ]
+        return announce
 
     # is the newly arrived metrics worse 
     def check_metrics_worse(self, metrics, doc):
@@ -994,20 +1055,17 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         if better_j_i == Compare.Worse:
             # it looks worse
 
-            if Verbose.level >= 2:
-                print("{:.3f}: check_worse_metrics {} metric [{}] --> {}".format(self.env.now, str(better_j_i), doc.doc_id, doc))
+            if Trace.CHECK_WORSE_METRICS:
+                Trace.emit("CHECK_WORSE_METRICS", "{:.3f}: check_worse_metrics {} metric [{}] --> {}", self.env.now, str(better_j_i), doc.doc_id, doc)
 
             # now check the sent table
-            sent_query = Query()
-            sent_results = self.sent_table.search((sent_query.metric_doc_id == doc.doc_id))
-
             # how many times did we find this doc_id in the sent_table
-            no_found_in_sent_table = len(sent_results)
+            no_found_in_sent_table = len(self.sent_table.neighbours_of(doc.doc_id))
 
             if no_found_in_sent_table > 0:
                 # this metric is in the sent table
-                if Verbose.level >= 2:
-                    print("{:.3f}: is in sent_table: metric [{}] need to resend".format(self.env.now, doc.doc_id))
+                if Trace.CHECK_WORSE_METRICS:
+                    Trace.emit("CHECK_WORSE_METRICS", "{:.3f}: is in sent_table: metric [{}] need to resend", self.env.now, doc.doc_id)
 
             # return the doc_id of the metric (so it can be found later)
             # and how many times it was found
@@ -1028,10 +1086,23 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
     # Call the forwarding_utility_fn
     # which is usually set as a lambda in forwarding_utility_fn
     def call_forwarding_utility(self, alpha, load, delay):
-        return Utility.forwarding_utility_fn(alpha, load, delay)
+        return Utility.forwarding_utility(alpha, load, delay)
+
+    # Call the forwarding_utility_fn for a list of RIB entries
+    # returns a list of utilities
+    def call_forwarding_utilities(self, alpha, entries):
+        if len(entries) == 1:
+            entry = entries[0]
+            return [ self.call_forwarding_utility(alpha, entry['load'], entry['delay']) ]
+        else:
+            loads = [ entry['load'] for entry in entries ]
+            delays = [ entry['delay'] for entry in entries ]
+
+            return Utility.forwarding_utility_values(alpha, loads, delays).tolist()
 
     #  Check if fw table needs changing
-    def choose_best_forwarding_replica(self, entries):
+    # for the replicas of one service, held in a ServicePartition
+    def choose_best_forwarding_replica(self, partition):
         # best_utility=Infinity
         # best replica=1
         # for all replicas i
@@ -1041,43 +1112,46 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         #     best_utility=utility(i)
         # point fw entry to best replica's announced link end
 
-        if Verbose.level >= 2:
-            print ("{:.3f}: {:5s} CHOOSE_BEST_FORWARDING_REPLICA: current best {} utility {}".format(self.env.now, self.id(), self.best_replica, self.best_utility))
+        if Trace.CHOOSE_BEST_FORWARDING_REPLICA:
+            Trace.emit("CHOOSE_BEST_FORWARDING_REPLICA", "{:.3f}: {:5s} CHOOSE_BEST_FORWARDING_REPLICA: current best {} utility {}", self.env.now, self.id(), partition.best_replica, partition.best_utility)
 
-        old_best_replica = self.best_replica
-        old_best_utility = self.best_utility
+        old_best_replica = partition.best_replica
+        old_best_utility = partition.best_utility
 
-        this_best_replica = None
-        this_best_neighbour = None
-        this_best_utility = -1
-        this_servicename = None
+        # recalculate the utility of the entries which have changed
+        # and get the one with the highest utility
+        heap = partition.replica_heap
+        heap.refresh(lambda entries: self.call_forwarding_utilities(Utility.alpha, entries))
 
-        # create a list of utility values
-        utility = [-1 for e in entries]
+        (best_entry, best_utility) = heap.best()
 
-        for entry_no, entry in enumerate(entries):
-            utility_i = self.call_forwarding_utility(Utility.alpha, entry['load'], entry['delay'])
-            utility[entry_no] = utility_i
+        if best_entry != None and best_utility > -1:
+            this_best_replica = best_entry['replica']
+            this_best_neighbour = best_entry['neighbour']
+            this_best_utility = best_utility
+        else:
+            this_best_replica = None
+            this_best_neighbour = None
+            this_best_utility = -1
 
-            if Verbose.level >= 2:
-                print ("\t\t{:2d}. neighbour: {} utility_i: {}".format(entry_no, entry['neighbour'], utility_i))
+        # patch up the utility of the old_best_replica
+        # with the current utility value, if it would have been
+        # the best so far when scanning the entries in order
+        old_best_entry = None if old_best_replica == None else partition.service_RIB.find_replica(old_best_replica)
 
+        if old_best_entry != None and heap.utility_of(old_best_entry) > -1 and heap.is_leading(old_best_entry):
+            old_best_utility = heap.utility_of(old_best_entry)
 
-            # is utility of this entry > current best utility 
-            if (utility_i > this_best_utility):
-                # update best replica data
-                this_best_replica = entry['replica']
-                this_best_neighbour = entry['neighbour']
-                this_servicename = entry['servicename']
-                this_best_utility = utility_i
+        if Trace.UTILITY_TABLE or Trace.UTILITY_NEIGHBOURS:
+            entries = partition.service_RIB.all()
+            utility = [heap.utility_of(entry) for entry in entries]
 
-                # patch up the utility of the old_best_replica
-                # with the current utility value
-                if  this_best_replica == old_best_replica:
-                    old_best_utility = this_best_utility
+            if Trace.UTILITY_NEIGHBOURS:
+                for entry_no, entry in enumerate(entries):
+                    Trace.emit("UTILITY_NEIGHBOURS", "\t\t{:2d}. neighbour: {} utility_i: {}", entry_no, entry['neighbour'], utility[entry_no])
 
-        if Verbose.level >= 1:
-            self.print_utility_info(entries, utility)
+            if Trace.UTILITY_TABLE:
+                self.print_utility_info(entries, utility)
 
 
 
@@ -1100,79 +1174,76 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
             if (diff == 0):
                 # no change, do nothing
 
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {} to {}".format(self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, "", "0", "", " do not change ", old_best_replica, this_best_replica ))
+                if Trace.CHOOSE_BEST_REPLICA:
+                    Trace.emit("CHOOSE_BEST_REPLICA", "{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {} to {}", self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, "", "0", "", " do not change ", old_best_replica, this_best_replica)
 
             elif (diff < Router.forwarding_utility_change_factor):
                 # Compare diff to Router.forwarding_utility_change_factor
                 # change is too small, do nothing
                 
-                if Verbose.level >= 1:
-                    print("{:.3f}:{:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {} to {}".format(self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, "<", Router.forwarding_utility_change_factor, " do not change ", old_best_replica, this_best_replica ))
+                if Trace.CHOOSE_BEST_REPLICA:
+                    Trace.emit("CHOOSE_BEST_REPLICA", "{:.3f}:{:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {} to {}", self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, "<", Router.forwarding_utility_change_factor, " do not change ", old_best_replica, this_best_replica)
 
             else:
                 # diff > Router.forwarding_utility_change_factor
                 # change replica
 
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {} to {}".format(self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, ">", Router.forwarding_utility_change_factor, " change ", old_best_replica, this_best_replica ))
+                if Trace.CHOOSE_BEST_REPLICA:
+                    Trace.emit("CHOOSE_BEST_REPLICA", "{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {} to {}", self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, ">", Router.forwarding_utility_change_factor, " change ", old_best_replica, this_best_replica)
 
-                self.best_replica = this_best_replica
-                self.best_neighbour = this_best_neighbour
-                self.servicename = this_servicename 
-                self.best_utility = this_best_utility
+                partition.best_replica = this_best_replica
+                partition.best_neighbour = this_best_neighbour
+                partition.best_utility = this_best_utility
         else:
             # same replica - maype update values for this replica
 
             if (diff == 0):
                 # no change, do nothing
 
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {}".format(self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, "", "0", "", " do not update ", old_best_replica ))
+                if Trace.CHOOSE_BEST_REPLICA:
+                    Trace.emit("CHOOSE_BEST_REPLICA", "{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {}", self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, "", "0", "", " do not update ", old_best_replica)
 
             elif (diff < Router.forwarding_utility_change_factor):
                 # change is too small, do nothing
 
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {}".format(self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, "<", Router.forwarding_utility_change_factor, " do not update ", old_best_replica ))
+                if Trace.CHOOSE_BEST_REPLICA:
+                    Trace.emit("CHOOSE_BEST_REPLICA", "{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {}", self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, "<", Router.forwarding_utility_change_factor, " do not update ", old_best_replica)
 
 
             else:
                 # update utility for this replica
                 
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {}".format(self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, ">", Router.forwarding_utility_change_factor, " update ", old_best_replica ))
+                if Trace.CHOOSE_BEST_REPLICA:
+                    Trace.emit("CHOOSE_BEST_REPLICA", "{:.3f}: {:5s} CHOOSE_BEST_REPLICA: U_old({}, {}) U_new({}, {}) diff({} {} {}) {} {}", self.env.now, self.id(), old_best_utility, old_best_replica, this_best_utility, this_best_replica, diff, ">", Router.forwarding_utility_change_factor, " update ", old_best_replica)
 
 
-                self.best_utility = this_best_utility
+                partition.best_utility = this_best_utility
 
 
 
-        if Verbose.level >= 1:
+        if Trace.BEST_REPLICA:
 
-            # print ("old_best_replica " + str(old_best_replica) + " self.best_replica " + str(self.best_replica) + " self.best_neighbour " + str(self.best_neighbour))
+            # print ("old_best_replica " + str(old_best_replica) + " partition.best_replica " + str(partition.best_replica) + " partition.best_neighbour " + str(partition.best_neighbour))
             
-            if self.best_replica == self.best_neighbour:
-                if Verbose.level >= 1:
-                    if old_best_replica == None:
-                        print("{:.3f}: {:5s} {}BEST_REPLICA {} direct ".format(self.env.now, self.id(), ("SET_" if old_best_replica != self.best_replica else ""), self.best_replica))
-                    else:
-                        print("{:.3f}: {:5s} {}BEST_REPLICA {} direct ".format(self.env.now, self.id(), ("CHANGED_" if old_best_replica != self.best_replica else "KEEP_"), self.best_replica))
+            if partition.best_replica == partition.best_neighbour:
+                if old_best_replica == None:
+                    Trace.emit("BEST_REPLICA", "{:.3f}: {:5s} {}BEST_REPLICA {} direct ", self.env.now, self.id(), ("SET_" if old_best_replica != partition.best_replica else ""), partition.best_replica)
+                else:
+                    Trace.emit("BEST_REPLICA", "{:.3f}: {:5s} {}BEST_REPLICA {} direct ", self.env.now, self.id(), ("CHANGED_" if old_best_replica != partition.best_replica else "KEEP_"), partition.best_replica)
             else:
-                if Verbose.level >= 1:
-                    if old_best_replica == None:
-                        print("{:.3f}: {:5s} {}BEST_REPLICA {} via best neighbour {} ".format(self.env.now, self.id(), ("SET_" if old_best_replica != self.best_replica else ""), self.best_replica, self.best_neighbour))
-                    else:
-                        print("{:.3f}: {:5s} {}BEST_REPLICA {} via best neighbour {} ".format(self.env.now, self.id(), ("CHANGED_" if old_best_replica != self.best_replica else "KEEP_"), self.best_replica, self.best_neighbour))
+                if old_best_replica == None:
+                    Trace.emit("BEST_REPLICA", "{:.3f}: {:5s} {}BEST_REPLICA {} via best neighbour {} ", self.env.now, self.id(), ("SET_" if old_best_replica != partition.best_replica else ""), partition.best_replica, partition.best_neighbour)
+                else:
+                    Trace.emit("BEST_REPLICA", "{:.3f}: {:5s} {}BEST_REPLICA {} via best neighbour {} ", self.env.now, self.id(), ("CHANGED_" if old_best_replica != partition.best_replica else "KEEP_"), partition.best_replica, partition.best_neighbour)
 
         # update best_neighbour for servicename
-        self.service_forwarding_table[self.servicename] =  self.best_neighbour
+        self.service_forwarding_table[partition.servicename] =  partition.best_neighbour
 
-        if Verbose.level >= 1:
-            print("{:.3f}: {:5s} SERVICE_FORWARDING_TABLE {}".format(self.env.now, self.id(), self.service_forwarding_table))
+        if Trace.SERVICE_FORWARDING_TABLE:
+            Trace.emit("SERVICE_FORWARDING_TABLE", "{:.3f}: {:5s} SERVICE_FORWARDING_TABLE {}", self.env.now, self.id(), str(self.service_forwarding_table))
 
 
-    # Work out utility difference from self.best_utility
+    # Work out utility difference from the best_utility
     def calculate_utility_difference(self, utility, best_utility):
         diff = utility - best_utility 
 
@@ -1182,8 +1253,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
     def client_request_packet(self, link_end, packet):
         """A Client has sent a request"""
 
-        if Verbose.level >= 0:
-            print("{:.3f}: {:5s} RECV_PACKET ClientRequest {}.{} ({:.3f}) [{}.{}]  for service {} pkt: {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.pkt_no, packet.time, packet.src, packet.id, packet.dst, packet.id, (self.env.now - packet.time)))
+        if Trace.RECV_PACKET:
+            Trace.emit("RECV_PACKET", "{:.3f}: {:5s} RECV_PACKET ClientRequest {}.{} ({:.3f}) [{}.{}]  for service {} pkt: {} after {:.3f}", self.env.now, self.id(), packet.src, packet.pkt_no, packet.time, packet.src, packet.id, packet.dst, packet.id, (self.env.now - packet.time))
 
         # Destination is likely to be a service name: e.g. §a
         service_name = packet.dst
@@ -1191,25 +1262,25 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         # Check if we know that service name
         if not service_name in self.service_forwarding_table:
             # service_name isn't in service_forwarding_table
-            if Verbose.level >= 1:
-                print("{:.3f}: {:5s} NO_SERVICE_FORWARDING_TABLE_ENTRY ClientRequest for service {} pkt: {}.{}".format(self.env.now, self.id(), packet.dst, packet.src, packet.pkt_no))
+            if Trace.NO_SERVICE_FORWARDING_TABLE_ENTRY:
+                Trace.emit("NO_SERVICE_FORWARDING_TABLE_ENTRY", "{:.3f}: {:5s} NO_SERVICE_FORWARDING_TABLE_ENTRY ClientRequest for service {} pkt: {}.{}", self.env.now, self.id(), packet.dst, packet.src, packet.pkt_no)
 
         else:
             # First we look up the service name
             neighbour = self.service_forwarding_table[service_name]
 
-            if Verbose.level >= 2:
-                print ("{:.3f}: {:5s} CLIENT_REQUEST_NEIGHBOUR ClientRequest  {}.{} = {}".format(self.env.now, self.id(), packet.src, packet.pkt_no, neighbour))
+            if Trace.CLIENT_REQUEST_NEIGHBOUR:
+                Trace.emit("CLIENT_REQUEST_NEIGHBOUR", "{:.3f}: {:5s} CLIENT_REQUEST_NEIGHBOUR ClientRequest  {}.{} = {}", self.env.now, self.id(), packet.src, packet.pkt_no, neighbour)
 
             if neighbour == None:
                 # service_name is in service_forwarding_table, but has no value
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} NO_VALUE_FOR SERVICE_FORWARDING_TABLE ENTRY ClientRequest for service {} pkt: {}".format(self.env.now, self.id(), packet.dst, packet.id))
+                if Trace.NO_VALUE_FOR:
+                    Trace.emit("NO_VALUE_FOR", "{:.3f}: {:5s} NO_VALUE_FOR SERVICE_FORWARDING_TABLE ENTRY ClientRequest for service {} pkt: {}", self.env.now, self.id(), packet.dst, packet.id)
             else:
                 # value is link_end
                 # so forwarding the packet
-                if Verbose.level >= 1:
-                    print("{:.3f}: {:5s} FORWARD_PACKET ClientRequest for service {} pkt: {} send to neighbour {}".format(self.env.now, self.id(), packet.dst, packet.id, neighbour))
+                if Trace.FORWARD_PACKET:
+                    Trace.emit("FORWARD_PACKET", "{:.3f}: {:5s} FORWARD_PACKET ClientRequest for service {} pkt: {} send to neighbour {}", self.env.now, self.id(), packet.dst, packet.id, neighbour)
 
                 self.outgoing_ports[neighbour].put(packet)                
 
@@ -1218,8 +1289,8 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         
         if packet.dst == None:
             # dont forward to None
-            if Verbose.level >= 2:
-                print("{:.3f}: PACKET {}.{} for {} NO forward from {} to {} after {:.3f}".format(self.env.now, packet.src, packet.pkt_no, packet.dst, self.id(), packet.dst, (self.env.now - packet.time)))
+            if Trace.PACKET_NOT_FORWARDED:
+                Trace.emit("PACKET_NOT_FORWARDED", "{:.3f}: PACKET {}.{} for {} NO forward from {} to {} after {:.3f}", self.env.now, packet.src, packet.pkt_no, packet.dst, self.id(), packet.dst, (self.env.now - packet.time))
 
         else:
             # forward the packet using unicast_forwarding_table
@@ -1233,30 +1304,30 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
                 
                 if link_end.src_node.id() == neighbour:
                     # don't send to where it came from
-                    if Verbose.level >= 2:
-                        print("{:.3f}: PACKET {}.{} dont send back from {} to {} after {:.3f}".format(self.env.now, packet.src, packet.pkt_no, self.id(), link_end.src_node.id(), (self.env.now - packet.time)))
+                    if Trace.PACKET_NOT_FORWARDED:
+                        Trace.emit("PACKET_NOT_FORWARDED", "{:.3f}: PACKET {}.{} dont send back from {} to {} after {:.3f}", self.env.now, packet.src, packet.pkt_no, self.id(), link_end.src_node.id(), (self.env.now - packet.time))
 
 
                 elif isinstance(self.outgoing_ports[neighbour].out.dst_node,  Host):
                     # don't send to any connected Hosts
-                    if Verbose.level >= 2:
-                        print("{:.3f}: PACKET {}.{} dont send to host from {} to {} after {:.3f}".format(self.env.now, packet.src, packet.pkt_no, self.id(), self.outgoing_ports[neighbour].out.dst_node.id(), (self.env.now - packet.time)))
+                    if Trace.PACKET_NOT_FORWARDED:
+                        Trace.emit("PACKET_NOT_FORWARDED", "{:.3f}: PACKET {}.{} dont send to host from {} to {} after {:.3f}", self.env.now, packet.src, packet.pkt_no, self.id(), self.outgoing_ports[neighbour].out.dst_node.id(), (self.env.now - packet.time))
 
                 else:
                     # forward the packet
                     # send to SwitchPort
                     self.outgoing_ports[neighbour].put(packet)
 
-                    if Verbose.level >= 1:
-                        print("{:.3f}: PACKET {}.{} for {} forwarded from {} to {} after {:.3f}".format(self.env.now, packet.src, packet.pkt_no, packet.dst, self.id(), neighbour, (self.env.now - packet.time)))
+                    if Trace.PACKET_FORWARDED:
+                        Trace.emit("PACKET_FORWARDED", "{:.3f}: PACKET {}.{} for {} forwarded from {} to {} after {:.3f}", self.env.now, packet.src, packet.pkt_no, packet.dst, self.id(), neighbour, (self.env.now - packet.time))
 
 
             else:
                 # not in unicast_forwarding_table
-                if Verbose.level >= 1:
-                    print("{:.3f}: PACKET {}.{} for {} FAILURE at {} ".format(self.env.now, packet.src, packet.pkt_no, packet.dst, self.id()))
+                if Trace.PACKET_FAILURE:
+                    Trace.emit("PACKET_FAILURE", "{:.3f}: PACKET {}.{} for {} FAILURE at {} ", self.env.now, packet.src, packet.pkt_no, packet.dst, self.id())
 
-                    print(str(self.unicast_forwarding_table))
+                    Trace.emit("PACKET_FAILURE", str(self.unicast_forwarding_table))
         
 
 
@@ -1273,44 +1344,37 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         #print ("check_sent_table: " + neighbour + " ==> " + str(metric_to_send))
         
         # find entry from sent_table for (doc_id in service_RIB, neighbour)
-        sent_query = Query()
-        sent_results = self.sent_table.search((sent_query.metric_doc_id == metric_to_send.doc_id) & (sent_query.neighbour == neighbour))
-
-        return sent_results
+        return self.sent_table.contains(metric_to_send.doc_id, neighbour)
 
     # delete a RIB entry
     def delete_rib_entry(self, metric):
         # If there is an existing entry in the service RIB 
-        # so find entry from database for replica
-        searchR = Query()
-
-        # and remove it
-        self.service_RIB.remove((searchR.replica == metric['replica']))
-        if Verbose.level >= 1:
-            print ("{:.3f}: {:5s} REMOVE_METRIC metric no {}".format(self.env.now, self.id(), metric) )
+        # for the replica, remove it
+        partition = self.service_partition(metric['servicename'], create=False)
+
+        if partition != None:
+            removed = partition.service_RIB.remove_replica(metric['replica'])
+
+            # and take it out of the skyline and the replica heap
+            if removed != None:
+                partition.skyline.remove(removed)
+                partition.replica_heap.remove(removed)
+        if Trace.REMOVE_METRIC:
+            Trace.emit("REMOVE_METRIC", "{:.3f}: {:5s} REMOVE_METRIC metric no {}", self.env.now, self.id(), metric)
         
     # update the sent table
     def update_sent_table(self, metric_to_send, neighbour):
         # add info about the transmission to the sent_table
-        # find entry from sent_table for (doc_id in service_RIB, neighbour)
-        sent_query = Query()
-        sent_results = self.sent_table.search((sent_query.metric_doc_id == metric_to_send.doc_id) & (sent_query.neighbour == neighbour))
-
-        #if Verbose.level >= 1:
-        #    print("{:.3f}: {:5s} SENT_TABLE_SEARCH  ==> {} ".format(self.env.now, self.id(), sent_results))
-            
-        # check results
-        if sent_results == []:
-            # nothing found - it must be new, so add it
-            val = self.sent_table.insert({'metric_doc_id': metric_to_send.doc_id, 'neighbour': neighbour })
-
-            if Verbose.level >= 1:
-                print ("{:.3f}: {:5s} ADD_SENT_TABLE metric no {} neighbour {}".format(self.env.now, self.id(), metric_to_send.doc_id, neighbour) )
+        # if (doc_id in service_RIB, neighbour) is not in the sent_table
+        # it must be new, so add it
+        if self.sent_table.insert(metric_to_send.doc_id, neighbour):
+            if Trace.ADD_SENT_TABLE:
+                Trace.emit("ADD_SENT_TABLE", "{:.3f}: {:5s} ADD_SENT_TABLE metric no {} neighbour {}", self.env.now, self.id(), metric_to_send.doc_id, neighbour)
 
         else:
             # update the table
-            if Verbose.level >= 1:
-                print ("{:.3f}: {:5s} UPDATE_SENT_TABLE metric no {} neighbour {}".format(self.env.now, self.id(), metric_to_send.doc_id, neighbour) )
+            if Trace.UPDATE_SENT_TABLE:
+                Trace.emit("UPDATE_SENT_TABLE", "{:.3f}: {:5s} UPDATE_SENT_TABLE metric no {} neighbour {}", self.env.now, self.id(), metric_to_send.doc_id, neighbour)
 
 
 
@@ -1318,45 +1382,34 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
     def clear_sent_table(self, metric_doc_id):
         """Clear entries in sent table with 'metric_doc_id'"""
         
-        if Verbose.level >= 1:
-            print ("{:.3f}: {:5s} CLEAR_SENT_TABLE metric no {}".format(self.env.now, self.id(), metric_doc_id) )
-
-        before = len(self.sent_table)
-        # print("size before = " + str(before))
+        if Trace.CLEAR_SENT_TABLE:
+            Trace.emit("CLEAR_SENT_TABLE", "{:.3f}: {:5s} CLEAR_SENT_TABLE metric no {}", self.env.now, self.id(), metric_doc_id)
 
-        sent_query = Query()
-        sent_results = self.sent_table.search((sent_query.metric_doc_id == metric_doc_id))
-
-        found = len(sent_results)
+        found = self.sent_table.clear(metric_doc_id)
         # print("found = " + str(found))
 
-        self.sent_table.remove((sent_query.metric_doc_id == metric_doc_id))
-
-        after = len(self.sent_table)
-        # print("size after = " + str(after))
-
     # Print metric table
     def print_metric_table(self):
         if Verbose.table == 0:
             pass
         elif Verbose.table == 1:
-            print("{:.3f}: {:5s} METRIC_TABLE {}".format(self.env.now, self.id(), str(self.service_RIB.all())))
+            Trace.emit("METRIC_TABLE", "{:.3f}: {:5s} METRIC_TABLE {}", self.env.now, self.id(), str(self.rib_entries()))
         else:
-            print("{:.3f}: {:5s} METRIC_TABLE".format(self.env.now, self.id()))
-            for metric_no, metric in enumerate(self.service_RIB.all()):
-                print("\t\t{:2d}. doc_id({:d})  {}".format(metric_no+1, metric.doc_id, metric))
+            Trace.emit("METRIC_TABLE", "{:.3f}: {:5s} METRIC_TABLE", self.env.now, self.id())
+            for metric_no, metric in enumerate(self.rib_entries()):
+                Trace.emit("METRIC_TABLE", "\t\t{:2d}. doc_id({:d})  {}", metric_no+1, metric.doc_id, str(metric))
 
 
     def print_sent_table(self):
         if Verbose.table == 0:
             pass
         elif Verbose.table == 1:
-            print("{:.3f}: {:5s} SENT_TABLE {}".format(self.env.now, self.id(), str(self.sent_table.all())))
+            Trace.emit("SENT_TABLE", "{:.3f}: {:5s} SENT_TABLE {}", self.env.now, self.id(), str(self.sent_table.all()))
         else:
-            print("{:.3f}: {:5s} SENT_TABLE".format(self.env.now, self.id()))
+            Trace.emit("SENT_TABLE", "{:.3f}: {:5s} SENT_TABLE", self.env.now, self.id())
             for entry_no, entry in enumerate(self.sent_table.all()):
-                metric = self.service_RIB.get(doc_id=entry['metric_doc_id'])
-                print("\t\t{:2d}. replica: {} {}".format(entry_no+1, metric['replica'], entry))
+                metric = self.rib_entry(entry['metric_doc_id'])
+                Trace.emit("SENT_TABLE", "\t\t{:2d}. replica: {} {}", entry_no+1, metric['replica'], str(entry))
 
 
     # Print utility info
@@ -1364,11 +1417,11 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         if Verbose.table == 0:
             pass
         elif Verbose.table == 1:
-            print ("{:.3f}: {:5s} UTILITY {} = {} ".format(self.env.now, self.id(), len(entries), list(zip (utility, map(lambda doc: "metric: {} load: {} delay: {} replica: {} neighbour: {}".format(doc.doc_id,  doc['load'], doc['delay'], doc['replica'], doc['neighbour']), entries)))))
+            Trace.emit("UTILITY_TABLE", "{:.3f}: {:5s} UTILITY {} = {} ", self.env.now, self.id(), len(entries), str(list(zip (utility, map(lambda doc: "metric: {} load: {} delay: {} replica: {} neighbour: {}".format(doc.doc_id,  doc['load'], doc['delay'], doc['replica'], doc['neighbour']), entries)))))
         else:
-            print ("{:.3f}: {:5s} UTILITY {}".format(self.env.now, self.id(), len(entries)))
+            Trace.emit("UTILITY_TABLE", "{:.3f}: {:5s} UTILITY {}", self.env.now, self.id(), len(entries))
             for entry_no, entry in enumerate(entries):
-                print("\t\t{:2d}.  doc_id({:2d})  U({:.3f})  {}".format(entry_no+1, entry.doc_id, utility[entry_no], entry))
+                Trace.emit("UTILITY_TABLE", "\t\t{:2d}.  doc_id({:2d})  U({:.3f})  {}", entry_no+1, entry.doc_id, utility[entry_no], str(entry))
 
 
     # Print announce info
@@ -1376,12 +1429,48 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         if Verbose.table == 0:
             pass
         elif Verbose.table == 1:
-            print("{:.3f}: {:5s} ANNOUNCE {} / {}".format(self.env.now, self.id(), len(announce), list(zip (map(lambda doc: doc.doc_id, announce), announce))))
+            Trace.emit("ANNOUNCE_TABLE", "{:.3f}: {:5s} ANNOUNCE {} / {}", self.env.now, self.id(), len(announce), str(list(zip (map(lambda doc: doc.doc_id, announce), announce))))
         else:
-            print("{:.3f}: {:5s} ANNOUNCE count {}".format(self.env.now, self.id(), len(announce)))
+            Trace.emit("ANNOUNCE_TABLE", "{:.3f}: {:5s} ANNOUNCE count {}", self.env.now, self.id(), len(announce))
             for entry_no, entry in enumerate(announce):
-                print("\t\t{:2d}. doc_id({:d})  {}".format(entry_no+1, entry.doc_id, entry))
+                Trace.emit("ANNOUNCE_TABLE", "\t\t{:2d}. doc_id({:d})  {}", entry_no+1, entry.doc_id, str(entry))
+
+
+    # Get the ServicePartition for a service name
+    def service_partition(self, servicename, create=True):
+        """Get the ServicePartition for 'servicename'.
+        If there is none, create one if 'create' is True, or return None"""
+        servicename = str(servicename)
+
+        if servicename in self.services:
+            return self.services[servicename]
+        elif create:
+            partition = ServicePartition(servicename, self.metric_list, self.doc_ids)
+            self.services[servicename] = partition
+            return partition
+        else:
+            return None
+
+    # All the RIB entries, for all services
+    def rib_entries(self):
+        """A list of all the RIB entries, service by service"""
+        entries = []
+
+        for partition in self.services.values():
+            entries += partition.service_RIB.all()
+
+        return entries
+
+    # Get a RIB entry by doc_id, from any service
+    def rib_entry(self, doc_id):
+        """Get the RIB entry with 'doc_id', or None"""
+        for partition in self.services.values():
+            entry = partition.service_RIB.get(doc_id=doc_id)
+
+            if entry != None:
+                return entry
 
+        return None
 
     # Set the unicast forwarding table
     def set_unicast_forwarding_table(self, list_of_routes):
@@ -1421,11 +1510,11 @@ currently {'b': (routerB,1), 'c':  (routerC,4)},
         # this function should be called by the previous hop to send a packet to this router
         # packet_store is a simpy.Store(self.env, capacity=1)
         if packet.src == self._routerid:
-            if Verbose.level >= 1:
-                print("{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) in {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.pkt_no, packet.time, self._routerid, (self.env.now - packet.time)))
+            if Trace.ROUTER_PACKET_CREATED:
+                Trace.emit("ROUTER_PACKET_CREATED", "{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) in {} after {:.3f}", self.env.now, self.id(), packet.src, packet.pkt_no, packet.time, self._routerid, (self.env.now - packet.time))
         else:
-            if Verbose.level >= 1:
-                print("{:.3f}: {:5s} PACKET_ARRIVED {}.{} ({:.3f}) in {} from {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.pkt_no, packet.time, self.id(), link_end.src_node.id(), (self.env.now - packet.time)))
+            if Trace.PACKET_ARRIVED:
+                Trace.emit("PACKET_ARRIVED", "{:.3f}: {:5s} PACKET_ARRIVED {}.{} ({:.3f}) in {} from {} after {:.3f}", self.env.now, self.id(), packet.src, packet.pkt_no, packet.time, self.id(), link_end.src_node.id(), (self.env.now - packet.time))
 
         # add a tuple of (link_end, packet) to the packet store
         self.packet_store.put((link_end, packet))
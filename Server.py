@@ -1,8 +1,26 @@
 from Host import Host
 from SimComponents import Packet
-from Verbose import Verbose
+from Trace import Trace
 from Utility import Utility
 from enum import Enum
+import heapq
+import math
+import simpy
+
+# The trace categories, and the Verbose level they are on at
+Trace.categories({
+    'SERVER_LOAD': 0,
+    'PACKET_CREATED': 0,
+    'PACKET_PROCESSING': 2,
+    'SERVER_PACKET_CONSUMED': 2,
+    'PACKET_DELIVER': 2,
+    'SERVER_PROCESS': 1,
+    'CALCULATE_LOAD_DIFFERENCE': 2,
+    'CALCULATE_PAYLOAD': 1,
+    'NO_MORE_CAPACITY': 0,
+    'INCREASE_LOAD': 1,
+    'DECREASE_LOAD': 1,
+})
 
 # some default values for the load and flows functions
 def load_up_by1(val):
@@ -58,6 +76,10 @@ class Server(Host):
     # flow change factor  10% -> 0.1
     change_factor = 0.1
 
+    # the minimum time between ServerMetric announcements for a service
+    # 0 means they are only held back to the next second boundary
+    min_announce_interval = 0
+
     # load and flow functions
     load_up_fn = staticmethod(load_up_by1)
     load_down_fn = staticmethod(load_down_by1)
@@ -83,6 +105,23 @@ class Server(Host):
         self.load = 0
         self.no_of_flows = 0
 
+        # the accepted requests, as a heap of (finish_time, seq, request)
+        self.completions = []
+        self.completion_seq = 0
+
+        # the process which releases the requests when they finish
+        # it is started with the first request
+        self.completion_process = None
+
+        # the finish time the process is waiting for, or None if it has not started
+        self.completion_wait = None
+
+        # service_name -> the time of a pending ServerMetric announcement
+        self.pending_announce = dict()
+
+        # service_name -> the time of the last ServerMetric announcement
+        self.last_announce = dict()
+
 
 
     # The event handler
@@ -99,8 +138,8 @@ class Server(Host):
     # Process a LoadEvent which generates background load
     def process_load_event(self, event):
         # we got a load event
-        if Verbose.level >= 0:
-            print("{:.3f}: {:5s} SERVER_LOAD {}".format(self.env.now, self.id(), event))
+        if Trace.SERVER_LOAD:
+            Trace.emit("SERVER_LOAD", "{:.3f}: {:5s} SERVER_LOAD {}", self.env.now, self.id(), event)
         
         # it should have: seqno, time, no_of_flows, load
         # more events
@@ -110,6 +149,7 @@ class Server(Host):
 
             # save the values in last_event_info
             self.last_event_info = { 'load': event.load, 'no_of_flows': event.no_of_flows }
+            self.load_changed()
 
             # convert an event into a packet
             self.send_load_change(event.time, event.service_name)
@@ -126,8 +166,8 @@ class Server(Host):
         packet = Packet(event.time, event.size, self.pkt_no, event.src, event.dst, event.flow_id)
         packet.pkt_no = self.pkt_no
 
-        if Verbose.level >= 0:
-            print("{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) EVENT in {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time)))
+        if Trace.PACKET_CREATED:
+            Trace.emit("PACKET_CREATED", "{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) EVENT in {} after {:.3f}", self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time))
 
         self.pkt_no += 1
 
@@ -147,15 +187,15 @@ class Server(Host):
         """
         (link_end, packet) = packet_tuple
         
-        if Verbose.level >= 2:
-            print("{:.3f}: {:5s} PACKET_PROCESSING {}.{} ({:.3f}) in {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time)))
+        if Trace.PACKET_PROCESSING:
+            Trace.emit("PACKET_PROCESSING", "{:.3f}: {:5s} PACKET_PROCESSING {}.{} ({:.3f}) in {} after {:.3f}", self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time))
 
         if packet.dst == self.hostid:
             # consume the packet
             self.sink.put(packet)
 
-            if Verbose.level >= 2:
-                print("{:.3f}: {:5s} PACKET_CONSUMED {}.{} consumed in {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.pkt_no, self.hostid, (self.env.now - packet.time)))
+            if Trace.SERVER_PACKET_CONSUMED:
+                Trace.emit("SERVER_PACKET_CONSUMED", "{:.3f}: {:5s} PACKET_CONSUMED {}.{} consumed in {} after {:.3f}", self.env.now, self.id(), packet.src, packet.pkt_no, self.hostid, (self.env.now - packet.time))
 
         else:
             # MR: if packet is data packet (ClientRequest)
@@ -171,16 +211,16 @@ class Server(Host):
                 # This is where the main servicecast algorithm will be implemented.
                 self.outgoing_port.put(packet)
 
-                if Verbose.level >= 2:
-                    print("{:.3f}: {:5s} PACKET_DELIVER {}.{} for {} deliver to {}".format(self.env.now, self.id(), packet.src, packet.id, packet.dst,  self.neighbour))
+                if Trace.PACKET_DELIVER:
+                    Trace.emit("PACKET_DELIVER", "{:.3f}: {:5s} PACKET_DELIVER {}.{} for {} deliver to {}", self.env.now, self.id(), packet.src, packet.id, packet.dst,  self.neighbour)
            
 
     # Handle a ClientRequest
     def client_request_packet(self, link_end, packet):
         """A Client has sent a request"""
 
-        if Verbose.level >= 1:
-            print("{:.3f}: {:5s} SERVER_PROCESS ClientRequest for service {} pkt: {}.{}".format(self.env.now, self.id(), packet.dst, packet.src, packet.id))
+        if Trace.SERVER_PROCESS:
+            Trace.emit("SERVER_PROCESS", "{:.3f}: {:5s} SERVER_PROCESS ClientRequest for service {} pkt: {}.{}", self.env.now, self.id(), packet.dst, packet.src, packet.id)
 
         # Do some processing and logging to determine some ideal info.
         # Calls into the Network to get a global view
@@ -227,28 +267,49 @@ class Server(Host):
         # check how much of a change in slots there is
         if (diff != 0 and diff < Server.change_factor):
             # change is too small, do nothing
-            if Verbose.level >= 2:
-                print("{:.3f}: {:5s} CALCULATE_LOAD_DIFFERENCE: change = {} -- do nothing".format(self.env.now, self.id(),diff))
+            if Trace.CALCULATE_LOAD_DIFFERENCE:
+                Trace.emit("CALCULATE_LOAD_DIFFERENCE", "{:.3f}: {:5s} CALCULATE_LOAD_DIFFERENCE: change = {} -- do nothing", self.env.now, self.id(),diff)
             return
         else:
             # a big enough change
+            if service_name in self.pending_announce:
+                # there is already an announcement waiting,
+                # and it will send the payload at the time it is sent
+                if Trace.CALCULATE_LOAD_DIFFERENCE:
+                    Trace.emit("CALCULATE_LOAD_DIFFERENCE", "{:.3f}: {:5s} CALCULATE_LOAD_DIFFERENCE: change = {} -- ServerMetric pending at {}", self.env.now, self.id(),diff, self.pending_announce[service_name])
+                return
+
+            # work out the send time
+            # which is the next second boundary,
+            # and at least min_announce_interval after the last one
             if (now == int(now)):
+                at = now
+            else:
+                at = int(now) + 1
+
+            last = self.last_announce.get(service_name, None)
+
+            if last != None and at < last + Server.min_announce_interval:
+                at = last + Server.min_announce_interval
+
+            if (at == now):
                 # are on second boundary
                 # send a ServerMetric packet
-                if Verbose.level >= 2:
-                    print("{:.3f}: {:5s} CALCULATE_LOAD_DIFFERENCE: change = {} -- send ServerMetric".format(self.env.now, self.id(),diff))
+                if Trace.CALCULATE_LOAD_DIFFERENCE:
+                    Trace.emit("CALCULATE_LOAD_DIFFERENCE", "{:.3f}: {:5s} CALCULATE_LOAD_DIFFERENCE: change = {} -- send ServerMetric", self.env.now, self.id(),diff)
 
                 self.send_load_packet(time, service_name)
 
             else:
-                # work out next second boundary
-                timeout = int(now) + 1 - now
+                timeout = at - now
 
-                if Verbose.level >= 2:
-                    print("{:.3f}: {:5s} CALCULATE_LOAD_DIFFERENCE: change = {} -- send ServerMetric in {}".format(self.env.now, self.id(),diff, timeout))
+                if Trace.CALCULATE_LOAD_DIFFERENCE:
+                    Trace.emit("CALCULATE_LOAD_DIFFERENCE", "{:.3f}: {:5s} CALCULATE_LOAD_DIFFERENCE: change = {} -- send ServerMetric in {}", self.env.now, self.id(),diff, timeout)
                 
                 # process callback for a delayed announce
-                self.env.process(self.delay_announce(timeout, time, service_name))
+                # later changes for this service are sent with it
+                self.pending_announce[service_name] = at
+                self.env.process(self.delay_announce(at, time + timeout, service_name))
 
     # Work out load difference
     def calculate_load_difference(self):
@@ -258,12 +319,14 @@ class Server(Host):
         return round(abs((last_flows / self.slots) - (flows / self.slots)), 3)
 
 
-    # Delay an announcement
-    def delay_announce(self, val, time, service_name):
-        yield self.env.timeout(val)
+    # Delay an announcement until time 'at'
+    def delay_announce(self, at, time, service_name):
+        yield self.env.timeout(self.delay_until(at))
+
+        del self.pending_announce[service_name]
 
         # send a ServerMetric packet
-        self.send_load_packet(time+val, service_name)
+        self.send_load_packet(time, service_name)
 
 
     # Send a ServerMetric packet
@@ -281,14 +344,18 @@ class Server(Host):
 
         # save last_payload
         self.last_payload = self.calculate_payload()
+        self.last_announce[service_name] = self.env.now
 
-        if Verbose.level >= 1:
-            print("{:.3f}: {:5s} CALCULATE_PAYLOAD: slots: {} flows: {} load: {}".format(self.env.now, self.id(), self.last_payload['slots'], self.last_payload['no_of_flows'], self.last_payload['load']))
+        if Trace.CALCULATE_PAYLOAD:
+            Trace.emit("CALCULATE_PAYLOAD", "{:.3f}: {:5s} CALCULATE_PAYLOAD: slots: {} flows: {} load: {}", self.env.now, self.id(), self.last_payload['slots'], self.last_payload['no_of_flows'], self.last_payload['load'])
         
         packet.payload = self.last_payload
 
-        if Verbose.level >= 0:
-            print("{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) ServerMetric in {} after {:.3f}".format(self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time)))
+        if self.network != None and self.network.results != None:
+            self.network.results.control_message(self.env.now, self.id(), self.hostid, packet.id, packet.operation, False, time, 0)
+
+        if Trace.PACKET_CREATED:
+            Trace.emit("PACKET_CREATED", "{:.3f}: {:5s} PACKET_CREATED {}.{} ({:.3f}) ServerMetric in {} after {:.3f}", self.env.now, self.id(), packet.src, packet.id, packet.time, self.hostid, (self.env.now - packet.time))
 
         # update packet number for next time
         self.pkt_no += 1
@@ -319,8 +386,11 @@ class Server(Host):
         # now we need to check the capacity to see if we can accept this request
         if (self.calculate_slots() == 0):
             # there is no more capacity to take a job
-            if Verbose.level >= 0:
-                print("{:.3f}: NO_MORE CAPACITY {} timeout {} for {}.{}".format(self.env.now, self.id(), size_to_time(size), request.src, request.id))
+            if self.network != None and self.network.results != None:
+                self.network.results.request_dropped(self.env.now, self.id(), request.src, request.id, size)
+
+            if Trace.NO_MORE_CAPACITY:
+                Trace.emit("NO_MORE_CAPACITY", "{:.3f}: NO_MORE CAPACITY {} timeout {} for {}.{}", self.env.now, self.id(), size_to_time(size), request.src, request.id)
             return
 
         else:
@@ -328,35 +398,94 @@ class Server(Host):
 
             self.load = new_load
             self.no_of_flows = new_flows
+            self.load_changed()
 
-            if Verbose.level >= 1:
-                print("{:.3f}: {:5s} INCREASE_LOAD request {}.{} timeout {} load: {} no_of_flows: {} capacity: {}".format(self.env.now, self.id(), request.src, request.id, size_to_time(size), self.load, self.no_of_flows, self.calculate_slots()))
+            if self.network != None and self.network.results != None:
+                self.network.results.request_served(self.env.now, self.id(), request.src, request.id, size, self.calculate_load(), self.calculate_flows())
+
+            if Trace.INCREASE_LOAD:
+                Trace.emit("INCREASE_LOAD", "{:.3f}: {:5s} INCREASE_LOAD request {}.{} timeout {} load: {} no_of_flows: {} capacity: {}", self.env.now, self.id(), request.src, request.id, size_to_time(size), self.load, self.no_of_flows, self.calculate_slots())
 
 
             # Destination is likely to be a service name: e.g. §a
             self.send_load_change(self.env.now, request.dst)
 
-            # process callback event for future decrease
-            self.env.process(self.decrease_load(request))
+            # add to the completion heap for a future decrease
+            self.add_completion(request)
+
+
+    # add an accepted request to the completion heap
+    def add_completion(self, request):
+        """The request finishes after size_to_time() of its size.
+        If it is the first to finish, the completion timer is woken to wait for it"""
+        finish = self.env.now + size_to_time(request.size)
+
+        heapq.heappush(self.completions, (finish, self.completion_seq, request))
+        self.completion_seq += 1
+
+        if self.completion_process == None:
+            self.completion_process = self.env.process(self.completion_timer())
+        elif self.completion_wait != None and finish < self.completion_wait:
+            # wake the timer, as it is waiting for a later finish
+            self.completion_wait = None
+            self.completion_process.interrupt()
+
+    # the completion timer process
+    def completion_timer(self):
+        """Wait until the first request in the completion heap finishes,
+        then release all the requests which finish at that time"""
+        while True:
+            try:
+                if self.completions:
+                    finish = self.completions[0][0]
+                    self.completion_wait = finish
+                    yield self.env.timeout(self.delay_until(finish))
+                    self.completion_wait = None
+
+                    # release the requests in finish order, then accepted order
+                    while self.completions and self.completions[0][0] <= finish:
+                        finish, seq, request = heapq.heappop(self.completions)
+                        self.decrease_load(request)
+                else:
+                    # wait for a request
+                    self.completion_wait = math.inf
+                    yield self.env.event()
+
+            except simpy.Interrupt:
+                # there is an earlier finish
+                pass
+
+    # the delay from now which ends exactly at 'time'
+    def delay_until(self, time):
+        """As the simulation adds the delay to now, the delay is
+        adjusted so that now + delay is exactly 'time'"""
+        now = self.env.now
+        delay = time - now
+
+        while now + delay < time:
+            delay = math.nextafter(delay, math.inf)
+
+        while now + delay > time:
+            delay = math.nextafter(delay, -math.inf)
 
+        return delay
 
-    # decrease load based once request times out
+    # decrease load once a request finishes
     def decrease_load(self, request):
 
         # MR: STEP 9 update load (add or subtract)
         # MR: STEP 10 If threshold passes send update
 
-        yield self.env.timeout(size_to_time(request.size))
-
         new_load = Server.load_down_fn(self.load)
         new_flows =  Server.flows_down_fn(self.no_of_flows)
     
         self.load = new_load
         self.no_of_flows = new_flows
+        self.load_changed()
         
 
-        if Verbose.level >= 1:
-            print("{:.3f}: {:5s} DECREASE_LOAD request {}.{} after {}  load: {} no_of_flows: {} capacity: {}".format(self.env.now, self.id(), request.src, request.id, size_to_time(request.size),  self.load, self.no_of_flows, self.calculate_slots()))
+        if Trace.DECREASE_LOAD:
+            Trace.emit("DECREASE_LOAD", "{:.3f}: {:5s} DECREASE_LOAD request {}.{} after {}  load: {} no_of_flows: {} capacity: {}", self.env.now, self.id(), request.src, request.id, size_to_time(request.size),  self.load, self.no_of_flows, self.calculate_slots())
 
         # Destination is likely to be a service name: e.g. §a
         service_name = request.dst
@@ -366,6 +495,14 @@ class Server(Host):
 
 
 
+    # The load has changed, so tell the Network
+    def load_changed(self):
+        if self.network != None:
+            self.network.oracle.update_load(self)
+
+            if self.network.results != None:
+                self.network.results.server_load(self.env.now, self.id(), self.calculate_load(), self.calculate_flows())
+
     # Calculate the load
     def calculate_load(self):
         # we take the load from the last_event_info and
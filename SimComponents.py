@@ -10,6 +10,7 @@ import copy
 from simpy.core import BoundClass
 from simpy.resources import base
 from heapq import heappush, heappop
+from collections import deque
 
 
 class Event(object):
@@ -199,9 +200,12 @@ class SwitchPort(object):
             in service).
         limit_bytes : If true, the queue limit will be based on bytes if false the
             queue limit will be based on packets.
+        fast : If true, and there is no qlimit, the port does not run a process.
+            Each packet is sent from a timeout callback after its transmission
+            time, and the waiting packets are held in a deque.
 
     """
-    def __init__(self, env, rate, qlimit=None, limit_bytes=True, debug=False):
+    def __init__(self, env, rate, qlimit=None, limit_bytes=True, debug=False, fast=False):
         self.store = simpy.Store(env)
         self.rate = rate
         self.env = env
@@ -213,7 +217,12 @@ class SwitchPort(object):
         self.byte_size = 0  # Current size of the queue in bytes
         self.debug = debug
         self.busy = 0  # Used to track if a packet is currently being sent
-        self.action = env.process(self.run())  # starts the run() method as a SimPy process
+        self.fast = fast and qlimit is None
+        if self.fast:
+            self.waiting = deque()  # packets waiting to be sent
+            self.action = None
+        else:
+            self.action = env.process(self.run())  # starts the run() method as a SimPy process
 
     def run(self):
         while True:
@@ -227,6 +236,9 @@ class SwitchPort(object):
                 print(msg)
 
     def put(self, pkt):
+        if self.fast:
+            return self.put_fast(pkt)
+
         self.packets_rec += 1
         tmp_byte_count = self.byte_size + pkt.size
 
@@ -242,6 +254,34 @@ class SwitchPort(object):
             self.byte_size = tmp_byte_count
             return self.store.put(pkt)
 
+    # The fast path, with no queue limit
+    def put_fast(self, pkt):
+        self.packets_rec += 1
+        self.byte_size += pkt.size
+        self.waiting.append(pkt)
+
+        if not self.busy:
+            self.send_next()
+
+    # start sending the next waiting packet
+    def send_next(self):
+        pkt = self.waiting.popleft()
+        self.busy = 1
+        self.byte_size -= pkt.size
+        # the timeout carries the packet to sent()
+        timeout = self.env.timeout(pkt.size*8.0/self.rate, pkt)
+        timeout.callbacks.append(self.sent)
+
+    # a packet has been sent
+    def sent(self, event):
+        msg = event.value
+        self.out.put(msg)
+        self.busy = 0
+        if self.debug:
+            print(msg)
+        if self.waiting:
+            self.send_next()
+
 
 class PortMonitor(object):
     """ A monitor for an SwitchPort. Looks at the number of items in the SwitchPort
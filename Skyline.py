@@ -0,0 +1,356 @@
+from functools import cmp_to_key
+
+
+class Skyline(object):
+    """A Pareto skyline engine over a list of metrics.
+       The metrics look like Router.metric_list, a list of dicts with
+       a 'name' and a 'better' fn, where better(x, y) is True when
+       x is better than y.
+       An entry dominates another if it is better or the same in all
+       the metrics, and not the same in all of them.
+    """
+    def __init__(self, metric_list):
+        self.metric_list = metric_list
+        self.names = [ m['name'] for m in metric_list ]
+        self.better_fns = [ m['better'] for m in metric_list ]
+
+    # the metric values of an entry, as a tuple
+    def values(self, entry):
+        """The metric values of 'entry' as a tuple"""
+        return tuple(entry[name] for name in self.names)
+
+    # is entry a the same as entry b in all metrics
+    def same(self, a, b):
+        """Is 'a' the same as 'b' in all the metrics"""
+        for name in self.names:
+            if a[name] != b[name]:
+                return False
+        return True
+
+    # does entry a dominate entry b
+    def dominates(self, a, b):
+        """Is 'a' better or the same as 'b' in all the metrics,
+        and better in at least one"""
+        all_same = True
+
+        for name, better in zip(self.names, self.better_fns):
+            x = a[name]
+            y = b[name]
+
+            if x == y:
+                # the same
+                pass
+            elif better(x, y):
+                # a is better
+                all_same = False
+            else:
+                # a is worse
+                return False
+
+        return not all_same
+
+    # rank the values of one metric
+    # the best value gets rank 0
+    def ranks(self, index, values):
+        """A dict of value -> rank for the metric at 'index'.
+        Values which are the same, or not better than each other,
+        get the same rank"""
+        better = self.better_fns[index]
+
+        def compare(x, y):
+            if x == y:
+                return 0
+            elif better(x, y):
+                return -1
+            elif better(y, x):
+                return 1
+            else:
+                return 0
+
+        ordered = sorted(set(values), key=cmp_to_key(compare))
+
+        rank = dict()
+        current = 0
+
+        for pos, value in enumerate(ordered):
+            if pos > 0 and better(ordered[pos-1], value):
+                current += 1
+
+            rank[value] = current
+
+        return rank
+
+    # compute the skyline of a list of entries
+    def compute(self, entries):
+        """The entries which are not dominated by any other entry.
+        If some entries are the same in all the metrics only one is kept,
+        which is the last one in 'entries'.
+        The result is in the same order as 'entries'."""
+        if len(entries) <= 1:
+            return list(entries)
+
+        # keep the last entry of each group with the same metrics
+        # values -> index into entries
+        unique = dict()
+
+        for index, entry in enumerate(entries):
+            unique[self.values(entry)] = index
+
+        keys = list(unique.keys())
+
+        # convert the metric values to ranks, so
+        # comparisons are on ints, and lower is better
+        no_of_metrics = len(self.names)
+        rank_maps = [ self.ranks(m, [k[m] for k in keys]) for m in range(no_of_metrics) ]
+
+        points = [ (tuple(rank_maps[m][k[m]] for m in range(no_of_metrics)), unique[k]) for k in keys ]
+
+        if no_of_metrics == 2:
+            keep = self.skyline_2d(points)
+        else:
+            keep = self.skyline_sfs(points)
+
+        keep.sort()
+
+        return [ entries[index] for index in keep ]
+
+    # skyline for 2 metrics
+    # sort by the first metric, then scan for the best second metric
+    def skyline_2d(self, points):
+        """Sort based skyline for 2 metrics.
+        Takes a list of (ranks, index) and returns the indexes to keep"""
+        points.sort()
+
+        keep = []
+        best_second = None
+
+        for ranks, index in points:
+            if best_second == None or ranks[1] < best_second:
+                # better in the second metric than everything
+                # which is better or the same in the first metric
+                keep.append(index)
+                best_second = ranks[1]
+
+        return keep
+
+    # sort-filter-skyline for N metrics
+    def skyline_sfs(self, points):
+        """Sort-filter-skyline for N metrics.
+        Takes a list of (ranks, index) and returns the indexes to keep"""
+        # sort by the sum of the ranks, which is monotone in dominance
+        # so a point can only be dominated by points before it
+        points.sort(key=lambda p: (sum(p[0]), p[0]))
+
+        window = []
+        keep = []
+
+        for ranks, index in points:
+            dominated = False
+
+            for other in window:
+                if other != ranks and all(o <= r for o, r in zip(other, ranks)):
+                    dominated = True
+                    break
+
+            if not dominated:
+                window.append(ranks)
+                keep.append(index)
+
+        return keep
+
+
+class IncrementalSkyline(Skyline):
+    """A Pareto skyline which is kept up to date as entries are
+       inserted, updated and removed.
+       The entries must have a doc_id, like a RIBEntry.
+       If some entries are the same in all the metrics, the one
+       with the highest doc_id is in the skyline, as in compute().
+
+       Each entry not in the skyline has a witness, which is a
+       skyline entry that beats it.  Each skyline entry has a shadow,
+       which are the entries it is the witness for.  When a skyline
+       entry leaves, only its shadow needs to be checked.
+
+       The entries which join or leave the skyline are collected
+       until take_delta() is called.
+    """
+    def __init__(self, metric_list):
+        super().__init__(metric_list)
+
+        # doc_id -> entry, for the entries in the skyline
+        self.members = dict()
+
+        # skyline doc_id -> { doc_id: entry } it is the witness for
+        self.shadow = dict()
+
+        # doc_id -> skyline doc_id, for the entries not in the skyline
+        self.witness = dict()
+
+        # entries which joined or left since the last take_delta()
+        self.joined = dict()
+        self.left = dict()
+
+    # The size of the skyline
+    def __len__(self):
+        return len(self.members)
+
+    # is an entry in the skyline
+    def contains(self, entry):
+        """Is 'entry' in the skyline"""
+        return entry.doc_id in self.members
+
+    # all the entries in the skyline
+    def all(self):
+        """A list of the skyline entries, in doc_id order"""
+        return [ self.members[doc_id] for doc_id in sorted(self.members) ]
+
+    # does entry a beat entry b
+    def beats(self, a, b):
+        """'a' beats 'b' if it dominates 'b', or it is the same
+        as 'b' in all the metrics and has a higher doc_id"""
+        if self.dominates(a, b):
+            return True
+        else:
+            return a.doc_id > b.doc_id and self.same(a, b)
+
+    # insert a new entry
+    def insert(self, entry):
+        """Add a new entry.
+        Returns True if it joined the skyline."""
+        return self.place(entry)
+
+    # an entry has had its metrics changed
+    def update(self, entry):
+        """An existing entry has new metrics.
+        Returns True if it is in the skyline afterwards."""
+        doc_id = entry.doc_id
+
+        if doc_id in self.members:
+            # take it out, then put it back, then
+            # check the entries it was the witness for
+            candidates = self.leave(entry)
+            placed = self.place(entry)
+
+            for candidate in candidates:
+                self.place(candidate, entry)
+
+            return placed
+
+        else:
+            # detach from its witness and try again
+            self.detach(entry)
+            return self.place(entry)
+
+    # remove an entry
+    def remove(self, entry):
+        """Remove an entry.
+        Any entries it was the witness for are checked again."""
+        if entry.doc_id in self.members:
+            candidates = self.leave(entry)
+
+            for candidate in candidates:
+                self.place(candidate)
+
+        else:
+            self.detach(entry)
+
+    # get the entries which have joined and left since last time
+    def take_delta(self):
+        """Returns a tuple of (joined, left) entries, in doc_id order,
+        since the last call."""
+        joined = [ self.joined[doc_id] for doc_id in sorted(self.joined) ]
+        left = [ self.left[doc_id] for doc_id in sorted(self.left) ]
+
+        self.joined = dict()
+        self.left = dict()
+
+        return (joined, left)
+
+    # remove everything
+    def truncate(self):
+        """Remove all the entries"""
+        self.members.clear()
+        self.shadow.clear()
+        self.witness.clear()
+        self.joined.clear()
+        self.left.clear()
+
+    # put an entry in the skyline, or under a witness
+    # hint is an entry to try first as the witness
+    def place(self, entry, hint=None):
+        doc_id = entry.doc_id
+
+        if hint != None and hint.doc_id in self.members and self.beats(hint, entry):
+            self.attach(entry, hint)
+            return False
+
+        # entries which this entry beats
+        beaten = []
+
+        for member in self.members.values():
+            if self.beats(member, entry):
+                # it is beaten, so nothing in the skyline can be beaten by it
+                self.attach(entry, member)
+                return False
+
+            elif self.beats(entry, member):
+                beaten.append(member)
+
+        # not beaten, so it joins the skyline
+        self.members[doc_id] = entry
+        self.shadow[doc_id] = dict()
+        self.record_join(entry)
+
+        # now move out the ones it beats, with their shadows
+        for member in beaten:
+            moved = self.leave(member)
+
+            self.attach(member, entry)
+
+            for candidate in moved:
+                self.attach(candidate, entry)
+
+        return True
+
+    # take a skyline entry out of the skyline
+    # returns the entries it was witness for
+    def leave(self, entry):
+        doc_id = entry.doc_id
+
+        del self.members[doc_id]
+        self.record_leave(entry)
+
+        candidates = list(self.shadow.pop(doc_id).values())
+
+        for candidate in candidates:
+            del self.witness[candidate.doc_id]
+
+        return candidates
+
+    # set the witness for an entry
+    def attach(self, entry, witness):
+        self.witness[entry.doc_id] = witness.doc_id
+        self.shadow[witness.doc_id][entry.doc_id] = entry
+
+    # remove an entry from its witness
+    def detach(self, entry):
+        witness_id = self.witness.pop(entry.doc_id, None)
+
+        if witness_id != None:
+            del self.shadow[witness_id][entry.doc_id]
+
+    # an entry has joined the skyline
+    def record_join(self, entry):
+        if entry.doc_id in self.left:
+            # it left and came back, so no change
+            del self.left[entry.doc_id]
+        else:
+            self.joined[entry.doc_id] = entry
+
+    # an entry has left the skyline
+    def record_leave(self, entry):
+        if entry.doc_id in self.joined:
+            # it joined and went, so no change
+            del self.joined[entry.doc_id]
+        else:
+            self.left[entry.doc_id] = entry
@@ -0,0 +1,174 @@
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+
+
+class Sweep(object):
+    """Run an experiment for every point in a parameter grid.
+
+       The grid is a dict of name -> list of values.  A name like
+       'Utility.alpha' or 'Server.slots' is a class variable, which is
+       set before the experiment is called.  Any other name, such as
+       'seed' or 'topology', is just passed to the experiment in the config.
+
+       Each point runs in its own worker process, which is started fresh
+       for the point, so the class variables in Utility, Server, Router
+       and Verbose start from their defaults every time.
+
+       The experiment is a function experiment(config), defined at the
+       top level of a module, which builds and runs a Network and
+       returns a dict of results.  The results for each point are
+       written to their own file in output_dir, keyed by the config,
+       and the points which already have a results file are skipped,
+       so a sweep which was stopped can be run again to finish it.
+    """
+    def __init__(self, experiment, grid, output_dir, processes=None):
+        self.experiment = experiment
+        self.grid = grid
+        self.output_dir = output_dir
+
+        # default to one worker per core
+        self.processes = processes if processes != None else os.cpu_count()
+
+    # The no of points in the grid
+    def __len__(self):
+        count = 1
+        for values in self.grid.values():
+            count *= len(values)
+        return count
+
+    # all the configs in the grid
+    def configs(self):
+        """A list of config dicts, one for each point in the grid"""
+        names = list(self.grid.keys())
+
+        return [ dict(zip(names, values)) for values in itertools.product(*[self.grid[name] for name in names]) ]
+
+    # the configs which do not have results yet
+    def pending(self):
+        """The configs which do not have a results file in output_dir"""
+        return [ config for config in self.configs() if not os.path.exists(self.results_file(config)) ]
+
+    # the results file for a config
+    def results_file(self, config):
+        return os.path.join(self.output_dir, Sweep.config_key(config) + ".json")
+
+    # run all the pending points
+    def run(self):
+        """Run the experiment for each pending point in the grid,
+        using a pool of worker processes.
+        Returns the no of points which were run."""
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        pending = self.pending()
+
+        print("Sweep: {} points, {} done, {} to run, {} processes".format(len(self), len(self) - len(pending), len(pending), self.processes))
+
+        if len(pending) == 0:
+            return 0
+
+        # spawn a new interpreter for each point, so the
+        # class variables are not shared between points
+        context = multiprocessing.get_context("spawn")
+
+        jobs = [ (self.experiment, config, self.output_dir) for config in pending ]
+
+        with context.Pool(self.processes, maxtasksperchild=1) as pool:
+            for key in pool.imap_unordered(run_point, jobs):
+                print("Sweep: done " + key)
+
+        return len(pending)
+
+    # get all the results which have been written
+    def results(self):
+        """A dict of config key -> { 'config': ..., 'results': ... }
+        for the points which have finished"""
+        all_results = dict()
+
+        for config in self.configs():
+            filename = self.results_file(config)
+
+            if os.path.exists(filename):
+                with open(filename) as f:
+                    all_results[Sweep.config_key(config)] = json.load(f)
+
+        return all_results
+
+    # the key for a config
+    @classmethod
+    def config_key(cls, config):
+        """A string for 'config' which can be used as a filename,
+        e.g. Server.slots=10,Utility.alpha=0.5,seed=1"""
+        parts = [ "{}={}".format(name, Sweep.value_name(config[name])) for name in sorted(config) ]
+
+        return ",".join(parts).replace(os.sep, "_")
+
+    # the name of a value in a key
+    @classmethod
+    def value_name(cls, value):
+        if callable(value):
+            return getattr(value, '__name__', str(value))
+        else:
+            return str(value)
+
+    # set the class variables from a config
+    @classmethod
+    def apply_config(cls, config):
+        """Set the class variables named in 'config', e.g. 'Utility.alpha'"""
+        from Utility import Utility
+        from Server import Server
+        from Router import Router
+        from Verbose import Verbose
+
+        classes = { 'Utility': Utility, 'Server': Server, 'Router': Router, 'Verbose': Verbose }
+
+        for name, value in config.items():
+            if '.' not in name:
+                continue
+
+            class_name, variable = name.split('.', 1)
+
+            if class_name not in classes:
+                raise ValueError("Sweep: unknown class in config " + name)
+
+            if callable(value) and not isinstance(value, type):
+                # functions are held as staticmethods, like forwarding_utility_fn
+                value = staticmethod(value)
+
+            setattr(classes[class_name], variable, value)
+
+
+# run one point of a sweep, in a worker process
+def run_point(job):
+    """Run 'experiment' for 'config' and write the results file.
+    The output of the experiment goes to a .out file next to it.
+    Returns the config key."""
+    experiment, config, output_dir = job
+
+    key = Sweep.config_key(config)
+    filename = os.path.join(output_dir, key + ".json")
+
+    Sweep.apply_config(config)
+
+    stdout = sys.stdout
+
+    with open(os.path.join(output_dir, key + ".out"), "w") as out:
+        sys.stdout = out
+        try:
+            results = experiment(config)
+        finally:
+            sys.stdout = stdout
+
+    record = { 'config': { name: Sweep.value_name(value) if callable(value) else value for name, value in config.items() },
+               'results': results }
+
+    # write to a temp file then rename, so a results file
+    # only exists when it is complete
+    with open(filename + ".tmp", "w") as f:
+        json.dump(record, f, indent=1, default=str)
+
+    os.replace(filename + ".tmp", filename)
+
+    return key
@@ -0,0 +1,196 @@
+from collections import deque
+from Verbose import Verbose
+
+
+class PrintSink(object):
+    """A trace sink which prints each message straight away.
+       This gives the same output as the old print() calls."""
+    def write(self, event, message, args):
+        if args:
+            print(message.format(*args))
+        else:
+            print(message)
+
+    def flush(self):
+        pass
+
+
+class NullSink(object):
+    """A trace sink which throws the messages away"""
+    def write(self, event, message, args):
+        pass
+
+    def flush(self):
+        pass
+
+
+class BufferedFileSink(object):
+    """A trace sink which writes the messages to a file.
+       The messages are kept until there are 'buffer_size' of them,
+       and only formatted when they are written out."""
+    def __init__(self, filename, buffer_size=10000):
+        self.file = open(filename, "w")
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def write(self, event, message, args):
+        self.buffer.append((message, args))
+
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.writelines([ (message.format(*args) if args else message) + "\n" for message, args in self.buffer ])
+        self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class RingBufferSink(object):
+    """A trace sink which keeps the last 'size' messages in memory.
+       The messages are only formatted when lines() is called, so
+       the args are held as they were passed in."""
+    def __init__(self, size=1000):
+        self.ring = deque(maxlen=size)
+
+    def write(self, event, message, args):
+        self.ring.append((event, message, args))
+
+    def flush(self):
+        pass
+
+    # the messages as text
+    def lines(self, event=None):
+        """A list of the messages in the ring, oldest first.
+        If 'event' is given, only the messages for that event type"""
+        return [ (message.format(*args) if args else message) for name, message, args in self.ring if event == None or name == event ]
+
+
+class Trace(object):
+    """The trace bus.
+
+       Each type of trace message, like FORWARD_METRIC, is a category,
+       registered with the Verbose level it is switched on at.
+       The category is a class variable on Trace which is True or False,
+       so a trace site looks like:
+
+           if Trace.FORWARD_METRIC:
+               Trace.emit("FORWARD_METRIC", "{:.3f}: {:5s} FORWARD_METRIC {} to {}", now, id, doc_id, neighbour)
+
+       and a category which is off costs one attribute check.
+       The flags follow Verbose.level and Verbose.table when they are set, unless a category
+       has been switched on or off by enable() or disable().
+
+       The message and args are passed to the sink, which decides
+       if and when to format them.
+    """
+    # category -> the Verbose level it is on at
+    levels = dict()
+
+    # the categories which are only on at their level, not above it
+    exact = set()
+
+    # the categories which print tables, and are off if Verbose.table is 0
+    tables = set()
+
+    # category -> True or False, set by enable() and disable()
+    overrides = dict()
+
+    # where the messages go
+    sink = PrintSink()
+
+    # register a category
+    @classmethod
+    def category(cls, name, level, exact=False, table=False):
+        """Add a category 'name' which is on when Verbose.level >= 'level',
+        or when Verbose.level == 'level' if 'exact' is True.
+        If 'table' is True, it is also off when Verbose.table is 0"""
+        cls.levels[name] = level
+
+        if exact:
+            cls.exact.add(name)
+        else:
+            cls.exact.discard(name)
+
+        if table:
+            cls.tables.add(name)
+        else:
+            cls.tables.discard(name)
+
+        setattr(cls, name, cls.is_on(name))
+        return name
+
+    # register lots of categories
+    @classmethod
+    def categories(cls, level_map):
+        """Add all the categories in a dict of name -> level"""
+        for name, level in level_map.items():
+            cls.category(name, level)
+
+    # should a category be on
+    @classmethod
+    def is_on(cls, name):
+        if name in cls.overrides:
+            return cls.overrides[name]
+        elif name in cls.tables and Verbose.table == 0:
+            return False
+        elif name in cls.exact:
+            return Verbose.level == cls.levels[name]
+        else:
+            return Verbose.level >= cls.levels[name]
+
+    # set all the flags again
+    @classmethod
+    def refresh(cls):
+        """Set the flag for each category from Verbose.level and the overrides"""
+        for name in cls.levels:
+            setattr(cls, name, cls.is_on(name))
+
+    # switch categories on
+    @classmethod
+    def enable(cls, *names):
+        for name in names:
+            cls.overrides[name] = True
+        cls.refresh()
+
+    # switch categories off
+    @classmethod
+    def disable(cls, *names):
+        for name in names:
+            cls.overrides[name] = False
+        cls.refresh()
+
+    # go back to following Verbose.level
+    @classmethod
+    def reset(cls, *names):
+        """Remove the overrides for 'names', or all of them if none are given"""
+        if len(names) == 0:
+            cls.overrides.clear()
+        else:
+            for name in names:
+                cls.overrides.pop(name, None)
+        cls.refresh()
+
+    # set the sink
+    @classmethod
+    def set_sink(cls, sink):
+        """Send the messages to 'sink', and return the old one"""
+        old = cls.sink
+        old.flush()
+        cls.sink = sink
+        return old
+
+    # send a message
+    @classmethod
+    def emit(cls, event, message, *args):
+        """Send a message for category 'event' to the sink.
+        If there are 'args', 'message' is a format string for them."""
+        cls.sink.write(event, message, args)
+
+
+# keep the flags in step with Verbose.level
+Verbose.listeners.append(Trace.refresh)
+
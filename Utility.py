@@ -1,6 +1,18 @@
 
 
+import numpy as np
+
+# mark a utility function as vectorised
+def vectorised(fn):
+    """Mark 'fn' as a utility function which gives the same values
+    when called with NumPy arrays of load and delay as it does
+    when called with single values, e.g. one using only arithmetic
+    or np.where().  Returns 'fn'."""
+    fn.vectorised = True
+    return fn
+
 # the first forwarding utility function
+@vectorised
 def forwarding_utility1(alpha, load, delay):
     """ the utility function U=1/(1 + alpha*load + (1-alpha)*delay) """
     # we define the utility function U=1/(1 + alpha*load + (1-alpha)*delay)
@@ -21,3 +33,39 @@ class Utility:
     # alpha
     alpha = 0.5
 
+
+    # Is the forwarding_utility_fn vectorised
+    @classmethod
+    def is_vectorised(cls):
+        return getattr(cls.forwarding_utility_fn, 'vectorised', False)
+
+    # The forwarding utility for one load and delay
+    @classmethod
+    def forwarding_utility(cls, alpha, load, delay):
+        """The forwarding utility for a single 'load' and 'delay'"""
+        value = cls.forwarding_utility_fn(alpha, load, delay)
+
+        if isinstance(value, (np.ndarray, np.generic)):
+            # a vectorised fn can give back a NumPy value
+            return value.item()
+        else:
+            return value
+
+    # The forwarding utility for lots of loads and delays
+    @classmethod
+    def forwarding_utility_values(cls, alpha, loads, delays):
+        """A NumPy array of the forwarding utility for each
+        pair in 'loads' and 'delays'.
+        A vectorised forwarding_utility_fn is called once on the whole arrays,
+        otherwise it is called for each pair, so the values are the same
+        as from forwarding_utility()"""
+        if cls.is_vectorised():
+            values = cls.forwarding_utility_fn(alpha, np.asarray(loads), np.asarray(delays))
+            return np.asarray(values, dtype=float).reshape(len(loads))
+        else:
+            if isinstance(loads, np.ndarray):
+                loads = loads.tolist()
+            if isinstance(delays, np.ndarray):
+                delays = delays.tolist()
+
+            return np.array([ cls.forwarding_utility_fn(alpha, load, delay) for load, delay in zip(loads, delays) ], dtype=float)
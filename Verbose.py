@@ -1,7 +1,20 @@
-class Verbose:
+class VerboseType(type):
+    # tell the listeners when a value is set,
+    # so the Trace flags follow Verbose.level
+    def __setattr__(cls, name, value):
+        super().__setattr__(name, value)
+
+        for listener in cls.listeners:
+            listener()
+
+
+class Verbose(metaclass=VerboseType):
     # Class variable
     level = 1
 
     # If table == 0, print tables simply on one line
     # If table == 1, try and print tables one row per line
     table = 0
+
+    # fns to call when a value is set
+    listeners = []
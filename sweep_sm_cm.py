@@ -0,0 +1,97 @@
+from Graph import Graph
+from Network import Network
+from Server import Server
+from Generator import Generator
+from Utility import Utility
+from Sweep import Sweep
+import simpy
+
+# A sweep over the topology in main_sm_cm.py
+# with 5 servers and 5 clients,
+# for different alpha, slots, and seeds.
+#
+# Each point is run in its own process, and the results are
+# written to sweep_sm_cm/ -- run it again to finish a sweep
+# which was stopped part way through.
+
+
+topologies = {
+    'sm_cm': {
+        'a': { 'b', ('c', 4)},
+        'b': { ('c', 3), ('d', 2), ('e', 2)},
+        'c': { },
+        'd': { 'b', ('c', 5)},
+        'e': { ('d', 5)}
+    }
+}
+
+
+# Run one point of the sweep
+def experiment(config):
+    # the class variables, e.g. Utility.alpha and Server.slots,
+    # have already been set from the config
+
+    # load:  0 -> 1
+    utility_load = lambda load: (1-(0.12*load)) if load < 0.8  else (4.5-(4.5*load))
+    # delay: 0 -> 10
+    utility_delay = lambda delay: (1-(0.1*delay)) if delay <= 10 else 0
+
+    # actual utility fn (lower = worse, higher = better)
+    Utility.forwarding_utility_fn = staticmethod(lambda alpha, load, delay: round(utility_load(load / (2 * Server.slots)) * utility_delay(delay), 4))
+
+    seed = config['seed']
+
+    env = simpy.Environment()
+
+    network = Network.from_graph(Graph.from_dict(topologies[config['topology']]), env)
+
+    network.add_edge('c', 'f')
+
+    network.add_server("s1", 'a')
+    network.add_server("s2", 'a')
+    network.add_server("s3", 'b')
+    network.add_server("s4", 'b')
+    network.add_server("s5", 'f')
+
+    network.add_client("c1", 'e')
+    network.add_client("c2", 'e')
+    network.add_client("c3", 'e')
+    network.add_client("c4", 'd')
+    network.add_client("c5", 'd')
+
+    network.calculate_forwarding_tables()
+
+    for server in ["s1", "s2", "s3", "s4", "s5"]:
+        Generator.server_load_event_generator(network, server, ["§a"], exponential_lambda=55, seed=seed)
+
+    Generator.multi_client_event_generator(network, ["c1", "c2", "c3", "c4", "c5"], "§a", arrival_lambda=2, size_lambda=6, seed=seed)
+
+    network.start(until=config['until'])
+
+    # the results for this point
+    return {
+        'now': env.now,
+        'replica_count': network.replica_count(),
+        'total_load_utility': network.total_load_utility(),
+        'average_load_utility': network.average_load_utility(),
+        'server_load': { server.id(): server.calculate_load() for server in network.server_nodes() }
+    }
+
+
+grid = {
+    'Utility.alpha': [0.25, 0.5, 0.75],
+    'Server.slots': [10, 20],
+    'Verbose.level': [0],
+    'seed': [30072022, 1, 2],
+    'topology': ['sm_cm'],
+    'until': [3600]
+}
+
+
+# go !
+if __name__ == '__main__':
+    sweep = Sweep(experiment, grid, "sweep_sm_cm")
+    sweep.run()
+
+    for key, record in sweep.results().items():
+        print(key + " " + str(record['results']))